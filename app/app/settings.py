@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -49,17 +50,36 @@ MY_APPS = [
 INSTALLED_APPS.extend(MY_APPS)
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware'
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.PathMiddlewareDispatcher',
+]
+
+# Middleware run by core.middleware.PathMiddlewareDispatcher, by path
+# prefix (first match wins): the token authenticated API does without
+# sessions, CSRF, messages and clickjacking protection
+
+MIDDLEWARE_PROFILES = [
+    ('/api/', [
+        'django.middleware.common.CommonMiddleware',
+    ]),
+    ('/', [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    ]),
 ]
 
 ROOT_URLCONF = 'app.urls'
 
+# see core.testing.TestRunner
+TEST_RUNNER = 'core.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -89,10 +109,61 @@ DATABASES = {
         "HOST": os.environ.get('DB_HOST'),
         "NAME": os.environ.get('DB_NAME'),
         "USER": os.environ.get('DB_USER'),
-        "PASSWORD": os.environ.get('DB_PASS')
+        "PASSWORD": os.environ.get('DB_PASS'),
+        # seconds a connection is kept open between requests, 0 closes it
+        # after every request (use 0 with DB_POOL, the pool keeps them)
+        "CONN_MAX_AGE": int(os.environ.get('DB_CONN_MAX_AGE', 0)),
     }
 }
 
+# DB_POOL=1 takes connections from a process-local pool
+# (core/db/backends/postgresql_pool) instead of opening one per request
+if os.environ.get('DB_POOL', 'false').lower() in ('1', 'true', 'yes'):
+    DATABASES['default'].update({
+        "ENGINE": 'core.db.backends.postgresql_pool',
+        "POOL": {
+            # max open connections per worker process
+            "MAX_SIZE": int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # seconds before an idle connection is closed
+            "MAX_IDLE": int(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            # seconds before a connection is retired
+            "MAX_LIFETIME": int(
+                os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            # seconds to wait for a free connection
+            "TIMEOUT": int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # idle seconds after which checkout runs a SELECT 1 first
+            "CHECK_AFTER": int(os.environ.get('DB_POOL_CHECK_AFTER', 5)),
+        },
+    })
+
+# Read replicas: comma separated hosts, e.g. DB_REPLICA_HOSTS=db-r1,db-r2
+# each one becomes a 'replica_<n>' alias using the default credentials
+# read only requests are routed to them by core.db_routers.ReplicaRouter
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')),
+        start=1):
+    alias = 'replica_%d' % index
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host.strip(),
+        # tests read the replicas' data from the default test database
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_routers.ReplicaRouter']
+
+# seconds between health checks of a replica
+DATABASE_REPLICA_CHECK_INTERVAL = int(
+    os.environ.get('DB_REPLICA_CHECK_INTERVAL', 10))
+# seconds a client reads from the primary after a write
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+# cache remembering pinned API clients, should be shared by all workers
+DATABASE_REPLICA_PIN_CACHE = os.environ.get('DB_REPLICA_PIN_CACHE', 'default')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -133,4 +204,203 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 # override default user model to equal user custom model
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.User'
+
+# Token authentication cache used by user.authentication
+# TTL bounds how long a revoked token can keep working in another process
+# SHARED_CACHE is the alias of a django cache shared by all workers
+# (see CACHES), leave it empty to only use the process-local cache
+
+TOKEN_AUTH_CACHE = {
+    'TTL': int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 30)),
+    'MAX_SIZE': int(os.environ.get('TOKEN_AUTH_CACHE_MAX_SIZE', 10000)),
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE'),
+    'SHARED_TTL': int(os.environ.get('TOKEN_AUTH_SHARED_CACHE_TTL', 300)),
+}
+
+
+# Expiry of the opaque auth tokens, in seconds (0: never expire)
+# a token in use has its expiry moved forward, written at most every
+# REFRESH_INTERVAL seconds; manage.py purge_tokens deletes expired ones
+
+TOKEN_EXPIRY = {
+    'TTL': int(os.environ.get('TOKEN_TTL', 14 * 24 * 3600)),
+    'REFRESH_INTERVAL': int(
+        os.environ.get('TOKEN_REFRESH_INTERVAL', 3600)),
+}
+
+
+# Stateless signed tokens (see user.tokens), valid for TTL seconds
+# clients ask for them with token_type=signed when logging in
+
+SIGNED_TOKEN = {
+    'TTL': int(os.environ.get('SIGNED_TOKEN_TTL', 3600)),
+}
+
+
+# Password hashing pool used by core.hashing
+# WORKERS is the number of hashing processes, 0 hashes on the request thread
+# MAX_QUEUE is the max number of concurrent hash jobs per worker process,
+# jobs beyond it are answered with 503 right away
+
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', 0)),
+    'MAX_QUEUE': int(os.environ.get('PASSWORD_HASHING_MAX_QUEUE', 32)),
+    'TIMEOUT': float(os.environ.get('PASSWORD_HASHING_TIMEOUT', 10)),
+}
+
+AUTHENTICATION_BACKENDS = [
+    'core.backends.CachedPermissionBackend',
+]
+
+# Resolved permission sets of users (see core.permissions). CACHE should
+# be shared by all workers (memcached, redis) in production: with the
+# default per-process cache, a revoked permission stays granted in the
+# other workers for up to TTL seconds, hence the short default; raise it
+# together with a shared CACHE
+
+PERMISSION_CACHE = {
+    'CACHE': os.environ.get('PERMISSION_CACHE', 'default'),
+    'TTL': int(os.environ.get('PERMISSION_CACHE_TTL', 30)),
+}
+
+# Throttling of failed logins on /api/user/token/ (see user.throttling)
+# a client IP or an email with more than IP_LIMIT / EMAIL_LIMIT failed
+# attempts over the last WINDOW seconds gets 429 without any password
+# check (0 disables a limit); SHARED_CACHE is the alias of a cache shared
+# by all workers (see CACHES), empty to count per process. NUM_PROXIES is
+# the number of trusted reverse proxies appending to X-Forwarded-For in
+# front of the app, 0 to identify clients by REMOTE_ADDR only
+
+LOGIN_THROTTLE = {
+    'WINDOW': int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300)),
+    'IP_LIMIT': int(os.environ.get('LOGIN_THROTTLE_IP_LIMIT', 50)),
+    'EMAIL_LIMIT': int(os.environ.get('LOGIN_THROTTLE_EMAIL_LIMIT', 5)),
+    'SHARED_CACHE': os.environ.get('LOGIN_THROTTLE_SHARED_CACHE'),
+    'MAX_SIZE': int(os.environ.get('LOGIN_THROTTLE_MAX_SIZE', 100000)),
+    'NUM_PROXIES': int(os.environ.get('LOGIN_THROTTLE_NUM_PROXIES', 0)),
+}
+
+REST_FRAMEWORK = {
+    'EXCEPTION_HANDLER': 'user.exceptions.exception_handler',
+}
+
+# JSON only API for production: no browsable API (content negotiation
+# against html, templates) and a faster encoder, see user.renderers
+
+API_JSON_ONLY = os.environ.get(
+    'API_JSON_ONLY', str(not DEBUG)).lower() in ('1', 'true', 'yes')
+
+# also used by the benchmarks, which always run with them
+API_JSON_ONLY_REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ('user.renderers.FastJSONRenderer',),
+    'DEFAULT_PARSER_CLASSES': ('rest_framework.parsers.JSONParser',),
+}
+
+if API_JSON_ONLY:
+    REST_FRAMEWORK.update(API_JSON_ONLY_REST_FRAMEWORK)
+
+
+# Signup relies on the unique index of email instead of a SELECT before
+# the INSERT; with ENABLED, each worker also keeps a bloom filter of the
+# emails (see core.bloom), so a duplicate signup is told by one indexed
+# SELECT before hashing the password instead of after it. The filter
+# takes about CAPACITY * 1.2 bytes at ERROR_RATE 0.01; it is loaded in
+# the background on first use, which logs a warning when there are more
+# users than CAPACITY
+
+USER_EMAIL_FILTER = {
+    'ENABLED': os.environ.get(
+        'USER_EMAIL_FILTER', 'false').lower() in ('1', 'true', 'yes'),
+    'CAPACITY': int(os.environ.get('USER_EMAIL_FILTER_CAPACITY', 1000000)),
+    'ERROR_RATE': float(
+        os.environ.get('USER_EMAIL_FILTER_ERROR_RATE', 0.01)),
+}
+
+
+# Bulk user creation (/api/user/bulk-create/)
+# BATCH_SIZE is the number of rows written per INSERT statement
+
+USER_BULK_CREATE = {
+    'BATCH_SIZE': int(os.environ.get('USER_BULK_CREATE_BATCH_SIZE', 1000)),
+    'MAX_ROWS': int(os.environ.get('USER_BULK_CREATE_MAX_ROWS', 10000)),
+}
+
+
+# Tables with more rows than this show estimated counts in the admin
+# (see core.paginators.EstimatedCountPaginator)
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+)
+
+
+# Write-behind buffering of last_login (see core.writebehind)
+# when enabled, logins (session logins and API token logins) update
+# last_login in memory and every worker writes them in one batched
+# UPDATE every FLUSH_INTERVAL seconds
+
+LAST_LOGIN_WRITE_BEHIND = {
+    'ENABLED': os.environ.get(
+        'LAST_LOGIN_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes'),
+    'FLUSH_INTERVAL': float(
+        os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', 5)),
+    'MAX_BUFFER': int(os.environ.get('LAST_LOGIN_MAX_BUFFER', 10000)),
+}
+
+
+# Seconds the /readyz probe results are cached (see core.views)
+
+HEALTH_CHECK_CACHE_TTL = int(os.environ.get('HEALTH_CHECK_CACHE_TTL', 5))
+
+
+# Per-request performance instrumentation (see core.middleware)
+# SERVER_TIMING adds a Server-Timing header with db/hash/validate/render
+# durations, every request is logged as json on 'core.performance', and
+# a PROFILE_SAMPLE_RATE share of requests is run under cProfile, the
+# profiles of those slower than PROFILE_THRESHOLD_MS being saved in
+# PROFILE_DIR
+
+PERFORMANCE = {
+    'SERVER_TIMING': os.environ.get(
+        'SERVER_TIMING', 'true').lower() in ('1', 'true', 'yes'),
+    'PROFILE_SAMPLE_RATE': float(
+        os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    'PROFILE_THRESHOLD_MS': float(
+        os.environ.get('PROFILE_THRESHOLD_MS', 500)),
+    'PROFILE_DIR': os.environ.get('PROFILE_DIR', '/tmp/profiles'),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERFORMANCE_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Request metrics served at /metrics (see core.metrics)
+# every worker process writes its metrics to a memory-mapped file in
+# DIR, which has to be shared by the workers and emptied on restart;
+# /metrics answers clients from ALLOWED_IPS (comma separated), sending
+# "Authorization: Bearer <TOKEN>" or logged in as staff, 403 otherwise
+
+METRICS = {
+    'ENABLED': os.environ.get(
+        'METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+    'DIR': os.environ.get(
+        'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'app-metrics')),
+    'ALLOWED_IPS': list(filter(None, os.environ.get(
+        'METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','))),
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+}
@@ -0,0 +1,5 @@
+"""
+    Benchmarks of the user API
+    Run them with: python manage.py benchmark
+    (see core/management/commands/benchmark.py)
+"""
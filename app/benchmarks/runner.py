@@ -0,0 +1,203 @@
+import math
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test.utils import override_settings
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.transports import TRANSPORTS
+
+
+class BenchmarkError(Exception):
+    """a scenario did not get the responses it expects"""
+
+
+def percentile(values, percent):
+    """nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_scenario(scenario, transport, iterations, warmup=0):
+    """run a scenario and return its throughput and latency figures"""
+    scenario.setup(transport)
+    for _ in range(warmup):
+        scenario.request(transport)
+
+    latencies = []
+    queries = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        status, count = scenario.request(transport)
+        latencies.append(time.perf_counter() - request_started)
+        if status != scenario.expected_status:
+            raise BenchmarkError('%s got status %d instead of %d' % (
+                scenario.name, status, scenario.expected_status
+            ))
+        queries.append(count)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': iterations,
+        'throughput': round(iterations / elapsed, 2),
+        'mean_ms': round(sum(latencies) / iterations * 1000, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_request': (
+            None if None in queries else sum(queries) / iterations
+        ),
+    }
+
+
+def _view_classes(cls=APIView):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _view_classes(subclass)
+
+
+@contextmanager
+def production_settings():
+    """
+        DEBUG off, which logs every query, and the renderers and parsers
+        of API_JSON_ONLY, whatever the settings of the command are
+        DRF views copy the default renderers and parsers when they are
+        imported, so the views still having them are patched as well
+    """
+    defaults = {
+        'renderer_classes': api_settings.DEFAULT_RENDERER_CLASSES,
+        'parser_classes': api_settings.DEFAULT_PARSER_CLASSES,
+    }
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(
+            DEBUG=False,
+            REST_FRAMEWORK=dict(
+                settings.REST_FRAMEWORK,
+                **settings.API_JSON_ONLY_REST_FRAMEWORK
+            ),
+        ))
+        production = {
+            'renderer_classes': api_settings.DEFAULT_RENDERER_CLASSES,
+            'parser_classes': api_settings.DEFAULT_PARSER_CLASSES,
+        }
+        for view in set(_view_classes()):
+            for name, default in defaults.items():
+                if list(view.__dict__.get(name, ())) == list(default):
+                    stack.enter_context(
+                        patch.object(view, name, production[name])
+                    )
+        yield
+
+
+def run(scenarios=None, transports=None, iterations=200, warmup=20,
+        **overrides):
+    """
+        run scenarios through transports, returns
+        {scenario: {transport: figures}}
+        scenarios run with production_settings(); query counts come from
+        the Server-Timing header, which is forced on; metrics go to a
+        throwaway directory; overrides are settings to run with
+    """
+    scenarios = scenarios or sorted(SCENARIOS)
+    transports = transports or sorted(TRANSPORTS)
+    results = {}
+    with tempfile.TemporaryDirectory() as metrics_dir, \
+            production_settings(), override_settings(
+                ALLOWED_HOSTS=['testserver', '127.0.0.1'],
+                PERFORMANCE=dict(settings.PERFORMANCE, SERVER_TIMING=True),
+                METRICS=dict(settings.METRICS, DIR=metrics_dir),
+                **overrides):
+        for transport_name in transports:
+            transport = TRANSPORTS[transport_name]()
+            try:
+                for name in scenarios:
+                    results.setdefault(name, {})[transport_name] = (
+                        run_scenario(
+                            SCENARIOS[name](), transport, iterations, warmup
+                        )
+                    )
+            finally:
+                transport.close()
+    return results
+
+
+def queries_only(results):
+    """the figures of results which do not depend on the machine"""
+    return {
+        name: {
+            transport: {
+                'queries_per_request': figures['queries_per_request']
+            }
+            for transport, figures in transports.items()
+        }
+        for name, transports in results.items()
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+        regressions of results against a baseline, as messages
+        - latency (p50, p95, p99) more than tolerance above the baseline
+        - throughput more than tolerance below the baseline
+        - any extra query per request
+        figures missing from the baseline are not compared
+    """
+    regressions = []
+    for name, transports in sorted(results.items()):
+        for transport, figures in sorted(transports.items()):
+            base = baseline.get(name, {}).get(transport)
+            if base is None:
+                continue
+            label = '%s/%s' % (name, transport)
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if key in base and figures[key] > base[key] * (1 + tolerance):
+                    regressions.append('%s: %s %.3f > %.3f' % (
+                        label, key, figures[key], base[key]
+                    ))
+            if 'throughput' in base and (
+                    figures['throughput'] < base['throughput'] * (
+                        1 - tolerance)):
+                regressions.append('%s: throughput %.2f < %.2f' % (
+                    label, figures['throughput'], base['throughput']
+                ))
+            queries = figures['queries_per_request']
+            base_queries = base.get('queries_per_request')
+            if None not in (queries, base_queries) and queries > base_queries:
+                regressions.append('%s: queries per request %g > %g' % (
+                    label, queries, base_queries
+                ))
+    return regressions
+
+
+def middleware_savings(scenarios=None, transports=None, iterations=200,
+                       warmup=20):
+    """
+        run scenarios with the middleware profiles of
+        MIDDLEWARE_PROFILES, then with the last (catch-all, full) profile
+        for every path, returns {scenario: {transport: {'lean': figures,
+        'full': figures, 'saved_ms': mean and p50 differences}}}
+    """
+    prefix, full_stack = settings.MIDDLEWARE_PROFILES[-1]
+    lean = run(scenarios, transports, iterations, warmup)
+    full = run(scenarios, transports, iterations, warmup,
+               MIDDLEWARE_PROFILES=[('/', full_stack)])
+    results = {}
+    for name, by_transport in lean.items():
+        for transport, figures in by_transport.items():
+            full_figures = full[name][transport]
+            results.setdefault(name, {})[transport] = {
+                'lean': figures,
+                'full': full_figures,
+                'saved_ms': {
+                    key: round(full_figures[key] - figures[key], 3)
+                    for key in ('mean_ms', 'p50_ms')
+                },
+            }
+    return results
@@ -0,0 +1,109 @@
+import abc
+import itertools
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from user import tokens
+
+PASSWORD = 'benchmark-pass'
+
+
+class Scenario(abc.ABC):
+    """
+        One kind of request to measure
+        setup() runs once per transport, request() once per iteration
+        and returns the (status, queries) of the transport's request
+    """
+    name = None
+    expected_status = 200
+
+    def setup(self, transport):
+        # unique per run, so that repeated runs never collide
+        self.prefix = uuid.uuid4().hex[:8]
+        self.counter = itertools.count()
+
+    def create_user(self):
+        return get_user_model().objects.create_user(
+            email='%s-%d@benchmark.test' % (self.prefix, next(self.counter)),
+            password=PASSWORD,
+            name='Benchmark',
+        )
+
+    @abc.abstractmethod
+    def request(self, transport):
+        """make one request, returns its (status, queries)"""
+
+
+class CreateUser(Scenario):
+    """POST /api/user/create/ with a new email each time"""
+    name = 'create_user'
+    expected_status = 201
+
+    def request(self, transport):
+        return transport.request('POST', reverse('user:create'), {
+            'email': '%s-%d@benchmark.test' % (
+                self.prefix, next(self.counter)),
+            'password': PASSWORD,
+            'name': 'Benchmark',
+        })
+
+
+class CreateToken(Scenario):
+    """POST /api/user/token/ for an existing user"""
+    name = 'create_token'
+
+    def setup(self, transport):
+        super().setup(transport)
+        self.user = self.create_user()
+
+    def request(self, transport):
+        return transport.request('POST', reverse('user:token'), {
+            'email': self.user.email, 'password': PASSWORD,
+        })
+
+
+class RetrieveMe(Scenario):
+    """authenticated GET /api/user/me/"""
+    name = 'me_get'
+
+    def setup(self, transport):
+        super().setup(transport)
+        self.user = self.create_user()
+        self.token = tokens.get_or_create_token(self.user).key
+
+    def request(self, transport):
+        return transport.request('GET', reverse('user:me'), token=self.token)
+
+
+class RetrieveMeSigned(RetrieveMe):
+    """GET /api/user/me/ authenticated with a signed token"""
+    name = 'me_get_signed'
+
+    def setup(self, transport):
+        super().setup(transport)
+        self.token = tokens.create_signed_token(self.user)
+
+    def request(self, transport):
+        return transport.request(
+            'GET', reverse('user:me'), token=self.token, keyword='Bearer'
+        )
+
+
+class UpdateMe(RetrieveMe):
+    """authenticated PATCH /api/user/me/ changing the name"""
+    name = 'me_patch'
+
+    def request(self, transport):
+        return transport.request('PATCH', reverse('user:me'), {
+            'name': 'Benchmark %d' % next(self.counter),
+        }, token=self.token)
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        CreateUser, CreateToken, RetrieveMe, RetrieveMeSigned, UpdateMe
+    )
+}
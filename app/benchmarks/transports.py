@@ -0,0 +1,94 @@
+import http.client
+import json
+import re
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.core.handlers.wsgi import WSGIHandler
+from rest_framework.test import APIClient
+
+# db phase of the Server-Timing header set by PerformanceMiddleware
+DB_TIMING = re.compile(r'(?:^|, )db;[^,]*desc="(\d+) queries"')
+
+
+def queries_from_header(server_timing):
+    """number of SQL queries reported by a Server-Timing header,
+        None when the response has no such header
+    """
+    if server_timing is None:
+        return None
+    match = DB_TIMING.search(server_timing)
+    return int(match.group(1)) if match else 0
+
+
+class ClientTransport:
+    """requests through DRF's test client, in process"""
+    name = 'client'
+
+    def __init__(self):
+        self.client = APIClient()
+
+    def request(self, method, path, data=None, token=None,
+                keyword='Token'):
+        """returns the (status, number of queries) of a request"""
+        credentials = {}
+        if token is not None:
+            credentials['HTTP_AUTHORIZATION'] = keyword + ' ' + token
+        response = getattr(self.client, method.lower())(
+            path, data, format='json', **credentials
+        )
+        return response.status_code, queries_from_header(
+            response.get('Server-Timing')
+        )
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WSGITransport:
+    """requests over HTTP to a local wsgiref server running the app"""
+    name = 'wsgi'
+
+    def __init__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, WSGIHandler(), handler_class=QuietHandler
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name='benchmark-server',
+            daemon=True
+        )
+        self.thread.start()
+
+    def request(self, method, path, data=None, token=None,
+                keyword='Token'):
+        headers = {'Content-Type': 'application/json'}
+        if token is not None:
+            headers['Authorization'] = keyword + ' ' + token
+        body = json.dumps(data) if data is not None else None
+        # wsgiref speaks HTTP/1.0, one connection per request
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        return response.status, queries_from_header(
+            response.getheader('Server-Timing')
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+TRANSPORTS = {
+    'client': ClientTransport,
+    'wsgi': WSGITransport,
+}
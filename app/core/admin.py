@@ -5,6 +5,8 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 
 from core import models
+from core.paginators import EstimatedCountPaginator
+from core.signals import users_updated
 
 # This class is used just for the admin interface.
 # Nothing changes except the way admin page looks
@@ -16,6 +18,17 @@ class UserAdmin(BaseUserAdmin):
     # fields to be included in "list users page"
     list_display = ['email', 'name']
 
+    # icontains searches, backed by the trigram indexes of
+    # core/migrations/0003_user_trigram_indexes.py on PostgreSQL
+    search_fields = ['email', 'name']
+
+    # avoid exact COUNT(*) queries on big tables:
+    # no "N total" next to filtered results and estimated page counts
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    actions = ['activate_users', 'deactivate_users']
+
     # fields to be included on change user page (edit page)
     fieldsets = (
         (
@@ -43,5 +56,23 @@ class UserAdmin(BaseUserAdmin):
                       ),
                      )
 
+    def _set_active(self, request, queryset, is_active):
+        """update the selected users with a single UPDATE statement
+            the ids are not fetched ("select all" can cover the whole
+            table), every cached user is dropped instead
+        """
+        updated = queryset.update(is_active=is_active)
+        # queryset.update() does not send post_save
+        users_updated.send(sender=models.User, user_ids=None)
+        self.message_user(request, _('%d users updated') % updated)
+
+    def activate_users(self, request, queryset):
+        self._set_active(request, queryset, True)
+    activate_users.short_description = _('Activate selected users')
+
+    def deactivate_users(self, request, queryset):
+        self._set_active(request, queryset, False)
+    deactivate_users.short_description = _('Deactivate selected users')
+
 
 admin.site.register(models.User, UserAdmin)
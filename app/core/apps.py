@@ -1,5 +1,41 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        """connect the permission cache invalidation, install the
+            last_login write-behind buffer and keep the email filter up
+            to date when enabled
+        """
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group, Permission
+        from django.db.models.signals import m2m_changed, post_delete, \
+            post_save
+        from core import permissions
+        from core.signals import users_updated
+
+        User = get_user_model()
+        for through in (User.groups.through, User.user_permissions.through):
+            m2m_changed.connect(
+                permissions.user_permissions_changed, sender=through
+            )
+        m2m_changed.connect(
+            permissions.group_permissions_changed,
+            sender=Group.permissions.through
+        )
+        post_delete.connect(permissions.invalidate_all, sender=Group)
+        post_delete.connect(permissions.invalidate_all, sender=Permission)
+        post_save.connect(permissions.invalidate_user, sender=User)
+        post_delete.connect(permissions.invalidate_user, sender=User)
+        users_updated.connect(permissions.invalidate_updated_users)
+
+        if settings.LAST_LOGIN_WRITE_BEHIND['ENABLED']:
+            from core import writebehind
+            writebehind.install()
+
+        if settings.USER_EMAIL_FILTER['ENABLED']:
+            from core import bloom
+            post_save.connect(bloom.add_user_email, sender=User)
@@ -0,0 +1,55 @@
+from django.contrib.auth import backends, get_user_model
+
+from core import hashing
+from core.permissions import permission_cache
+
+UserModel = get_user_model()
+
+
+class HashingModelBackend(backends.ModelBackend):
+    """
+        ModelBackend which runs the password hashing through
+        core.hashing.executor instead of on the request thread
+        The user's DRF auth token is fetched in the same query, so the
+        token endpoint does not need a second round trip for it.
+    """
+    select_related = ('auth_token',)
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        try:
+            user = UserModel._default_manager.select_related(
+                *self.select_related
+            ).get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Run the hasher anyway, like ModelBackend, so that unknown
+            # emails take as long as known ones (no user enumeration)
+            hashing.make_password(password)
+        else:
+            if (hashing.check_user_password(user, password) and
+                    self.user_can_authenticate(user)):
+                return user
+
+
+class CachedPermissionBackend(HashingModelBackend):
+    """
+        HashingModelBackend keeping resolved permission sets in
+        core.permissions.permission_cache, so has_perm() and friends
+        skip the user and group permission joins of ModelBackend
+        (which only memoizes them on the user instance, i.e. for a
+        single request). The signal receivers in core.permissions
+        invalidate the cache when permissions or group memberships
+        change.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            perms, versions = permission_cache.get(user_obj.pk)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                permission_cache.set(user_obj.pk, perms, versions)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
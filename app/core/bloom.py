@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import math
+import struct
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DIGEST = struct.Struct('<QQ')
+
+
+class BloomFilter:
+    """
+        Set membership test in a fixed amount of memory
+        `item in bloom` is False when the item was never added and True
+        when it probably was: false positives happen at about
+        error_rate once capacity items were added, false negatives never.
+        Items cannot be removed.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )))
+        self.hashes = max(1, int(round(
+            self.size / capacity * math.log(2)
+        )))
+        self.bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # double hashing: k positions out of a single 128 bit digest
+        first, second = DIGEST.unpack(hashlib.blake2b(
+            item.encode('utf-8'), digest_size=DIGEST.size
+        ).digest())
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item):
+        with self._lock:
+            for position in self._positions(item):
+                self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class EmailFilter:
+    """
+        Bloom filter of the emails of all users, loaded from the
+        database by a background thread started on first use and kept
+        up to date by add_user_email for the users saved by this process
+        A miss means the email is free (up to users created by other
+        processes meanwhile, which the unique index still catches), so
+        only a hit needs a query to tell a duplicate signup. Until the
+        filter is loaded every email might exist: signups run the query
+        instead of waiting for the load.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = None
+        self._loading = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.USER_EMAIL_FILTER
+        return cls(capacity=config['CAPACITY'],
+                   error_rate=config['ERROR_RATE'])
+
+    def load(self):
+        """read every email into a new filter, warns when there are more
+            than capacity, which raises the rate of false positives
+        """
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        count = 0
+        emails = get_user_model().objects.values_list(
+            'email', flat=True
+        ).iterator()
+        for email in emails:
+            bloom.add(email)
+            count += 1
+        if count > self.capacity:
+            logger.warning(
+                'The email filter holds %d emails, more than its capacity '
+                'of %d: raise USER_EMAIL_FILTER_CAPACITY', count,
+                self.capacity
+            )
+        with self._lock:
+            # emails saved while loading
+            for email in self._pending:
+                bloom.add(email)
+            self._pending = []
+            self._filter = bloom
+
+    def _load(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Loading the email filter failed')
+        finally:
+            with self._lock:
+                self._loading = False
+                self._pending = []
+            connections.close_all()
+
+    def start_loading(self):
+        """load the filter in a background thread, returns the thread or
+            None when the filter is loaded or being loaded
+        """
+        with self._lock:
+            if self._filter is not None or self._loading:
+                return None
+            self._loading = True
+        thread = threading.Thread(
+            target=self._load, name='email-filter', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def might_exist(self, email):
+        bloom = self._filter
+        if bloom is None:
+            self.start_loading()
+            return True
+        return email in bloom
+
+    def add(self, email):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(email)
+            elif self._loading:
+                self._pending.append(email)
+
+    def reset(self):
+        """forget the filter, it is reloaded on next use (used by tests)
+        """
+        with self._lock:
+            self._filter = None
+            self._pending = []
+
+
+email_filter = EmailFilter.from_settings()
+
+
+def add_user_email(sender, instance, **kwargs):
+    """post_save receiver adding saved users' emails to email_filter
+    """
+    email_filter.add(instance.email)
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalTTLCache:
+    """
+        Process-local LRU cache whose entries also expire after a TTL.
+        - max_size bounds the memory used: the least recently used entry
+          is evicted when a new key would exceed it
+        - ttl bounds how stale an entry can get: expired entries are
+          treated as misses and dropped on access
+        It is thread safe, so it can be shared by all request threads
+        of a worker process.
+    """
+
+    def __init__(self, max_size=1000, ttl=60, timer=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """return the cached value for key or default if missing/expired
+        """
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires <= self._timer():
+                del self._data[key]
+                return default
+            # mark as most recently used
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """store value under key for ttl seconds (defaults to self.ttl)
+        """
+        if self.max_size <= 0:
+            return
+        expires = self._timer() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,144 @@
+"""
+    PostgreSQL backend with a process-local connection pool
+
+    Same as django.db.backends.postgresql, except that connections are
+    taken from a bounded core.db.pool.ConnectionPool instead of being
+    opened for every request, and given back to it instead of being
+    closed, which saves the TCP + authentication handshake per request.
+
+    Configure it with ENGINE 'core.db.backends.postgresql_pool' and a
+    POOL dict next to HOST/NAME in settings.DATABASES (see settings.py).
+    Idle pooled connections are really closed when the process exits
+    and before the test runner drops or clones a test database, which
+    PostgreSQL refuses while connections to it are open.
+"""
+import atexit
+import os
+import threading
+
+from django.db.backends.postgresql import base, creation
+from psycopg2 import extensions
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_stats():
+    """statistics of the pools of this process, by database alias"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {
+        alias: pool.stats() for (alias, params), (pid, pool) in pools.items()
+    }
+
+
+def close_pools(alias=None):
+    """close the idle connections of the pools of this process (of one
+        database alias) and forget those pools
+    """
+    with _pools_lock:
+        keys = [key for key in _pools if alias is None or key[0] == alias]
+        pools = [_pools.pop(key) for key in keys]
+    for pid, pool in pools:
+        if pid == os.getpid():
+            pool.close_all()
+
+
+atexit.register(close_pools)
+
+
+def check_connection(connection, idle, check_after):
+    """cheap checks on every checkout, a round trip after check_after
+        idle seconds (the server may have dropped the connection)
+    """
+    if connection.closed:
+        return False
+    if (connection.get_transaction_status() !=
+            extensions.TRANSACTION_STATUS_IDLE):
+        return False
+    if idle < check_after:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Database.Error:
+        return False
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.connection.close()
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        # the template database must not have open connections either
+        self.connection.close()
+        close_pools(self.connection.alias)
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params):
+        # one pool per alias and connection parameters (the test runner
+        # switches NAME to the test database), not shared with forked
+        # children
+        key = (self.alias, tuple(sorted(conn_params.items())))
+        with _pools_lock:
+            pid, pool = _pools.get(key, (None, None))
+            if pool is None or pid != os.getpid():
+                options = self.settings_dict.get('POOL', {})
+                check_after = options.get('CHECK_AFTER', 5)
+                pool = ConnectionPool(
+                    connect=lambda: Database.connect(**conn_params),
+                    check=lambda connection, idle: check_connection(
+                        connection, idle, check_after
+                    ),
+                    max_size=options.get('MAX_SIZE', 10),
+                    max_idle=options.get('MAX_IDLE', 300),
+                    max_lifetime=options.get('MAX_LIFETIME', 3600),
+                    timeout=options.get('TIMEOUT', 10),
+                )
+                _pools[key] = (os.getpid(), pool)
+        return pool
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.get_pool(conn_params).acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc))
+
+        # same isolation level handling as the parent class
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self.get_pool(self.get_connection_params())
+        # a connection closed inside an atomic block stays referenced
+        # by this wrapper, it must not be handed to another thread
+        discard = self.in_atomic_block or bool(self.connection.closed)
+        if not discard and (self.connection.get_transaction_status() !=
+                            extensions.TRANSACTION_STATUS_IDLE):
+            try:
+                self.connection.rollback()
+            except Database.Error:
+                discard = True
+        pool.release(self.connection, discard=discard)
@@ -0,0 +1,141 @@
+import collections
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """no connection became available within the pool timeout"""
+
+
+class ConnectionPool:
+    """
+        Bounded, thread safe pool of database connections
+        - connect: callable opening a new connection
+        - check: callable(connection, idle seconds) returning False for
+          a connection which must not be handed out again
+        - close: callable closing a connection for good
+        - max_size: max number of open connections (idle + in use)
+        - max_idle: seconds after which an idle connection is closed
+        - max_lifetime: seconds after which a connection is retired
+        - timeout: seconds acquire() waits for a free connection
+    """
+
+    def __init__(self, connect, check=None, close=None, max_size=10,
+                 max_idle=300, max_lifetime=3600, timeout=10,
+                 timer=time.monotonic):
+        self.connect = connect
+        self.check = check or (lambda connection, idle: True)
+        self.close = close or (lambda connection: connection.close())
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self._timer = timer
+        # (connection, created at, released at), most recent last
+        self._idle = collections.deque()
+        self._created = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._counters = collections.Counter()
+
+    def acquire(self):
+        """return an idle healthy connection or open a new one
+        """
+        deadline = self._timer() + self.timeout
+        while True:
+            connection, created, released, new = self._checkout(deadline)
+            if new:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    # give the reserved slot back
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created[id(connection)] = self._timer()
+                    self._counters['created'] += 1
+                return connection
+
+            if self.check(connection, self._timer() - released):
+                with self._cond:
+                    self._counters['reused'] += 1
+                return connection
+            self._discard(connection, 'failed_checks')
+
+    def _checkout(self, deadline):
+        with self._cond:
+            self._counters['checkouts'] += 1
+            while True:
+                now = self._timer()
+                while self._idle:
+                    connection, created, released = self._idle.pop()
+                    if self._expired(now, created, released):
+                        self._discard(connection, 'expired', locked=True)
+                        continue
+                    return connection, created, released, False
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None, None, True
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        'no database connection available after %ss'
+                        % self.timeout
+                    )
+                self._cond.wait(remaining)
+
+    def _expired(self, now, created, released):
+        return (now - created >= self.max_lifetime or
+                now - released >= self.max_idle)
+
+    def release(self, connection, discard=False):
+        """give a connection back, discard=True closes it instead
+        """
+        now = self._timer()
+        with self._cond:
+            created = self._created.get(id(connection), now)
+        if discard or now - created >= self.max_lifetime:
+            self._discard(connection, 'discarded' if discard else 'expired')
+            return
+        with self._cond:
+            self._idle.append((connection, created, now))
+            self._cond.notify()
+
+    def _discard(self, connection, reason, locked=False):
+        try:
+            self.close(connection)
+        except Exception:
+            pass
+        if locked:
+            self._forget(connection, reason)
+        else:
+            with self._cond:
+                self._forget(connection, reason)
+
+    def _forget(self, connection, reason):
+        # callers hold self._cond
+        self._created.pop(id(connection), None)
+        self._size -= 1
+        self._counters[reason] += 1
+        self._cond.notify()
+
+    def close_all(self):
+        """close the idle connections (e.g. before the process exits)"""
+        with self._cond:
+            idle, self._idle = self._idle, collections.deque()
+        for connection, created, released in idle:
+            self._discard(connection, 'closed')
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size,
+            )
+        return stats
@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+# per thread routing state, set by core.middleware.ReplicaRoutingMiddleware
+_state = threading.local()
+
+
+def set_read_only(read_only):
+    """allow (True) or forbid (False) reads from replicas in this thread
+    """
+    _state.read_only = read_only
+
+
+def is_read_only():
+    return getattr(_state, 'read_only', False)
+
+
+def pin_credentials(authorization):
+    """pin the client which will send this Authorization header to the
+        primary, like the sender of the current request
+        for views issuing credentials (login): the client's next request
+        carries them, and may look them up before they are replicated
+    """
+    _state.issued = getattr(_state, 'issued', []) + [authorization]
+
+
+def pop_pinned_credentials():
+    """the credentials passed to pin_credentials() since the last call
+    """
+    issued = getattr(_state, 'issued', [])
+    _state.issued = []
+    return issued
+
+
+class ReplicaHealth:
+    """
+        remembers whether each replica answered a SELECT 1 for
+        check_interval seconds, so requests do not probe it every time
+    """
+
+    def __init__(self, timer=time.monotonic):
+        self._timer = timer
+        self._status = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        now = self._timer()
+        with self._lock:
+            healthy, checked_at = self._status.get(alias, (None, None))
+        interval = settings.DATABASE_REPLICA_CHECK_INTERVAL
+        if healthy is not None and now - checked_at < interval:
+            return healthy
+
+        healthy = self.check(alias)
+        with self._lock:
+            self._status[alias] = (healthy, now)
+        return healthy
+
+    def check(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except DatabaseError:
+            connections[alias].close()
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """
+        Sends reads to the replicas in settings.DATABASE_REPLICAS when
+        the current request is read only (see set_read_only) and writes
+        to the primary (default) database.
+        Replicas which fail their health check are skipped, reads fall
+        back to the primary when none is healthy.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_read_only():
+            return DEFAULT_DB_ALIAS
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if replica_health.is_healthy(alias)
+        ]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+
+EXPORT_FIELDS = ('id', 'email', 'name', 'is_active', 'is_staff',
+                 'last_login')
+
+# size of the pieces handed to the response / output file
+BUFFER_SIZE = 64 * 1024
+
+
+def _format_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([_format_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(
+            EXPORT_FIELDS, [_format_value(value) for value in row]
+        ))) + '\n'
+
+
+FORMATS = {
+    'csv': _csv_lines,
+    'jsonl': _jsonl_lines,
+}
+
+
+def _buffered(lines):
+    """join small lines into pieces of about BUFFER_SIZE bytes"""
+    parts = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def _gzipped(chunks):
+    # wbits=31 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_users(fmt='csv', compress=False, chunk_size=2000, using=None):
+    """
+        yield the user table as csv or json lines, in bytes chunks
+        - rows are fetched chunk_size at a time with
+          QuerySet.iterator(), which uses a named server-side cursor on
+          PostgreSQL, so memory stays flat however big the table is
+        - compress gzips the output on the fly
+    """
+    rows = get_user_model().objects.using(using).order_by('id').values_list(
+        *EXPORT_FIELDS
+    ).iterator(chunk_size=chunk_size)
+
+    chunks = _buffered(FORMATS[fmt](rows))
+    if compress:
+        chunks = _gzipped(chunks)
+    return chunks
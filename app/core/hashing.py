@@ -0,0 +1,208 @@
+import concurrent.futures
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core import instrumentation, metrics
+
+
+class HashingBusy(Exception):
+    """raised when the hashing executor cannot take more work"""
+
+
+def _init_worker():
+    """make sure django is set up in the worker processes
+        (only needed when processes are spawned instead of forked)
+    """
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def hash_password(password):
+    """hash a raw password with the configured default hasher
+        runs inside the worker processes, so it has to be importable
+    """
+    return hashers.make_password(password)
+
+
+def verify_password(password, encoded):
+    """check a raw password against its hash
+        returns a (matches, must_update) tuple, must_update being True
+        when the hash was made by an outdated hasher or with outdated
+        parameters and should be replaced
+    """
+    updated = []
+    matches = hashers.check_password(password, encoded, updated.append)
+    return matches, bool(updated)
+
+
+class HashingExecutor:
+    """
+        Runs password hashing (PBKDF2 & co.) away from request threads
+        - workers: size of the process pool, 0 hashes inline on the
+          calling thread (still bounded and measured)
+        - max_queue: max number of hash jobs queued or running at the
+          same time in this process, further jobs fail fast with
+          HashingBusy instead of piling up behind a login burst
+        - timeout: seconds to wait for a queued job before giving up
+    """
+
+    def __init__(self, workers=0, max_queue=0, timeout=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = (
+            threading.BoundedSemaphore(max_queue) if max_queue else None
+        )
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_time = 0.0
+        self._max_time = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.PASSWORD_HASHING
+        return cls(
+            workers=config['WORKERS'],
+            max_queue=config['MAX_QUEUE'],
+            timeout=config.get('TIMEOUT'),
+        )
+
+    def _get_pool(self):
+        # a pool inherited through fork() is unusable, create a new one
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                    )
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _acquire(self):
+        if self._slots is not None and not self._slots.acquire(False):
+            with self._lock:
+                self._rejected += 1
+            metrics.hash_rejected.labels().inc()
+            raise HashingBusy('password hashing queue is full')
+        with self._lock:
+            self._pending += 1
+        metrics.hash_queue_depth.labels().inc()
+
+    def _release(self, operation, started):
+        elapsed = time.monotonic() - started
+        metrics.hash_queue_depth.labels().dec()
+        metrics.hash_duration.labels(operation).observe(elapsed)
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            self._total_time += elapsed
+            self._max_time = max(self._max_time, elapsed)
+        if self._slots is not None:
+            self._slots.release()
+
+    def _run(self, operation, fn, *args):
+        self._acquire()
+        started = time.monotonic()
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                instrumentation.record('hash', time.monotonic() - started)
+                self._release(operation, started)
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._release(operation, started)
+            raise
+        # the slot is freed when the job is done, not when a request
+        # stops waiting for it: a timed out job still takes a worker
+        future.add_done_callback(
+            lambda future: self._release(operation, started)
+        )
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise HashingBusy('password hashing timed out')
+        finally:
+            instrumentation.record('hash', time.monotonic() - started)
+
+    def make_password(self, password):
+        return self._run('make', hash_password, password)
+
+    def check_password(self, password, encoded):
+        return self._run('check', verify_password, password, encoded)
+
+    def make_passwords(self, passwords):
+        """hash many passwords in parallel (bulk imports)
+            the batch takes a single queue slot
+        """
+        passwords = list(passwords)
+        self._acquire()
+        started = time.monotonic()
+        try:
+            if not self.workers:
+                return [hash_password(password) for password in passwords]
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            return list(self._get_pool().map(
+                hash_password, passwords, chunksize=chunksize
+            ))
+        finally:
+            instrumentation.record('hash', time.monotonic() - started)
+            self._release('bulk', started)
+
+    def stats(self):
+        """queue depth and hash latency figures of this process, also
+            exported to /metrics (see core.metrics)
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self._pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'total_seconds': self._total_time,
+                'max_seconds': self._max_time,
+                'avg_seconds': (
+                    self._total_time / self._completed
+                    if self._completed else 0.0
+                ),
+            }
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+
+
+executor = HashingExecutor.from_settings()
+
+
+def make_password(password):
+    """hash a raw password through the shared executor"""
+    return executor.make_password(password)
+
+
+def check_user_password(user, password):
+    """
+        check a raw password against a user's hash through the executor
+        the hash is upgraded when the hasher settings changed, like
+        AbstractBaseUser.check_password does
+    """
+    matches, must_update = executor.check_password(password, user.password)
+    if matches and must_update:
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return matches
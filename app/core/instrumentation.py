@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# timings of the request handled by the current thread, if any
+_local = threading.local()
+
+
+class RequestTimings:
+    """durations (seconds) and counts per phase of a request"""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+
+    def add(self, name, seconds, count=1):
+        self.durations[name] += seconds
+        self.counts[name] += count
+
+
+def start():
+    """start collecting timings for the current thread's request"""
+    _local.timings = RequestTimings()
+    return _local.timings
+
+
+def stop():
+    _local.timings = None
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+def record(name, seconds, count=1):
+    """add to the current request's timings (no-op outside requests)"""
+    timings = current()
+    if timings is not None:
+        timings.add(name, seconds, count)
+
+
+@contextmanager
+def timer(name):
+    """time the block as phase name of the current request"""
+    if current() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def time_queries(execute, sql, params, many, context):
+    """connection.execute_wrapper recording query count and db time"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', time.perf_counter() - started)
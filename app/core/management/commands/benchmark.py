@@ -0,0 +1,132 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from benchmarks import micro, runner
+from benchmarks.scenarios import SCENARIOS
+from benchmarks.transports import TRANSPORTS
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the user API
+        scenarios run on a throwaway test database, through the test
+        client and through a local WSGI server, and the results are
+        printed as json; with --baseline the command fails when they
+        regress beyond --tolerance
+        Scenarios always run with DEBUG off and the JSON only renderers
+        (see benchmarks.runner.production_settings).
+        The committed benchmarks/baseline.json only holds the queries per
+        request, which do not depend on the machine; regenerate it with:
+            manage.py benchmark --baseline benchmarks/baseline.json \\
+                --save-baseline --queries-only
+        Latency and throughput baselines are only meaningful on the
+        machine which measured them: generate one there (e.g. in CI,
+        from the target branch) instead of committing it:
+            manage.py benchmark --baseline /tmp/baseline.json \\
+                --save-baseline
+    """
+    help = 'Benchmark the user API endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=sorted(SCENARIOS), help='defaults to all of them'
+        )
+        parser.add_argument(
+            '--transport', action='append', dest='transports',
+            choices=sorted(TRANSPORTS), help='defaults to all of them'
+        )
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument(
+            '--output', help='file to write the results to'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='json results to compare with, e.g. the committed '
+                 'benchmarks/baseline.json'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='store the results as the --baseline file'
+        )
+        parser.add_argument(
+            '--queries-only', action='store_true',
+            help='with --save-baseline, store only the queries per '
+                 'request, which do not depend on the machine'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='allowed slowdown, as a fraction of the baseline'
+        )
+        parser.add_argument(
+            '--micro', action='store_true',
+            help='time serializer and renderer work only, before and '
+                 'after field caching and the fast json renderer'
+        )
+        parser.add_argument(
+            '--middleware-savings', action='store_true',
+            help='compare the lean /api/ middleware profile with the '
+                 'full middleware stack instead'
+        )
+
+    def handle(self, *args, **options):
+        if options['micro']:
+            results = micro.run(options['iterations'] * 10)
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline requires --baseline')
+        if options['queries_only'] and not options['save_baseline']:
+            raise CommandError('--queries-only requires --save-baseline')
+        if options['middleware_savings'] and options['baseline']:
+            raise CommandError(
+                '--middleware-savings cannot be used with --baseline'
+            )
+
+        results = self.run(options)
+        report = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+        self.stdout.write(report)
+
+        if not options['baseline']:
+            return
+        if options['save_baseline']:
+            if options['queries_only']:
+                report = json.dumps(
+                    runner.queries_only(results), indent=2, sort_keys=True
+                )
+            with open(options['baseline'], 'w') as baseline:
+                baseline.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS('Baseline saved'))
+            return
+
+        with open(options['baseline']) as baseline:
+            regressions = runner.compare(
+                results, json.load(baseline), options['tolerance']
+            )
+        if regressions:
+            raise CommandError(
+                'Performance regressions:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('No regression'))
+
+    def run(self, options):
+        run = runner.run
+        if options['middleware_savings']:
+            run = runner.middleware_savings
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            return run(
+                scenarios=options['scenarios'],
+                transports=options['transports'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+            )
+        except runner.BenchmarkError as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_databases(old_config, verbosity=0)
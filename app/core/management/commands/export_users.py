@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core import export
+
+
+class Command(BaseCommand):
+    """Django command to dump the user table as csv or json lines
+        rows are streamed from a server-side cursor, memory use does
+        not depend on the size of the table
+    """
+    help = 'Export users as csv or jsonl'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=sorted(export.FORMATS), default='csv'
+        )
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--output', help='file to write to, defaults to stdout'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        chunks = export.export_users(
+            fmt=options['format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size'],
+            using=options['database'],
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
@@ -0,0 +1,273 @@
+import concurrent.futures
+import csv
+import io
+import itertools
+import json
+import os
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core import hashing
+from core.signals import users_updated
+
+# every run stages into its own table, named in the checkpoint file
+STAGING_TABLE_PREFIX = 'core_user_import_'
+STAGING_COLUMNS = ('line', 'email', 'name', 'password', 'is_active',
+                   'is_staff')
+
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+
+
+def parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def read_csv(stream):
+    """yield one dict per line of a csv file with a header row"""
+    return csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    """yield one dict per non empty line of a json lines file"""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+class Command(BaseCommand):
+    """
+        Django command to load users from large csv or jsonl files
+        - the input is streamed in chunks, memory use does not depend
+          on the size of the file
+        - passwords are hashed in a process pool (or taken as is with
+          --prehashed)
+        - every chunk is sent to a staging table of this run with COPY,
+          the users are merged into core_user by a single
+          INSERT ... ON CONFLICT (email) at the end
+        - the staging table and the number of staged lines are written
+          to a checkpoint file after every chunk is committed, an
+          interrupted import resumes from there. The staging table is
+          a regular (logged) table: an unlogged one is emptied by a
+          crash recovery while the checkpoint still counts its rows.
+    """
+    help = 'Import users from a csv or jsonl file (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='csv or jsonl file to import')
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='input format, guessed from the file extension by default'
+        )
+        parser.add_argument(
+            '--prehashed', action='store_true',
+            help='the password column already contains django hashes'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='number of password hashing processes'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--on-conflict', choices=('skip', 'update'), default='skip',
+            help='keep (skip) or overwrite (update) existing users'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='checkpoint file, defaults to <path>.checkpoint'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('import_users requires PostgreSQL')
+
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if fmt not in READERS:
+            raise CommandError('Unknown input format %r' % fmt)
+        checkpoint = options['checkpoint'] or path + '.checkpoint'
+
+        staged, table = self.read_checkpoint(checkpoint)
+        with connection.cursor() as cursor:
+            if staged and table not in connection.introspection.table_names(
+                    cursor):
+                self.stdout.write(self.style.WARNING(
+                    'staging table %s is gone, starting over' % table
+                ))
+                staged = 0
+            if staged:
+                self.stdout.write('resuming after line %d' % staged)
+            else:
+                table = STAGING_TABLE_PREFIX + uuid.uuid4().hex[:12]
+                cursor.execute(
+                    'CREATE TABLE {} ('
+                    'line bigint, email varchar(255), name varchar(255), '
+                    'password varchar(128), is_active boolean, '
+                    'is_staff boolean)'.format(table)
+                )
+                self.write_checkpoint(checkpoint, 0, table)
+
+        pool = None
+        if not options['prehashed'] and options['workers'] > 0:
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=options['workers']
+            )
+        try:
+            with open(path, newline='') as stream:
+                rows = enumerate(READERS[fmt](stream), start=1)
+                rows = itertools.islice(rows, staged, None)
+                self.stage(connection, table, rows, pool, staged,
+                           checkpoint, options)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        merged = self.merge(connection, table, options['on_conflict'])
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS('%d users imported' % merged))
+
+    def stage(self, connection, table, rows, pool, staged, checkpoint,
+              options):
+        """copy the input into the staging table chunk by chunk"""
+        started = time.monotonic()
+        done = skipped = 0
+        while True:
+            chunk = list(itertools.islice(rows, options['chunk_size']))
+            if not chunk:
+                break
+            records, invalid = self.prepare(chunk, pool, options)
+            skipped += invalid
+
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(records)
+            buffer.seek(0)
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                            table, ', '.join(STAGING_COLUMNS)
+                        ),
+                        buffer
+                    )
+
+            staged = chunk[-1][0]
+            # written once the COPY is committed: a crash in between
+            # stages the chunk twice, which the merge deduplicates
+            self.write_checkpoint(checkpoint, staged, table)
+            done += len(chunk)
+            elapsed = time.monotonic() - started
+            self.stdout.write('staged %d lines (%d skipped), %.0f lines/s' % (
+                staged, skipped, done / elapsed if elapsed else 0
+            ))
+
+    def prepare(self, chunk, pool, options):
+        """validate and hash a chunk, returns (records, invalid count)
+        """
+        manager = get_user_model().objects
+        valid = []
+        for line, row in chunk:
+            email = (row.get('email') or '').strip()
+            password = row.get('password') or None
+            if not email:
+                continue
+            if options['prehashed']:
+                try:
+                    identify_hasher(password)
+                except (TypeError, ValueError):
+                    continue
+            valid.append((line, manager.normalize_email(email), row,
+                          password))
+
+        passwords = [password for line, email, row, password in valid]
+        if not options['prehashed']:
+            if pool is None:
+                passwords = [hashing.hash_password(p) for p in passwords]
+            else:
+                chunksize = max(1, len(passwords) // (options['workers'] * 4))
+                passwords = list(pool.map(
+                    hashing.hash_password, passwords, chunksize=chunksize
+                ))
+
+        records = [
+            (
+                line, email, row.get('name') or '', encoded,
+                't' if parse_bool(row.get('is_active'), True) else 'f',
+                't' if parse_bool(row.get('is_staff'), False) else 'f',
+            )
+            for (line, email, row, password), encoded in zip(valid, passwords)
+        ]
+        return records, len(chunk) - len(valid)
+
+    def merge(self, connection, table, on_conflict):
+        """move the staged users into core_user with a single statement
+            the last line wins when an email appears more than once
+        """
+        if on_conflict == 'update':
+            conflict = (
+                'DO UPDATE SET name = EXCLUDED.name, '
+                'password = EXCLUDED.password, '
+                'is_active = EXCLUDED.is_active, '
+                'is_staff = EXCLUDED.is_staff, '
+                'updated_at = EXCLUDED.updated_at, '
+                # a new password revokes the user's signed tokens
+                'token_version = core_user.token_version + '
+                '(core_user.password IS DISTINCT FROM EXCLUDED.password)::int'
+            )
+        else:
+            conflict = 'DO NOTHING'
+
+        self.stdout.write('merging staged users ...')
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO core_user (email, name, password, '
+                    'is_active, is_staff, is_superuser, token_version, '
+                    'updated_at) '
+                    'SELECT DISTINCT ON (email) email, name, password, '
+                    'is_active, is_staff, false, 0, now() FROM {} '
+                    'ORDER BY email, line DESC '
+                    'ON CONFLICT (email) {}'.format(table, conflict)
+                )
+                merged = cursor.rowcount
+                cursor.execute('DROP TABLE {}'.format(table))
+        if on_conflict == 'update' and merged:
+            # existing users may have been changed (deactivated, new
+            # password) without post_save: drop every cached user
+            users_updated.send(sender=get_user_model(), user_ids=None)
+        return merged
+
+    def read_checkpoint(self, checkpoint):
+        """number of input lines already staged by a previous run and
+            the staging table holding them
+        """
+        try:
+            with open(checkpoint) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0, None
+        if not state.get('table'):
+            return 0, None
+        return state['staged'], state['table']
+
+    def write_checkpoint(self, checkpoint, staged, table):
+        # write then rename, so a crash never leaves a corrupt checkpoint
+        with open(checkpoint + '.tmp', 'w') as f:
+            json.dump({'staged': staged, 'table': table}, f)
+        os.replace(checkpoint + '.tmp', checkpoint)
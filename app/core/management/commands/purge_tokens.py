@@ -0,0 +1,70 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    """Django command to delete expired auth tokens
+        rows are deleted in small batches, each in its own short
+        transaction, with a pause in between, so that purging a large
+        table neither holds locks for long nor floods the replicas
+        with one huge transaction
+    """
+    help = 'Delete expired auth tokens in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0.1,
+            help='seconds to pause between two batches'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        ttl = settings.TOKEN_EXPIRY['TTL']
+        if not ttl:
+            raise CommandError('Tokens do not expire (TOKEN_EXPIRY TTL 0)')
+        cutoff = timezone.now() - datetime.timedelta(seconds=ttl)
+        batch_size = options['batch_size']
+
+        deleted = 0
+        while True:
+            count = self.delete_batch(
+                options['database'], cutoff, batch_size
+            )
+            deleted += count
+            if count < batch_size:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS('Deleted %d expired tokens' % deleted)
+        )
+
+    def delete_batch(self, using, cutoff, batch_size):
+        """delete up to batch_size expired tokens, return their number
+        """
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            # ctid is the physical row address: the fastest way to
+            # delete exactly the rows the LIMITed subquery picked
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM authtoken_token WHERE ctid IN ('
+                    'SELECT ctid FROM authtoken_token '
+                    'WHERE created < %s LIMIT %s)',
+                    [cutoff, batch_size]
+                )
+                return cursor.rowcount
+
+        keys = list(
+            Token.objects.using(using).filter(created__lt=cutoff)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        Token.objects.using(using).filter(pk__in=keys).delete()
+        return len(keys)
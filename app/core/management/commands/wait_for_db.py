@@ -1,23 +1,85 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
-import time
+from django.core.management.base import BaseCommand, CommandError
+
+
+def probe(alias):
+    """run a real query on a database, raises OperationalError if it
+        does not accept queries yet
+    """
+    # connections are per thread, close this thread's one when done
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        connection.close()
 
 
 class Command(BaseCommand):
     """ Django command to pause execution until database is available"""
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='database alias to wait for, defaults to all of them'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='seconds to wait before giving up'
+        )
+        parser.add_argument(
+            '--max-interval', type=float, default=5,
+            help='max seconds between two attempts'
+        )
+
+    def handle(self, *args, **options):
         """function runs whenever we run the management command
         """
         self.stdout.write('waiting for db ...')
-        db_conn = None
-        while not db_conn:
+        aliases = options['databases'] or list(settings.DATABASES)
+        deadline = time.monotonic() + options['timeout']
+
+        # probe all databases at the same time
+        with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+            results = list(executor.map(
+                lambda alias: self.wait_for(
+                    alias, deadline, options['max_interval']
+                ),
+                aliases
+            ))
+
+        failed = [alias for alias, ready in zip(aliases, results) if not ready]
+        if failed:
+            raise CommandError(
+                'Database unavailable after %ss: %s'
+                % (options['timeout'], ', '.join(failed))
+            )
+        # prints success messge in green
+        self.stdout.write(self.style.SUCCESS('db available'))
+
+    def wait_for(self, alias, deadline, max_interval):
+        """probe a database until it answers, with exponential backoff
+            and full jitter between attempts (retries of several
+            containers do not hit the database in lockstep)
+        """
+        interval = 0.1
+        while True:
             try:
-                # get the database with keyword 'default' from settings.py
-                db_conn = connections['default']
-                # prints success messge in green
-                self.stdout.write(self.style.SUCCESS('db available'))
+                probe(alias)
+                return True
             except OperationalError:
-                self.stdout.write("Database unavailable, waiting 1 second ...")
-                time.sleep(1)
+                delay = random.uniform(0, interval)
+                if time.monotonic() + delay >= deadline:
+                    return False
+                self.stdout.write(
+                    "Database %s unavailable, waiting %.1f seconds ..."
+                    % (alias, delay)
+                )
+                time.sleep(delay)
+                interval = min(interval * 2, max_interval)
@@ -0,0 +1,365 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+# layout of a values file:
+# - header: number of bytes used (uint32) and 4 bytes of padding
+# - entries: key length (uint32), utf-8 key padded to 8 bytes, value
+#   (double)
+HEADER = struct.Struct('<I4x')
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+INITIAL_SIZE = 64 * 1024
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0, math.inf)
+
+
+def _entry_size(key):
+    size = KEY_LENGTH.size + len(key)
+    return size + (-size % 8) + VALUE.size
+
+
+def read_values(path):
+    """yield the (key, value) pairs stored in a values file"""
+    with open(path, 'rb') as values_file:
+        data = values_file.read()
+    if len(data) < HEADER.size:
+        return
+    used, = HEADER.unpack_from(data, 0)
+    position = HEADER.size
+    while position < used:
+        length, = KEY_LENGTH.unpack_from(data, position)
+        key = data[position + KEY_LENGTH.size:
+                   position + KEY_LENGTH.size + length]
+        position += _entry_size(key)
+        value, = VALUE.unpack_from(data, position - VALUE.size)
+        yield key.decode('utf-8'), value
+
+
+class ValuesFile:
+    """
+        Memory-mapped file holding the metric values of one process
+        Only its own process writes to it, so updates are plain stores
+        into shared memory: no lock is shared between workers and the
+        hot path makes no system call. A new entry is written before the
+        header is updated, readers never see half-written entries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used, = HEADER.unpack_from(self._map, 0)
+        if not self._used:
+            self._used = HEADER.size
+            HEADER.pack_into(self._map, 0, self._used)
+        else:
+            position = HEADER.size
+            for key, value in read_values(path):
+                position += _entry_size(key.encode('utf-8'))
+                self._positions[key] = position - VALUE.size
+
+    def _grow(self, size):
+        capacity = len(self._map)
+        while capacity < size:
+            capacity *= 2
+        self._map.close()
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _add(self, key):
+        encoded = key.encode('utf-8')
+        size = _entry_size(encoded)
+        if self._used + size > len(self._map):
+            self._grow(self._used + size)
+        position = self._used
+        KEY_LENGTH.pack_into(self._map, position, len(encoded))
+        self._map[position + KEY_LENGTH.size:
+                  position + KEY_LENGTH.size + len(encoded)] = encoded
+        VALUE.pack_into(self._map, position + size - VALUE.size, 0.0)
+        self._used += size
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position + size - VALUE.size
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            if key not in self._positions:
+                self._add(key)
+            position = self._positions[key]
+            value, = VALUE.unpack_from(self._map, position)
+            VALUE.pack_into(self._map, position, value + amount)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _escape(value):
+    return (value.replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(value)) for name, value in labels
+    )
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """
+        Metrics of all the worker processes
+        Each process adds to its own values file, <pid>.db in
+        METRICS['DIR']; render() sums the files of every process. The
+        directory should be emptied when the server (re)starts.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._values = None
+        self._values_key = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def values(self):
+        """this process' values file, None when metrics are disabled"""
+        config = settings.METRICS
+        if not config['ENABLED']:
+            return None
+        # a forked worker must not write to its parent's file
+        key = (os.getpid(), config['DIR'])
+        if self._values_key != key:
+            with self._lock:
+                if self._values_key != key:
+                    os.makedirs(config['DIR'], exist_ok=True)
+                    if self._values is not None and (
+                            self._values_key[0] == key[0]):
+                        self._values.close()
+                    self._values = ValuesFile(
+                        os.path.join(config['DIR'], '%d.db' % key[0])
+                    )
+                    self._values_key = key
+        return self._values
+
+    def inc(self, key, amount=1.0):
+        values = self.values()
+        if values is not None:
+            values.inc(key, amount)
+
+    def collect(self):
+        """{key: value} summed over the files of all processes"""
+        totals = {}
+        directory = settings.METRICS['DIR']
+        if not os.path.isdir(directory):
+            return totals
+        for filename in os.listdir(directory):
+            if not filename.endswith('.db'):
+                continue
+            try:
+                values = list(read_values(os.path.join(directory, filename)))
+            except OSError:
+                continue
+            for key, value in values:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        """all metrics in the Prometheus text exposition format"""
+        samples = {}
+        for key, value in self.collect().items():
+            metric_name, name, labels = json.loads(key)
+            samples.setdefault(metric_name, []).append(
+                (name, [tuple(label) for label in labels], value)
+            )
+        lines = []
+        for metric in self.metrics.values():
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for name, labels, value in metric.expose(
+                    samples.get(metric.name, [])):
+                lines.append('%s%s %s' % (
+                    name, _format_labels(labels), _format_value(value)
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _key(metric_name, name, labels):
+    return json.dumps([metric_name, name, labels], separators=(',', ':'))
+
+
+class Metric:
+    type = None
+    child_class = None
+
+    def __init__(self, name, documentation, labelnames=(),
+                 registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        """the metric for one combination of label values"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('expected labels %r' % (self.labelnames,))
+            child = self._children.setdefault(values, self.child_class(
+                self, list(zip(self.labelnames, values))
+            ))
+        return child
+
+    def expose(self, samples):
+        return sorted(samples)
+
+
+class CounterValue:
+    def __init__(self, metric, labels):
+        self.registry = metric.registry
+        self.key = _key(metric.name, metric.name + '_total', labels)
+
+    def inc(self, amount=1):
+        self.registry.inc(self.key, amount)
+
+
+class Counter(Metric):
+    type = 'counter'
+    child_class = CounterValue
+
+
+class GaugeValue:
+    def __init__(self, metric, labels):
+        self.registry = metric.registry
+        self.key = _key(metric.name, metric.name, labels)
+
+    def inc(self, amount=1):
+        self.registry.inc(self.key, amount)
+
+    def dec(self, amount=1):
+        self.registry.inc(self.key, -amount)
+
+
+class Gauge(Metric):
+    """
+        Value going up and down, summed over the processes like the
+        other metrics: each process only adds and subtracts its own
+        share, there is no set()
+    """
+    type = 'gauge'
+    child_class = GaugeValue
+
+
+class HistogramValue:
+    def __init__(self, metric, labels):
+        self.registry = metric.registry
+        self.buckets = metric.buckets
+        # counts are stored per bucket and made cumulative on export
+        self.bucket_keys = [
+            _key(metric.name, metric.name + '_bucket',
+                 labels + [('le', _format_value(bound))])
+            for bound in self.buckets
+        ]
+        self.sum_key = _key(metric.name, metric.name + '_sum', labels)
+        self.count_key = _key(metric.name, metric.name + '_count', labels)
+
+    def observe(self, value):
+        for bound, key in zip(self.buckets, self.bucket_keys):
+            if value <= bound:
+                self.registry.inc(key)
+                break
+        self.registry.inc(self.sum_key, value)
+        self.registry.inc(self.count_key)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    child_class = HistogramValue
+
+    def __init__(self, *args, buckets=DURATION_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+
+    def expose(self, samples):
+        bounds = [_format_value(bound) for bound in self.buckets]
+        series = {}
+        for name, labels, value in samples:
+            if name.endswith('_bucket'):
+                labels, le = labels[:-1], labels[-1][1]
+                series.setdefault(tuple(labels), {})[le] = value
+            else:
+                series.setdefault(tuple(labels), {})
+        exposed = []
+        for labels, counts in series.items():
+            cumulative = 0
+            for bound in bounds:
+                cumulative += counts.get(bound, 0)
+                exposed.append((
+                    self.name + '_bucket', list(labels) + [('le', bound)],
+                    cumulative
+                ))
+        exposed.extend(
+            sample for sample in samples if not sample[0].endswith('_bucket')
+        )
+        # buckets of a series stay in order, followed by _count and _sum
+        return sorted(exposed, key=lambda sample: (
+            sample[1][:len(self.labelnames)], sample[0]
+        ))
+
+
+requests = Counter(
+    'http_requests', 'HTTP requests by view, method and status code',
+    ['view', 'method', 'status']
+)
+request_duration = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by view',
+    ['view']
+)
+request_queries = Histogram(
+    'http_request_db_queries', 'SQL queries per HTTP request by view',
+    ['view'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, math.inf)
+)
+auth_failures = Counter(
+    'auth_failures', 'Rejected credentials and tokens by reason',
+    ['reason']
+)
+hash_queue_depth = Gauge(
+    'password_hash_queue_depth',
+    'Password hashing jobs queued or running'
+)
+hash_duration = Histogram(
+    'password_hash_duration_seconds',
+    'Password hashing job latency, queueing included, by operation',
+    ['operation']
+)
+hash_rejected = Counter(
+    'password_hash_rejected',
+    'Password hashing jobs rejected because the queue was full'
+)
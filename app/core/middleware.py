@@ -0,0 +1,299 @@
+import cProfile
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.cache import caches
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from core import instrumentation, metrics
+from core.db_routers import pop_pinned_credentials, set_read_only
+
+performance_logger = logging.getLogger('core.performance')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRoutingMiddleware:
+    """
+        Marks safe requests (GET, HEAD, OPTIONS) as read only, so that
+        core.db_routers.ReplicaRouter sends their queries to a replica.
+        After an unsafe request (POST, PATCH, ...) the client is pinned
+        to the primary for DATABASE_REPLICA_PIN_SECONDS, so it reads its
+        own writes despite replication lag:
+        - browsers through a cookie
+        - API clients, which often ignore cookies, through a cache entry
+          keyed by a hash of their Authorization header, and of the
+          credentials the request issued (see db_routers.pin_credentials)
+          as the client of a login has no Authorization header yet
+    """
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        set_read_only(
+            request.method in SAFE_METHODS and not self.is_pinned(request)
+        )
+        pop_pinned_credentials()
+        try:
+            response = self.get_response(request)
+        finally:
+            set_read_only(False)
+            issued = pop_pinned_credentials()
+
+        if request.method not in SAFE_METHODS:
+            self.pin(request, response, issued)
+        return response
+
+    @property
+    def cache(self):
+        return caches[settings.DATABASE_REPLICA_PIN_CACHE]
+
+    def cache_key(self, authorization):
+        if not authorization:
+            return None
+        digest = hashlib.sha1(authorization.encode()).hexdigest()
+        return 'pin_primary:%s' % digest
+
+    def is_pinned(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return True
+        if self.cookie_name in request.COOKIES:
+            return True
+        key = self.cache_key(request.META.get('HTTP_AUTHORIZATION'))
+        return key is not None and self.cache.get(key) is not None
+
+    def pin(self, request, response, issued=()):
+        if not settings.DATABASE_REPLICAS:
+            return
+        seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+        response.set_cookie(
+            self.cookie_name, '1', max_age=seconds, httponly=True
+        )
+        keys = [
+            self.cache_key(authorization) for authorization in
+            [request.META.get('HTTP_AUTHORIZATION')] + list(issued)
+        ]
+        keys = [key for key in keys if key is not None]
+        if keys:
+            self.cache.set_many(dict.fromkeys(keys, 1), seconds)
+
+
+class PerformanceMiddleware:
+    """
+        Measures every request and reports where the time went
+        - SQL query count and time, through connection.execute_wrapper
+        - password hashing, serializer validation and rendering time,
+          recorded by core.hashing and the user app's view mixins
+        - total time
+        as a Server-Timing header (shown by browser dev tools) and a
+        json log line on the 'core.performance' logger.
+        A PERFORMANCE['PROFILE_SAMPLE_RATE'] share of requests also runs
+        under cProfile, and the profile of the ones slower than
+        PROFILE_THRESHOLD_MS is written to PROFILE_DIR.
+    """
+    phases = ('db', 'hash', 'validate', 'render')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.PERFORMANCE
+        timings = instrumentation.start()
+        profiler = None
+        if random.random() < config['PROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        instrumentation.time_queries
+                    ))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            instrumentation.stop()
+        total = time.perf_counter() - started
+        timings.add('total', total)
+
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = self.server_timing(timings)
+        self.log(request, response, timings)
+        if profiler is not None and (
+                total * 1000 >= config['PROFILE_THRESHOLD_MS']):
+            self.dump_profile(request, profiler, total, config['PROFILE_DIR'])
+
+        return response
+
+    def server_timing(self, timings):
+        metrics = []
+        for name in self.phases + ('total',):
+            if name not in timings.counts:
+                continue
+            metric = '%s;dur=%.2f' % (name, timings.durations[name] * 1000)
+            if name == 'db':
+                metric += ';desc="%d queries"' % timings.counts['db']
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def log(self, request, response, timings):
+        if not performance_logger.isEnabledFor(logging.INFO):
+            return
+        match = request.resolver_match
+        performance_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': timings.counts['db'],
+            'ms': {
+                name: round(seconds * 1000, 2)
+                for name, seconds in timings.durations.items()
+            },
+        }))
+
+    def dump_profile(self, request, profiler, total, directory):
+        os.makedirs(directory, exist_ok=True)
+        filename = '%s-%s-%dms-%d.prof' % (
+            time.strftime('%Y%m%d%H%M%S'),
+            request.path.strip('/').replace('/', '_') or 'root',
+            total * 1000, os.getpid()
+        )
+        profiler.dump_stats(os.path.join(directory, filename))
+
+
+class MetricsMiddleware:
+    """
+        Counts requests by view name (user:create, user:token, ...),
+        method and status code, and records their latency and number
+        of SQL queries in core.metrics histograms.
+        Goes right after PerformanceMiddleware, whose timings provide
+        the query count.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS['ENABLED']:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.requests.labels(
+            view, request.method, response.status_code
+        ).inc()
+        metrics.request_duration.labels(view).observe(elapsed)
+        timings = instrumentation.current()
+        if timings is not None:
+            metrics.request_queries.labels(view).observe(
+                timings.counts['db']
+            )
+        return response
+
+
+class MiddlewareChain:
+    """middleware stack built like django's BaseHandler.load_middleware
+        but ending in the next middleware instead of the view
+    """
+
+    def __init__(self, middleware_paths, get_response):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = convert_exception_to_response(get_response)
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            try:
+                instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if instance is None:
+                raise ImproperlyConfigured(
+                    'Middleware factory %s returned None.' % middleware_path
+                )
+            if hasattr(instance, 'process_view'):
+                self.view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self.template_response_middleware.append(
+                    instance.process_template_response
+                )
+            if hasattr(instance, 'process_exception'):
+                self.exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self.handler = handler
+
+
+class PathMiddlewareDispatcher:
+    """
+        Runs a different middleware stack depending on the path
+        MIDDLEWARE_PROFILES is a list of (path prefix, middleware
+        paths), the first matching prefix wins. Token authenticated
+        /api/ routes skip sessions, CSRF, messages and clickjacking
+        protection, which they do not use, while /admin/ keeps them all.
+        The view, template response and exception hooks of the selected
+        stack are called from this middleware's own hooks, at its place
+        in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.profiles = [
+            (prefix, MiddlewareChain(middleware_paths, get_response))
+            for prefix, middleware_paths in settings.MIDDLEWARE_PROFILES
+        ]
+        self.default = MiddlewareChain([], get_response)
+
+    def get_chain(self, request):
+        chain = getattr(request, '_middleware_chain', None)
+        if chain is None:
+            chain = self.default
+            for prefix, candidate in self.profiles:
+                if request.path_info.startswith(prefix):
+                    chain = candidate
+                    break
+            request._middleware_chain = chain
+        return chain
+
+    def __call__(self, request):
+        return self.get_chain(request).handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in self.get_chain(request).view_middleware:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response:
+                return response
+
+    def process_template_response(self, request, response):
+        chain = self.get_chain(request)
+        for process_template_response in chain.template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        for process_exception in self.get_chain(request).exception_middleware:
+            response = process_exception(request, exception)
+            if response:
+                return response
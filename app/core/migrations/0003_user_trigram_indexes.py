@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The admin searches with icontains, which Django turns into
+# UPPER("email"::text) LIKE UPPER('%...%') on PostgreSQL, so the trigram
+# indexes are built on the same UPPER(...) expressions
+INDEXES = {
+    'core_user_email_trgm_idx': 'email',
+    'core_user_name_trgm_idx': 'name',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {} ON core_user '
+            'USING gin ((UPPER({}::text)) gin_trgm_ops)'.format(name, column)
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+# manage.py purge_tokens deletes expired tokens by their created date,
+# authtoken_token (from rest_framework.authtoken) has no index on it
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_user_token_version'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE INDEX IF NOT EXISTS authtoken_token_created_idx '
+             'ON authtoken_token (created)'],
+            ['DROP INDEX IF EXISTS authtoken_token_created_idx'],
+        ),
+    ]
@@ -0,0 +1,32 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+# tokens expire TOKEN_EXPIRY['TTL'] seconds after their created date
+# (see 0005 and user.tokens); the tokens issued before expiry existed
+# would all expire on deploy, they get a full TTL from now instead
+
+
+def grandfather_tokens(apps, schema_editor):
+    ttl = settings.TOKEN_EXPIRY['TTL']
+    if not ttl:
+        return
+    Token = apps.get_model('authtoken', 'Token')
+    now = timezone.now()
+    Token.objects.using(schema_editor.connection.alias).filter(
+        created__lt=now - datetime.timedelta(seconds=ttl)
+    ).update(created=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_user_updated_at'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.RunPython(grandfather_tokens, migrations.RunPython.noop),
+    ]
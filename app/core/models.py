@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 
+from core import hashing
+from core.signals import users_updated
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -11,7 +14,8 @@ class UserManager(BaseUserManager):
         if not email:
             raise ValueError("A user must have an email address!")
         user = self.model(email=self.normalize_email(email), **extra_fields)
-        user.set_password(password)
+        # hash through the hashing pool instead of user.set_password()
+        user.password = hashing.make_password(password)
         user.save(using=self._db)
 
         return user
@@ -36,9 +40,41 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # signed auth tokens carry the version they were issued for,
+    # bumping it revokes them all
+    token_version = models.PositiveIntegerField(default=0)
+    # moves on with every save, the ETag of /api/user/me/ is made of it
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = UserManager()
 
     # By default, USERNAME = USERNAME
     # Customize to equal 'email'
     USERNAME_FIELD = 'email'
+
+    def set_password(self, raw_password):
+        """changing the password also revokes the signed tokens"""
+        super().set_password(raw_password)
+        self.token_version += 1
+
+    def revoke_signed_tokens(self):
+        """revoke all signed tokens of the user with a single UPDATE
+        """
+        model = type(self)
+        model._default_manager.filter(pk=self.pk).update(
+            token_version=models.F('token_version') + 1
+        )
+        self.refresh_from_db(fields=['token_version'])
+        users_updated.send(sender=model, user_ids=[self.pk])
+
+    class Meta:
+        # indexes for the keyset paginated user list (user.views)
+        # prefix searches on email use the varchar_pattern_ops index
+        # PostgreSQL gets anyway for the unique email field
+        indexes = [
+            models.Index(fields=['name', 'id'], name='core_user_name_id_idx'),
+            models.Index(
+                fields=['is_active', 'is_staff', 'id'],
+                name='core_user_flags_id_idx'
+            ),
+        ]
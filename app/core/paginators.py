@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+        Paginator for big tables which avoids exact COUNT(*) queries
+        - unfiltered lists use the planner's row estimate from
+          pg_class.reltuples once the table is past the threshold
+        - filtered lists (search, list filters) count at most
+          threshold + 1 rows, so a broad search cannot scan the table
+        Both only affect the displayed total and the number of pages.
+    """
+
+    @property
+    def threshold(self):
+        return settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self.estimated_count(queryset)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+            return super().count
+
+        return queryset[:self.threshold + 1].count()
+
+    def estimated_count(self, queryset):
+        """row estimate of the table, None if it is not available
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 for tables that were never analyzed
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
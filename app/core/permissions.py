@@ -0,0 +1,135 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class PermissionCache:
+    """
+        Resolved permission sets ("app_label.codename" strings) of users,
+        in a django cache shared by the worker processes
+        Entries are stored with the global version and the user's
+        version they were computed for. Changes affecting a single user
+        replace the user's version; changes affecting many (group
+        permissions) replace the global version, which outdates every
+        entry at once. Both versions and the entry are fetched with a
+        single get_many() round trip.
+        get() also returns the versions seen before the permissions are
+        computed, for set(): a result computed while an invalidation
+        happened is stored under outdated versions, and never served.
+    """
+    key_prefix = 'perms:'
+
+    def __init__(self, alias='default', ttl=300):
+        self.alias = alias
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.PERMISSION_CACHE
+        return cls(alias=config['CACHE'], ttl=config['TTL'])
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def version_key(self):
+        return self.key_prefix + 'version'
+
+    def user_version_key(self, user_id):
+        return '%suser_version:%s' % (self.key_prefix, user_id)
+
+    def user_key(self, user_id):
+        return '%suser:%s' % (self.key_prefix, user_id)
+
+    def get(self, user_id):
+        """(cached permission set or None, versions to pass to set())
+        """
+        version_key = self.version_key
+        user_version_key = self.user_version_key(user_id)
+        user_key = self.user_key(user_id)
+        values = self.cache.get_many([version_key, user_version_key,
+                                      user_key])
+        version = values.get(version_key)
+        if version is None:
+            version = self.invalidate_all()
+        user_version = values.get(user_version_key)
+        if user_version is None:
+            user_version = self.invalidate_user(user_id)
+        versions = (version, user_version)
+        entry = values.get(user_key)
+        if entry is None or entry[0] != versions:
+            return None, versions
+        return entry[1], versions
+
+    def set(self, user_id, permissions, versions):
+        """store permissions computed after get() returned versions"""
+        self.cache.set(
+            self.user_key(user_id), (versions, set(permissions)), self.ttl
+        )
+
+    def invalidate_user(self, user_id):
+        """outdate the entry of a user, returns the user's new version
+        """
+        version = uuid.uuid4().hex
+        self.cache.set(self.user_version_key(user_id), version, self.ttl)
+        return version
+
+    def invalidate_all(self):
+        """outdate every entry, returns the new version
+            versions are random, so an evicted version key can never
+            bring old entries back to life
+        """
+        version = uuid.uuid4().hex
+        self.cache.set(self.version_key, version, None)
+        return version
+
+
+permission_cache = PermissionCache.from_settings()
+
+
+def user_permissions_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """m2m_changed receiver for User.groups and User.user_permissions
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # user.groups.add(...) / user.user_permissions.remove(...)
+        permission_cache.invalidate_user(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) / permission.user_set.remove(...)
+        for user_id in pk_set:
+            permission_cache.invalidate_user(user_id)
+    else:
+        # group.user_set.clear() does not tell which users it removed
+        permission_cache.invalidate_all()
+
+
+def group_permissions_changed(sender, action, **kwargs):
+    """m2m_changed receiver for Group.permissions, which may concern
+        any number of users
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        permission_cache.invalidate_all()
+
+
+def invalidate_all(sender, **kwargs):
+    """receiver for deleted groups and permissions"""
+    permission_cache.invalidate_all()
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """receiver for saved and deleted users, e.g. is_superuser changed
+    """
+    permission_cache.invalidate_user(instance.pk)
+
+
+def invalidate_updated_users(sender, user_ids, **kwargs):
+    """receiver for users changed by a bulk update"""
+    if user_ids is None:
+        permission_cache.invalidate_all()
+        return
+    for user_id in user_ids:
+        permission_cache.invalidate_user(user_id)
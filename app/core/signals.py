@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# sent after users were changed with queryset.update(), which does not
+# send post_save; user_ids is None when the changed users are not listed
+# (e.g. the bulk actions of core.admin.UserAdmin) and every cached user
+# has to be dropped
+users_updated = Signal(providing_args=['user_ids'])
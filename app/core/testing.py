@@ -0,0 +1,193 @@
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+# replica aliases mirroring the default test database, added by
+# TestRunner for the routing tests (core.tests.test_db_routers)
+TEST_REPLICAS = ('test_replica_1', 'test_replica_2')
+
+
+class Budget(namedtuple('Budget', ['queries', 'writes', 'seconds'])):
+    """
+        max SQL queries, max rows written (inserted, updated or
+        deleted) and max wall time of a request, None for no limit
+    """
+
+    def __new__(cls, queries=None, writes=None, seconds=None):
+        return super().__new__(cls, queries, writes, seconds)
+
+
+class Measurement:
+    """
+        Context manager counting the queries and written rows of all
+        database connections of the current thread, and the time spent
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.writes = 0
+        self.seconds = None
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        self.queries.append(sql)
+        if sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+            self.writes += max(context['cursor'].rowcount, 0)
+        return result
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._started
+        self._stack.close()
+
+    def violations(self, budget):
+        """descriptions of what exceeds the budget"""
+        violations = []
+        if budget.queries is not None and len(self.queries) > budget.queries:
+            violations.append('%d queries > %d:\n%s' % (
+                len(self.queries), budget.queries, '\n'.join(
+                    '%d. %s' % (i, sql)
+                    for i, sql in enumerate(self.queries, start=1)
+                )
+            ))
+        if budget.writes is not None and self.writes > budget.writes:
+            violations.append(
+                '%d rows written > %d' % (self.writes, budget.writes)
+            )
+        if budget.seconds is not None and self.seconds > budget.seconds:
+            violations.append(
+                '%.3fs > %.3fs' % (self.seconds, budget.seconds)
+            )
+        return violations
+
+
+class BudgetTestMixin:
+    """
+        TestCase mixin enforcing performance budgets
+        - budgets maps url names ('user:me') or methods and url names
+          ('PATCH user:me') to a Budget, measured on every test client
+          request to that endpoint; the requests over budget fail the
+          test when it ends, or earlier at assertWithinBudgets()
+        - assertBudget() checks a budget on a block of code
+        Passwords are hashed with budget_hashers, so that time budgets
+        measure our code rather than the production hasher's work factor.
+    """
+    budgets = {}
+    budget_hashers = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        hashers = override_settings(PASSWORD_HASHERS=self.budget_hashers)
+        hashers.enable()
+        self.addCleanup(hashers.disable)
+
+        self._measured = None
+        self._over_budget = []
+        # registered first, so it runs after the test's own cleanups
+        self.addCleanup(self.assertWithinBudgets)
+        request_started.connect(self._start_measurement)
+        request_finished.connect(self._check_measurement)
+        self.addCleanup(request_started.disconnect, self._start_measurement)
+        self.addCleanup(request_finished.disconnect, self._check_measurement)
+
+    def get_budget(self, method, path):
+        try:
+            view_name = resolve(path).view_name
+        except Resolver404:
+            return None, None
+        endpoint = '%s %s' % (method, view_name)
+        if endpoint in self.budgets:
+            return endpoint, self.budgets[endpoint]
+        return endpoint, self.budgets.get(view_name)
+
+    def _start_measurement(self, sender, environ, **kwargs):
+        endpoint, budget = self.get_budget(
+            environ['REQUEST_METHOD'], environ['PATH_INFO']
+        )
+        if budget is not None:
+            self._measured = (endpoint, budget, Measurement().__enter__())
+
+    def _check_measurement(self, sender, **kwargs):
+        if self._measured is None:
+            return
+        endpoint, budget, measurement = self._measured
+        self._measured = None
+        measurement.__exit__(None, None, None)
+        violations = measurement.violations(budget)
+        # raising here would skip the other request_finished receivers
+        # (close_old_connections), the failure is reported afterwards
+        if violations:
+            self._over_budget.append('%s over budget: %s' % (
+                endpoint, '; '.join(violations)
+            ))
+
+    def assertWithinBudgets(self):
+        """fail if a request since the last call was over its budget"""
+        over_budget, self._over_budget = self._over_budget, []
+        if over_budget:
+            raise self.failureException('\n'.join(over_budget))
+
+    @contextmanager
+    def assertBudget(self, queries=None, writes=None, seconds=None):
+        """fail if the block exceeds the budget"""
+        with Measurement() as measurement:
+            yield measurement
+        violations = measurement.violations(
+            Budget(queries, writes, seconds)
+        )
+        if violations:
+            raise self.failureException(
+                'over budget: %s' % '; '.join(violations)
+            )
+
+
+class TestRunner(DiscoverRunner):
+    """
+        Test runner giving every run a metrics directory of its own, so
+        that concurrent or successive runs do not add to each other's
+        counters in the shared METRICS['DIR']
+        It also adds the TEST_REPLICAS database aliases, separate
+        connections to the default test database, so that reads routed
+        to replicas really run on other connections.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_dir = tempfile.mkdtemp(prefix='test-metrics-')
+        self.metrics_settings = override_settings(
+            METRICS=dict(settings.METRICS, DIR=self.metrics_dir)
+        )
+        self.metrics_settings.enable()
+        # before the tests are loaded, they check for the aliases
+        default = connections.databases[DEFAULT_DB_ALIAS]
+        for alias in TEST_REPLICAS:
+            connections.databases.setdefault(alias, dict(
+                default, TEST={'MIRROR': DEFAULT_DB_ALIAS}
+            ))
+
+    def teardown_test_environment(self, **kwargs):
+        self.metrics_settings.disable()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+        for alias in TEST_REPLICAS:
+            connections[alias].close()
@@ -1,9 +1,32 @@
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
+from core.paginators import EstimatedCountPaginator
+from core.testing import Budget, BudgetTestMixin
 
-class AdminSiteTests(TestCase):
+ME_URL = reverse('user:me')
+
+
+# on PostgreSQL the changelist also reads the row estimate of the user
+# table (see EstimatedCountPaginator)
+ESTIMATE_QUERIES = 1 if connection.vendor == 'postgresql' else 0
+
+
+class AdminSiteTests(BudgetTestMixin, TestCase):
+    # changelist and actions must not grow with the number of users
+    budgets = {
+        'GET admin:core_user_changelist': Budget(
+            queries=5 + ESTIMATE_QUERIES, writes=0
+        ),
+        'POST admin:core_user_changelist': Budget(queries=7, writes=1),
+        'GET admin:core_user_change': Budget(queries=5, writes=0),
+        'GET admin:core_user_add': Budget(queries=7, writes=0),
+    }
 
     def setUp(self):
         """Create a super user and log him in
@@ -53,3 +76,55 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_search_users(self):
+        """Test that users can be searched by email and name
+        """
+        url = reverse('admin:core_user_changelist')
+        res = self.client.get(url, {'q': 'test us'})
+
+        self.assertContains(res, self.user.email)
+        self.assertNotContains(res, self.admin_user.email + '</a>')
+
+    def test_deactivate_users_action(self):
+        """Test that the bulk action updates users in a single UPDATE
+        """
+        url = reverse('admin:core_user_changelist')
+        payload = {
+            'action': 'deactivate_users',
+            '_selected_action': [self.user.id],
+        }
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(url, payload)
+
+        self.assertEqual(res.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_deactivate_users_drops_cached_tokens(self):
+        """users deactivated in bulk lose their cached tokens"""
+        token = Token.objects.create(user=self.user)
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(api.get(ME_URL).status_code, 200)
+
+        self.client.post(reverse('admin:core_user_changelist'), {
+            'action': 'deactivate_users',
+            '_selected_action': [self.user.id],
+        })
+
+        self.assertEqual(api.get(ME_URL).status_code, 401)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+    def test_filtered_count_capped(self):
+        """Test that filtered lists count at most threshold + 1 rows
+        """
+        get_user_model().objects.create_user('more@example.com', 'pass')
+        paginator = EstimatedCountPaginator(
+            get_user_model().objects.filter(is_active=True).order_by('id'), 1
+        )
+
+        # 3 active users, but counting stops at 2
+        self.assertEqual(paginator.count, 2)
@@ -0,0 +1,197 @@
+import json
+from io import StringIO
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from benchmarks import micro, runner
+from benchmarks.scenarios import SCENARIOS, Scenario
+from benchmarks.transports import ClientTransport, queries_from_header
+from user.renderers import FastJSONRenderer
+from user.views import CreateTokenView
+
+FIGURES = {
+    'requests': 10, 'throughput': 100.0, 'mean_ms': 10.0, 'p50_ms': 9.0,
+    'p95_ms': 15.0, 'p99_ms': 20.0, 'queries_per_request': 3.0,
+}
+
+
+def results(**changes):
+    return {'me_get': {'client': dict(FIGURES, **changes)}}
+
+
+class BenchmarkHelperTests(SimpleTestCase):
+    """Test the benchmark statistics and comparison"""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(runner.percentile(values, 50), 50)
+        self.assertEqual(runner.percentile(values, 99), 99)
+        self.assertEqual(runner.percentile([3.0], 95), 3.0)
+
+    def test_queries_from_header(self):
+        self.assertEqual(queries_from_header(
+            'db;dur=1.20;desc="4 queries", total;dur=5.00'
+        ), 4)
+        self.assertEqual(queries_from_header('total;dur=5.00'), 0)
+        self.assertIsNone(queries_from_header(None))
+
+    def test_compare_within_tolerance(self):
+        """small differences are not regressions"""
+        self.assertEqual(runner.compare(
+            results(p95_ms=17.0, throughput=90.0), results(), 0.2
+        ), [])
+
+    def test_compare_regressions(self):
+        """slower latency, lower throughput and extra queries regress"""
+        regressions = runner.compare(
+            results(p99_ms=30.0, throughput=50.0, queries_per_request=4.0),
+            results(), 0.2
+        )
+
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('me_get/client: p99_ms'))
+
+    @patch('benchmarks.runner.run')
+    def test_middleware_savings(self, run):
+        """the lean profile is compared with the full stack"""
+        run.side_effect = [results(), results(mean_ms=12.0, p50_ms=9.5)]
+
+        savings = runner.middleware_savings(['me_get'], ['client'])
+
+        self.assertEqual(
+            savings['me_get']['client']['saved_ms'],
+            {'mean_ms': 2.0, 'p50_ms': 0.5}
+        )
+        profiles = run.call_args[1]['MIDDLEWARE_PROFILES']
+        self.assertEqual([prefix for prefix, stack in profiles], ['/'])
+
+    def test_scenario_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Scenario()
+
+    def test_committed_baseline(self):
+        """the committed baseline covers every scenario and transport"""
+        path = os.path.join(
+            os.path.dirname(runner.__file__), 'baseline.json'
+        )
+        with open(path) as baseline:
+            figures = json.load(baseline)
+
+        self.assertEqual(set(figures), set(SCENARIOS))
+        for transports in figures.values():
+            self.assertEqual(set(transports), {'client', 'wsgi'})
+            # no figure depending on the machine
+            for base in transports.values():
+                self.assertEqual(set(base), {'queries_per_request'})
+
+    def test_compare_queries_only(self):
+        """a queries only baseline checks the queries alone"""
+        baseline = runner.queries_only(results())
+
+        self.assertEqual(runner.compare(
+            results(p99_ms=300.0, throughput=1.0), baseline, 0.2
+        ), [])
+        self.assertEqual(len(runner.compare(
+            results(queries_per_request=4.0), baseline, 0.2
+        )), 1)
+
+    def test_production_settings(self):
+        """DEBUG is off and views render with the JSON only renderers"""
+        with runner.production_settings():
+            self.assertFalse(settings.DEBUG)
+            self.assertEqual(
+                CreateTokenView.renderer_classes, [FastJSONRenderer]
+            )
+            self.assertEqual(APIView.renderer_classes, [FastJSONRenderer])
+            self.assertEqual(APIView.parser_classes, [JSONParser])
+
+        self.assertEqual(
+            APIView.renderer_classes, api_settings.DEFAULT_RENDERER_CLASSES
+        )
+
+    def test_compare_missing_baseline(self):
+        """scenarios missing from the baseline are skipped"""
+        self.assertEqual(runner.compare(results(), {}, 0.2), [])
+
+
+class ScenarioTests(TestCase):
+    """Test the scenarios through the test client"""
+
+    def test_scenarios(self):
+        """every scenario gets its expected responses"""
+        transport = ClientTransport()
+        for name, scenario in sorted(SCENARIOS.items()):
+            figures = runner.run_scenario(scenario(), transport, 3, 1)
+
+            self.assertEqual(figures['requests'], 3)
+            self.assertGreater(figures['throughput'], 0)
+            self.assertLessEqual(figures['p50_ms'], figures['p99_ms'])
+            self.assertIsNotNone(figures['queries_per_request'])
+
+
+@patch('core.management.commands.benchmark.Command.run')
+class BenchmarkCommandTests(SimpleTestCase):
+    """Test the benchmark command's baseline handling"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.baseline = os.path.join(self.directory, 'baseline.json')
+
+    def benchmark(self, *args):
+        call_command('benchmark', *args, stdout=StringIO())
+
+    def test_save_queries_only_baseline(self, run):
+        run.return_value = results()
+
+        self.benchmark('--baseline', self.baseline, '--save-baseline',
+                       '--queries-only')
+
+        with open(self.baseline) as baseline:
+            self.assertEqual(
+                json.load(baseline),
+                {'me_get': {'client': {'queries_per_request': 3.0}}}
+            )
+
+    def test_save_baseline(self, run):
+        run.return_value = results()
+
+        self.benchmark('--baseline', self.baseline, '--save-baseline')
+
+        with open(self.baseline) as baseline:
+            self.assertEqual(json.load(baseline), results())
+
+    def test_regression_fails(self, run):
+        with open(self.baseline, 'w') as baseline:
+            json.dump(results(), baseline)
+        run.return_value = results(p95_ms=30.0)
+
+        with self.assertRaises(CommandError):
+            self.benchmark('--baseline', self.baseline)
+
+        self.benchmark('--baseline', self.baseline, '--tolerance', '1.5')
+
+
+class MicroBenchmarkTests(TestCase):
+    """Test the serializer and renderer micro-benchmark"""
+
+    def test_run(self):
+        figures = micro.run(2)
+
+        self.assertEqual(
+            set(figures),
+            {'user_serializer', 'auth_token_serializer', 'render'}
+        )
+        for timings in figures.values():
+            self.assertEqual(set(timings), {'before', 'after'})
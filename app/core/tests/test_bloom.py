@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from core.bloom import BloomFilter, EmailFilter
+
+
+class BloomFilterTests(SimpleTestCase):
+    """Test the bloom filter"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = ['user%d@test.com' % i for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+    def test_false_positive_rate(self):
+        """false positives stay around error_rate at capacity"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add('user%d@test.com' % i)
+
+        false_positives = sum(
+            'other%d@test.com' % i in bloom for i in range(10000)
+        )
+
+        self.assertLess(false_positives, 300)
+
+
+class EmailFilterTests(TestCase):
+    """Test the filter of user emails"""
+
+    def setUp(self):
+        get_user_model().objects.create_user(
+            email='test@test.com', password='testpass'
+        )
+
+    def test_loaded_from_database(self):
+        emails = EmailFilter(capacity=100)
+
+        with self.assertNumQueries(1):
+            emails.load()
+        with self.assertNumQueries(0):
+            self.assertTrue(emails.might_exist('test@test.com'))
+            self.assertFalse(emails.might_exist('other@test.com'))
+
+        emails.add('other@test.com')
+        self.assertTrue(emails.might_exist('other@test.com'))
+
+    @patch('core.bloom.threading.Thread')
+    def test_loaded_in_background(self, thread):
+        """the first use starts the load instead of waiting for it"""
+        emails = EmailFilter(capacity=100)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(emails.might_exist('other@test.com'))
+            self.assertTrue(emails.might_exist('other@test.com'))
+
+        thread.return_value.start.assert_called_once_with()
+        self.assertEqual(thread.call_args[1]['target'], emails._load)
+
+    @patch('core.bloom.threading.Thread')
+    def test_saved_while_loading(self, thread):
+        """emails saved while the filter loads are kept"""
+        emails = EmailFilter(capacity=100)
+        emails.start_loading()
+
+        emails.add('new@test.com')
+        emails.load()
+
+        self.assertTrue(emails.might_exist('new@test.com'))
+        self.assertFalse(emails.might_exist('other@test.com'))
+
+    @patch('core.bloom.connections')
+    def test_failed_load_retried(self, connections):
+        """a failed background load is logged and retried on next use,
+            the thread closes its own connections
+        """
+        emails = EmailFilter(capacity=100)
+        emails._loading = True
+
+        with patch.object(emails, 'load', side_effect=Exception), \
+                self.assertLogs('core.bloom', 'ERROR'):
+            emails._load()
+
+        connections.close_all.assert_called_once_with()
+        self.assertFalse(emails._loading)
+
+    def test_over_capacity(self):
+        get_user_model().objects.create_user(
+            email='other@test.com', password='testpass'
+        )
+        emails = EmailFilter(capacity=1)
+
+        with self.assertLogs('core.bloom', 'WARNING'):
+            emails.load()
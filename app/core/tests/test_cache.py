@@ -0,0 +1,32 @@
+from django.test import SimpleTestCase
+
+from core.cache import LocalTTLCache
+
+
+class LocalTTLCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.cache = LocalTTLCache(
+            max_size=2, ttl=10, timer=lambda: self.now
+        )
+
+    def test_entry_expires_after_ttl(self):
+        """entries are returned until their ttl runs out"""
+        self.cache.set('key', 'value')
+        self.now = 9
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.now = 10
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_least_recently_used_evicted(self):
+        """the least recently used entry is dropped when full"""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        # touch 'a' so that 'b' becomes the least recently used
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
@@ -1,8 +1,25 @@
-from unittest.mock import patch
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
 
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.management.commands import import_users, wait_for_db
+from user import tokens
 
 
 class CommandsTestCase(TestCase):
@@ -14,20 +31,16 @@ class CommandsTestCase(TestCase):
             by simulating the behaviour of Django when
             db is available
         """
-        # Mock ConnectionHandler with Patch to \
-        # return True everytime the command is called
-        # The way to test if db is available in Django is by \
-        # retrieving the default db via the ConnectionHandler
-        # THe fucntion which is called when retrieving the db is __getitem__
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            # mocking/ overriding behaviour
-            gi.return_value = True
+        # Mock the probe, which runs a SELECT 1 on a database,
+        # to succeed right away for every configured database
+        with patch('core.management.commands.wait_for_db.probe') as probe:
+            probe.return_value = None
             call_command('wait_for_db')
-            # check if __getitem__ is called once
-            self.assertEqual(gi.call_count, 1)
+            # check that every database was probed once
+            self.assertEqual(probe.call_count, len(settings.DATABASES))
 
-    # The command will check if the ConnectionHandler raises an error
-    # if it does, it is going to wait a second and then try again
+    # The command will check if the probe raises an error
+    # if it does, it is going to wait a bit and then try again
     # to remove that delay, wrap the test in a @patch decorator
     # to not sleep for the test
     @patch('time.sleep', return_value=None)
@@ -37,8 +50,146 @@ class CommandsTestCase(TestCase):
             ts: from the patch decorator.
         """
         # make the patch return error for first five calls
-        # and return true on sixth call
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+        # and succeed on sixth call
+        with patch('core.management.commands.wait_for_db.probe') as probe:
+            probe.side_effect = [OperationalError] * 5 + [None]
+            call_command('wait_for_db', '--database', 'default')
+            self.assertEqual(probe.call_count, 6)
+            # the waits between attempts grow
+            self.assertEqual(ts.call_count, 5)
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_timeout(self, ts):
+        """Test wait_for_db gives up after the timeout"""
+        with patch('core.management.commands.wait_for_db.probe') as probe:
+            probe.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', '--timeout', '0')
+
+    def test_wait_for_db_probes_database(self):
+        """Test the probe runs a real query"""
+        with patch.object(connections['default'], 'close'):
+            wait_for_db.probe('default')
+
+    def test_import_users_requires_postgresql(self):
+        """import_users refuses to run on databases without COPY"""
+        with patch.object(connections['default'], 'vendor', 'sqlite'):
+            with self.assertRaises(CommandError):
+                call_command('import_users', 'users.csv')
+
+    def test_import_users_prepare_rows(self):
+        """rows are normalized, hashed and invalid rows are skipped"""
+        chunk = list(enumerate(import_users.read_csv(io.StringIO(
+            'email,name,password,is_staff\n'
+            'one@EXAMPLE.com,one,pass1,yes\n'
+            ',nobody,pass2,\n'
+        )), start=1))
+        records, invalid = import_users.Command().prepare(
+            chunk, None, {'prehashed': False}
+        )
+
+        self.assertEqual(invalid, 1)
+        line, email, name, encoded, is_active, is_staff = records[0]
+        self.assertEqual((line, email, name), (1, 'one@example.com', 'one'))
+        self.assertTrue(check_password('pass1', encoded))
+        self.assertEqual((is_active, is_staff), ('t', 't'))
+
+    def test_import_users_checkpoint(self):
+        """the checkpoint names the staging table of the run"""
+        command = import_users.Command()
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, 'users.csv.checkpoint')
+            self.assertEqual(command.read_checkpoint(checkpoint), (0, None))
+
+            command.write_checkpoint(checkpoint, 5000, 'core_user_import_1')
+            self.assertEqual(
+                command.read_checkpoint(checkpoint),
+                (5000, 'core_user_import_1')
+            )
+
+            # checkpoints without a table cannot be resumed
+            with open(checkpoint, 'w') as f:
+                json.dump({'staged': 5000}, f)
+            self.assertEqual(command.read_checkpoint(checkpoint), (0, None))
+
+    def test_import_users_update_invalidates(self):
+        """an updating merge drops every cached user, a merge which
+            only inserts keeps them
+        """
+        connection = MagicMock(alias='default')
+        connection.cursor.return_value.__enter__.return_value.rowcount = 2
+        command = import_users.Command(stdout=io.StringIO())
+
+        with patch.object(import_users, 'users_updated') as updated:
+            command.merge(connection, 'core_user_import_1', 'skip')
+            updated.send.assert_not_called()
+
+            command.merge(connection, 'core_user_import_1', 'update')
+            updated.send.assert_called_once_with(
+                sender=get_user_model(), user_ids=None
+            )
+
+    def test_export_users(self):
+        """export_users writes every user to the output file"""
+        get_user_model().objects.create_user('one@example.com', 'pass1')
+        get_user_model().objects.create_user('two@example.com', 'pass2')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'users.jsonl')
+            call_command('export_users', '--format', 'jsonl',
+                         '--output', path, '--chunk-size', '1')
+            with open(path) as f:
+                emails = [json.loads(line)['email'] for line in f]
+
+        self.assertEqual(emails, ['one@example.com', 'two@example.com'])
+
+    @override_settings(TOKEN_EXPIRY={'TTL': 3600, 'REFRESH_INTERVAL': 60})
+    @patch('core.management.commands.purge_tokens.time.sleep')
+    def test_purge_tokens(self, sleep):
+        """expired tokens are deleted in batches with a pause between"""
+        old = timezone.now() - datetime.timedelta(hours=2)
+        for i in range(4):
+            user = get_user_model().objects.create_user(
+                'user%d@test.com' % i, 'testpass'
+            )
+            Token.objects.create(user=user)
+        Token.objects.exclude(user__email='user0@test.com').update(
+            created=old
+        )
+
+        out = io.StringIO()
+        call_command('purge_tokens', '--batch-size', '2', stdout=out)
+
+        self.assertEqual(
+            list(Token.objects.values_list('user__email', flat=True)),
+            ['user0@test.com']
+        )
+        self.assertEqual(sleep.call_count, 1)
+        self.assertIn('Deleted 3 expired tokens', out.getvalue())
+
+    @override_settings(TOKEN_EXPIRY={'TTL': 0, 'REFRESH_INTERVAL': 60})
+    def test_purge_tokens_without_expiry(self):
+        with self.assertRaises(CommandError):
+            call_command('purge_tokens')
+
+
+class GrandfatherTokensMigrationTests(TestCase):
+    """Test that deploying token expiry does not expire old tokens"""
+
+    @override_settings(TOKEN_EXPIRY={'TTL': 3600, 'REFRESH_INTERVAL': 60})
+    def test_old_tokens_get_a_full_ttl(self):
+        migration = importlib.import_module(
+            'core.migrations.0007_grandfather_tokens'
+        )
+        user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass'
+        )
+        token = Token.objects.create(user=user)
+        Token.objects.filter(pk=token.pk).update(
+            created=timezone.now() - datetime.timedelta(days=30)
+        )
+
+        migration.grandfather_tokens(apps, connection.schema_editor())
+
+        token.refresh_from_db()
+        self.assertFalse(tokens.is_expired(token))
@@ -0,0 +1,234 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.db.utils import OperationalError
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, \
+    override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import db_routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.testing import TEST_REPLICAS
+from user.authentication import token_cache
+
+ME_URL = reverse('user:me')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReplicaRouterTests(TestCase):
+    """Test read routing between the primary and two replica aliases"""
+
+    def setUp(self):
+        self.router = db_routers.ReplicaRouter()
+        self.model = get_user_model()
+        db_routers.replica_health.reset()
+        self.addCleanup(db_routers.set_read_only, False)
+
+    def test_reads_use_primary_outside_read_only_requests(self):
+        """reads go to default unless the request is read only"""
+        self.assertEqual(self.router.db_for_read(self.model), 'default')
+        self.assertEqual(self.router.db_for_write(self.model), 'default')
+
+    @patch.object(db_routers.ReplicaHealth, 'check', return_value=True)
+    def test_read_only_reads_use_replicas(self, check):
+        """read only requests read from the replicas"""
+        db_routers.set_read_only(True)
+
+        aliases = {self.router.db_for_read(self.model) for i in range(50)}
+        self.assertEqual(aliases, {'replica_1', 'replica_2'})
+        self.assertEqual(self.router.db_for_write(self.model), 'default')
+        # health checks are cached between requests
+        self.assertEqual(check.call_count, 2)
+
+    def test_unhealthy_replica_skipped(self):
+        """reads fall back to the healthy replica, then the primary"""
+        db_routers.set_read_only(True)
+        health = {'replica_1': False, 'replica_2': True}
+        with patch.object(db_routers.ReplicaHealth, 'check',
+                          side_effect=health.get):
+            self.assertEqual(self.router.db_for_read(self.model), 'replica_2')
+
+        db_routers.replica_health.reset()
+        with patch.object(db_routers.ReplicaHealth, 'check',
+                          return_value=False):
+            self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    def test_replicas_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'core'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingMiddlewareTests(TestCase):
+    """Test that writes pin clients to the primary"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+        def view(request):
+            self.seen.append(db_routers.is_read_only())
+            return HttpResponse()
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def test_get_is_read_only(self):
+        self.middleware(self.factory.get('/api/user/me/'))
+
+        self.assertEqual(self.seen, [True])
+        self.assertFalse(db_routers.is_read_only())
+
+    def test_write_pins_client(self):
+        """after a POST the same client reads from the primary"""
+        auth = {'HTTP_AUTHORIZATION': 'Token abc'}
+        response = self.middleware(self.factory.post('/api/user/me/', **auth))
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+        # an API client ignoring the cookie is pinned by its token
+        self.middleware(self.factory.get('/api/user/me/', **auth))
+        # a browser sends the cookie back
+        request = self.factory.get('/api/user/me/')
+        request.COOKIES[ReplicaRoutingMiddleware.cookie_name] = '1'
+        self.middleware(request)
+        # other clients still read from the replicas
+        self.middleware(self.factory.get('/api/user/me/'))
+
+        self.assertEqual(self.seen, [False, False, False, True])
+
+    def test_issued_credentials_pinned(self):
+        """credentials issued by a write pin the client using them"""
+        def login(request):
+            db_routers.pin_credentials('Token new')
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(login)(self.factory.post('/api/user/token/'))
+        self.middleware(self.factory.get(
+            '/api/user/me/', HTTP_AUTHORIZATION='Token new'
+        ))
+
+        self.assertEqual(self.seen, [False])
+        self.assertEqual(db_routers.pop_pinned_credentials(), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class LoginPinTests(TestCase):
+    """Test that a login pins the issued token to the primary"""
+
+    def setUp(self):
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email='test@test.com', password='testpass'
+        )
+        self.middleware = ReplicaRoutingMiddleware(None)
+
+    def assertPinned(self, authorization):
+        request = RequestFactory().get(
+            '/api/user/me/', HTTP_AUTHORIZATION=authorization
+        )
+        self.assertTrue(self.middleware.is_pinned(request))
+
+    def test_token_pinned(self):
+        """the first GET /me/ with a new token reads from the primary"""
+        res = self.client.post(reverse('user:token'), {
+            'email': 'test@test.com', 'password': 'testpass',
+        })
+
+        self.assertPinned('Token ' + res.data['token'])
+
+    def test_signed_token_pinned(self):
+        res = self.client.post(reverse('user:token'), {
+            'email': 'test@test.com', 'password': 'testpass',
+            'token_type': 'signed',
+        })
+
+        self.assertPinned('Bearer ' + res.data['token'])
+
+
+@skipUnless(set(TEST_REPLICAS) <= set(connections.databases),
+            'needs the replica aliases of core.testing.TestRunner')
+@override_settings(DATABASE_REPLICAS=list(TEST_REPLICAS))
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Test the routing through two replica aliases, separate
+        connections mirroring the test database
+    """
+    multi_db = True
+
+    def setUp(self):
+        db_routers.replica_health.reset()
+        token_cache.clear()
+        caches[settings.DATABASE_REPLICA_PIN_CACHE].clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com', password='testpass'
+        )
+        self.client = APIClient()
+
+    def capture(self):
+        """query logs of the primary and of each replica"""
+        return {
+            alias: CaptureQueriesContext(connections[alias])
+            for alias in ('default',) + TEST_REPLICAS
+        }
+
+    def get_me(self, token):
+        """GET /me/ with a token, returns the aliases which ran the
+            authentication query
+        """
+        token_cache.clear()
+        captured = self.capture()
+        for context in captured.values():
+            context.__enter__()
+        try:
+            res = self.client.get(
+                ME_URL, HTTP_AUTHORIZATION='Token ' + token
+            )
+        finally:
+            for context in captured.values():
+                context.__exit__(None, None, None)
+        self.assertEqual(res.status_code, 200)
+        return {
+            alias for alias, context in captured.items()
+            if any('authtoken_token' in query['sql'] for query in context)
+        }
+
+    def test_reads_routed_to_replicas(self):
+        """the reads of a GET run on the replica connections"""
+        token = Token.objects.create(user=self.user).key
+
+        aliases = set()
+        for i in range(20):
+            aliases |= self.get_me(token)
+
+        self.assertEqual(aliases, set(TEST_REPLICAS))
+
+    def test_pinned_after_write(self):
+        """after a login (POST) the client reads from the primary"""
+        res = self.client.post(reverse('user:token'), {
+            'email': 'test@test.com', 'password': 'testpass',
+        })
+
+        for i in range(5):
+            self.assertEqual(self.get_me(res.data['token']), {'default'})
+
+    def test_replica_down(self):
+        """reads fall back to the other replica, then to the primary"""
+        token = Token.objects.create(user=self.user).key
+        down = OperationalError('replica is down')
+
+        with patch.object(connections['test_replica_1'], 'cursor',
+                          side_effect=down):
+            for i in range(5):
+                self.assertEqual(self.get_me(token), {'test_replica_2'})
+
+        db_routers.replica_health.reset()
+        with patch.object(connections['test_replica_1'], 'cursor',
+                          side_effect=down), \
+                patch.object(connections['test_replica_2'], 'cursor',
+                             side_effect=down):
+            self.assertEqual(self.get_me(token), {'default'})
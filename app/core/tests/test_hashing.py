@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth.hashers import check_password
+from django.test import SimpleTestCase
+
+from core.hashing import HashingBusy, HashingExecutor
+
+
+class HashingExecutorTests(SimpleTestCase):
+
+    def test_inline_hash_and_verify(self):
+        """without workers passwords are hashed on the calling thread"""
+        executor = HashingExecutor(workers=0, max_queue=4)
+        encoded = executor.make_password('testpass')
+
+        self.assertTrue(check_password('testpass', encoded))
+        self.assertEqual(
+            executor.check_password('testpass', encoded), (True, False)
+        )
+        self.assertEqual(
+            executor.check_password('wrongpass', encoded), (False, False)
+        )
+        stats = executor.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_process_pool_hash(self):
+        """passwords hashed in the process pool are valid"""
+        executor = HashingExecutor(workers=1, max_queue=4, timeout=30)
+        self.addCleanup(executor.shutdown)
+
+        encoded = executor.make_password('testpass')
+        hashes = executor.make_passwords(['pass1', 'pass2'])
+
+        self.assertTrue(check_password('testpass', encoded))
+        self.assertTrue(check_password('pass1', hashes[0]))
+        self.assertTrue(check_password('pass2', hashes[1]))
+
+    def test_saturated_executor_fails_fast(self):
+        """jobs beyond max_queue raise HashingBusy instead of waiting"""
+        executor = HashingExecutor(workers=0, max_queue=1)
+        # occupy the only slot as a concurrent request would
+        executor._acquire()
+
+        with self.assertRaises(HashingBusy):
+            executor.make_password('testpass')
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_timed_out_job_keeps_its_slot(self):
+        """a job still running after its wait timed out is counted"""
+        executor = HashingExecutor(workers=1, max_queue=1, timeout=0.05)
+        self.addCleanup(executor.shutdown)
+        # start the worker process
+        executor.make_password('testpass')
+
+        with self.assertRaises(HashingBusy):
+            executor._run('make', time.sleep, 1)
+
+        self.assertEqual(executor.stats()['queue_depth'], 1)
+        with self.assertRaises(HashingBusy):
+            executor.make_password('testpass')
+        executor.shutdown()
+        self.assertEqual(executor.stats()['queue_depth'], 0)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import instrumentation, views
+
+TOKEN_URL = reverse('user:token')
+
+
+def performance(**options):
+    return override_settings(PERFORMANCE=dict(settings.PERFORMANCE, **options))
+
+
+class InstrumentationTests(TestCase):
+    """Test the timing helpers"""
+
+    def test_record_outside_request(self):
+        """recording without a started request does nothing"""
+        instrumentation.record('db', 1.0)
+        with instrumentation.timer('render'):
+            pass
+
+        self.assertIsNone(instrumentation.current())
+
+    def test_timer(self):
+        """timed blocks add up per phase"""
+        timings = instrumentation.start()
+        self.addCleanup(instrumentation.stop)
+        with instrumentation.timer('render'):
+            pass
+        with instrumentation.timer('render'):
+            pass
+
+        self.assertEqual(timings.counts['render'], 2)
+        self.assertGreater(timings.durations['render'], 0)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Test the Server-Timing header and sampled profiling"""
+
+    def setUp(self):
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email='test@londonappdev.com', password='testpass'
+        )
+
+    def timing(self, res):
+        return dict(
+            (metric.split(';')[0], metric)
+            for metric in res['Server-Timing'].split(', ')
+        )
+
+    def test_server_timing(self):
+        """phases of a login show up in the header"""
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@londonappdev.com', 'password': 'testpass'
+        })
+
+        timing = self.timing(res)
+        self.assertEqual(
+            set(timing), {'db', 'hash', 'validate', 'render', 'total'}
+        )
+
+    def test_query_count(self):
+        """the db metric reports the number of queries"""
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('healthz'))
+        self.assertNotIn('db', self.timing(res))
+
+        views._results.clear()
+        self.addCleanup(views._results.clear)
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(reverse('readyz'))
+        queries = len(context.captured_queries)
+        self.assertGreater(queries, 0)
+        self.assertIn('"%d queries"' % queries, self.timing(res)['db'])
+
+    @performance(SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        """the header can be turned off"""
+        res = self.client.get(reverse('healthz'))
+
+        self.assertFalse(res.has_header('Server-Timing'))
+
+    def test_profile_written(self):
+        """sampled requests slower than the threshold are profiled"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        with performance(PROFILE_SAMPLE_RATE=1, PROFILE_THRESHOLD_MS=0,
+                         PROFILE_DIR=directory):
+            self.client.get(reverse('healthz'))
+
+        files = os.listdir(directory)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.prof'))
@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.hashing import HashingBusy, HashingExecutor
+
+TOKEN_URL = reverse('user:token')
+ME_URL = reverse('user:me')
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(METRICS={
+            'ENABLED': True, 'DIR': self.directory,
+            'ALLOWED_IPS': ['127.0.0.1'], 'TOKEN': 'scraper',
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def render(self):
+        return metrics.registry.render().splitlines()
+
+
+class ValuesFileTests(MetricsTestCase):
+    """Test the memory-mapped values files"""
+
+    def test_values_persist(self):
+        """values are read back from the file, also when reopened"""
+        path = os.path.join(self.directory, 'test.db')
+        values = metrics.ValuesFile(path)
+        values.inc('a', 2)
+        values.inc('b', 0.5)
+        values.inc('a')
+        values.close()
+
+        values = metrics.ValuesFile(path)
+        values.inc('b')
+        values.close()
+
+        self.assertEqual(
+            dict(metrics.read_values(path)), {'a': 3.0, 'b': 1.5}
+        )
+
+    def test_file_grows(self):
+        """the file is extended when the keys do not fit"""
+        path = os.path.join(self.directory, 'test.db')
+        values = metrics.ValuesFile(path)
+        keys = ['key-%d-%s' % (i, 'x' * 100) for i in range(1000)]
+        for key in keys:
+            values.inc(key)
+        values.close()
+
+        self.assertGreater(os.path.getsize(path), metrics.INITIAL_SIZE)
+        self.assertEqual(dict(metrics.read_values(path)),
+                         dict.fromkeys(keys, 1.0))
+
+    def test_processes_aggregated(self):
+        """the files of all processes are summed"""
+        counter = metrics.requests.labels('user:me', 'GET', 200)
+        counter.inc()
+        other = metrics.ValuesFile(os.path.join(self.directory, '1.db'))
+        other.inc(counter.key, 2)
+        other.close()
+
+        self.assertIn(
+            'http_requests_total{view="user:me",method="GET",status="200"} 3',
+            self.render()
+        )
+
+
+class HistogramTests(MetricsTestCase):
+    """Test histogram exposition"""
+
+    def test_cumulative_buckets(self):
+        histogram = metrics.request_queries.labels('user:me')
+        for value in (0, 1, 4, 100):
+            histogram.observe(value)
+
+        lines = self.render()
+        for bound, count in (('0', 1), ('1', 2), ('3', 2), ('5', 3),
+                             ('50', 3), ('+Inf', 4)):
+            self.assertIn(
+                'http_request_db_queries_bucket'
+                '{view="user:me",le="%s"} %d' % (bound, count), lines
+            )
+        self.assertIn('http_request_db_queries_count{view="user:me"} 4',
+                      lines)
+        self.assertIn('http_request_db_queries_sum{view="user:me"} 105',
+                      lines)
+
+
+class HashingMetricsTests(MetricsTestCase):
+    """Test the metrics of the password hashing executor"""
+
+    def test_queue_depth_and_latency(self):
+        executor = HashingExecutor(workers=0, max_queue=1)
+        executor.make_password('testpass')
+        executor._acquire()
+
+        with self.assertRaises(HashingBusy):
+            executor.make_password('testpass')
+
+        lines = self.render()
+        self.assertIn('password_hash_queue_depth 1', lines)
+        self.assertIn(
+            'password_hash_duration_seconds_count{operation="make"} 1', lines
+        )
+        self.assertIn('password_hash_rejected_total 1', lines)
+
+
+class MetricsEndpointTests(MetricsTestCase):
+    """Test request metrics and the /metrics endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        get_user_model().objects.create_user(
+            email='test@londonappdev.com', password='testpass'
+        )
+
+    def test_request_metrics(self):
+        """requests are counted by view name and status"""
+        self.client.post(TOKEN_URL, {
+            'email': 'test@londonappdev.com', 'password': 'testpass'
+        })
+        self.client.post(TOKEN_URL, {
+            'email': 'test@londonappdev.com', 'password': 'wrong'
+        })
+        self.client.get(ME_URL)
+
+        res = self.client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        lines = res.content.decode().splitlines()
+        for line in (
+                'http_requests_total'
+                '{view="user:token",method="POST",status="200"} 1',
+                'http_requests_total'
+                '{view="user:token",method="POST",status="400"} 1',
+                'http_requests_total'
+                '{view="user:me",method="GET",status="401"} 1',
+                'http_request_duration_seconds_count{view="user:token"} 2',
+                'auth_failures_total{reason="invalid_credentials"} 1',
+                'auth_failures_total{reason="not_authenticated"} 1',
+                '# TYPE http_request_duration_seconds histogram'):
+            self.assertIn(line, lines)
+
+    def test_disabled(self):
+        """nothing is written when metrics are disabled"""
+        # the user of setUp was hashed with metrics enabled
+        collected = metrics.registry.collect()
+        with override_settings(
+                METRICS={'ENABLED': False, 'DIR': self.directory}):
+            self.client.get(ME_URL)
+
+        self.assertEqual(metrics.registry.collect(), collected)
+
+
+class MetricsAccessTests(MetricsTestCase):
+    """Test who may read /metrics"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient(REMOTE_ADDR='10.0.0.1')
+
+    def test_forbidden(self):
+        """clients from other addresses are refused"""
+        res = self.client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scraper')
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_staff(self):
+        staff = get_user_model().objects.create_superuser(
+            email='admin@londonappdev.com', password='testpass'
+        )
+        self.client.force_login(staff)
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_disabled(self):
+        with override_settings(METRICS={
+                'ENABLED': False, 'DIR': self.directory}):
+            res = self.client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 404)
+
+
+class TestRunnerTests(SimpleTestCase):
+    """Test the project's test runner"""
+
+    def test_metrics_dir_of_the_run(self):
+        """tests do not write to the shared metrics directory"""
+        self.assertTrue(os.path.basename(
+            settings.METRICS['DIR']).startswith('test-metrics-'))
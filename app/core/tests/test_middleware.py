@@ -0,0 +1,39 @@
+from django.test import Client, TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+
+class PathMiddlewareDispatcherTests(TestCase):
+    """Test the per-path middleware profiles"""
+
+    def test_api_lean_stack(self):
+        """API requests skip sessions and clickjacking protection"""
+        res = APIClient().get(reverse('user:me'))
+
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertFalse(res.has_header('X-Frame-Options'))
+
+    def test_admin_full_stack(self):
+        """admin requests keep the full stack"""
+        res = Client().get(reverse('admin:login'))
+
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertTrue(hasattr(res.wsgi_request, 'user'))
+        self.assertEqual(res['X-Frame-Options'], 'SAMEORIGIN')
+
+    def test_admin_csrf_enforced(self):
+        """view hooks of the selected stack (CSRF) still run"""
+        client = Client(enforce_csrf_checks=True)
+
+        res = client.post(reverse('admin:login'), {
+            'username': 'admin@example.com', 'password': 'admin'
+        })
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_api_common_middleware(self):
+        """the API profile keeps CommonMiddleware's slash redirect"""
+        res = APIClient().get('/api/user/me')
+
+        self.assertEqual(res.status_code, 301)
+        self.assertEqual(res.url, '/api/user/me/')
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase
+
+from core.permissions import permission_cache
+
+
+class CachedPermissionBackendTests(TestCase):
+    """Test that permission checks are served from the cache"""
+
+    def setUp(self):
+        permission_cache.cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com', password='testpass'
+        )
+        self.group = Group.objects.create(name='editors')
+        self.view_user = Permission.objects.get(codename='view_user')
+        self.change_user = Permission.objects.get(codename='change_user')
+        self.user.user_permissions.add(self.view_user)
+        self.user.groups.add(self.group)
+        self.group.permissions.add(self.change_user)
+
+    def fresh_user(self):
+        """a new instance, without the per-instance memoization"""
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def test_permissions_cached(self):
+        """only the first check of a user runs the permission joins"""
+        user = self.fresh_user()
+        self.assertTrue(user.has_perm('core.view_user'))
+        self.assertTrue(user.has_perm('core.change_user'))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                user.get_all_permissions(),
+                {'core.view_user', 'core.change_user'}
+            )
+
+    def test_user_permission_removed(self):
+        self.fresh_user().has_perm('core.view_user')
+
+        self.user.user_permissions.remove(self.view_user)
+
+        self.assertFalse(self.fresh_user().has_perm('core.view_user'))
+
+    def test_group_membership_removed(self):
+        self.fresh_user().has_perm('core.change_user')
+
+        self.group.user_set.remove(self.user)
+
+        self.assertFalse(self.fresh_user().has_perm('core.change_user'))
+
+    def test_group_cleared(self):
+        """clearing a group's users outdates every cached entry"""
+        self.fresh_user().has_perm('core.change_user')
+
+        self.group.user_set.clear()
+
+        self.assertFalse(self.fresh_user().has_perm('core.change_user'))
+
+    def test_group_permission_added(self):
+        delete_user = Permission.objects.get(codename='delete_user')
+        self.fresh_user().has_perm('core.delete_user')
+
+        self.group.permissions.add(delete_user)
+
+        self.assertTrue(self.fresh_user().has_perm('core.delete_user'))
+
+    def test_group_deleted(self):
+        self.fresh_user().has_perm('core.change_user')
+
+        self.group.delete()
+
+        self.assertFalse(self.fresh_user().has_perm('core.change_user'))
+
+    def test_version_evicted(self):
+        """losing the version key outdates every entry"""
+        self.fresh_user().has_perm('core.view_user')
+        permission_cache.cache.delete(permission_cache.version_key)
+
+        self.assertIsNone(permission_cache.get(self.user.pk)[0])
+
+    def test_invalidated_while_computing(self):
+        """a result computed during an invalidation is never served"""
+        perms, versions = permission_cache.get(self.user.pk)
+        # the permissions change while the old ones are computed
+        self.user.user_permissions.remove(self.view_user)
+        permission_cache.set(self.user.pk, {'core.view_user'}, versions)
+
+        self.assertFalse(self.fresh_user().has_perm('core.view_user'))
+
+    def test_group_changed_while_computing(self):
+        perms, versions = permission_cache.get(self.user.pk)
+        self.group.permissions.remove(self.change_user)
+        permission_cache.set(self.user.pk, {'core.change_user'}, versions)
+
+        self.assertFalse(self.fresh_user().has_perm('core.change_user'))
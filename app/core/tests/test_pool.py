@@ -0,0 +1,177 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from psycopg2 import extensions
+
+from core.db.backends.postgresql_pool import base
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    isolation_level = extensions.ISOLATION_LEVEL_READ_COMMITTED
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.opened = []
+        self.healthy = True
+
+    def connect(self):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('max_size', 2)
+        return ConnectionPool(
+            connect=self.connect,
+            check=lambda connection, idle: self.healthy,
+            timer=lambda: self.now,
+            **kwargs
+        )
+
+    def test_connections_reused(self):
+        """a released connection is handed out again"""
+        pool = self.make_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(), connection)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['reused']), (1, 1))
+
+    def test_pool_bounded(self):
+        """acquire() times out when max_size connections are in use"""
+        pool = self.make_pool(timeout=0)
+        pool.acquire()
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_idle_and_old_connections_closed(self):
+        """connections past max_idle or max_lifetime are replaced"""
+        pool = self.make_pool(max_idle=10, max_lifetime=100)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.now = 10
+
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+
+        self.now = 110
+        pool.release(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_unhealthy_connection_replaced(self):
+        """connections failing the checkout check are not handed out"""
+        pool = self.make_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.healthy = False
+
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['failed_checks'], 1)
+
+
+class PooledDatabaseWrapperTests(SimpleTestCase):
+    """Test the pooled backend against fake psycopg2 connections"""
+
+    def setUp(self):
+        self.opened = []
+        connect = patch.object(base.Database, 'connect', self.connect)
+        connect.start()
+        self.addCleanup(connect.stop)
+        self.addCleanup(base.close_pools, 'pooled')
+
+    def connect(self, **params):
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def make_wrapper(self):
+        return base.DatabaseWrapper({
+            'NAME': 'app', 'USER': 'postgres', 'PASSWORD': '', 'HOST': 'db',
+            'PORT': '', 'OPTIONS': {}, 'POOL': {'MAX_SIZE': 2},
+        }, alias='pooled')
+
+    def checkout(self, wrapper):
+        wrapper.connection = wrapper.get_new_connection(
+            wrapper.get_connection_params()
+        )
+        return wrapper.connection
+
+    def test_connection_reused(self):
+        """closing gives the connection back to the pool"""
+        wrapper = self.make_wrapper()
+        connection = self.checkout(wrapper)
+        wrapper._close()
+
+        self.assertIs(self.checkout(self.make_wrapper()), connection)
+        self.assertFalse(connection.closed)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_open_transaction_rolled_back(self):
+        wrapper = self.make_wrapper()
+        connection = self.checkout(wrapper)
+        connection.status = extensions.TRANSACTION_STATUS_INTRANS
+        wrapper._close()
+
+        self.assertEqual(
+            connection.status, extensions.TRANSACTION_STATUS_IDLE
+        )
+        self.assertIs(self.checkout(self.make_wrapper()), connection)
+
+    def test_closed_in_atomic_block_discarded(self):
+        """a connection still referenced by an atomic block is closed"""
+        wrapper = self.make_wrapper()
+        connection = self.checkout(wrapper)
+        wrapper.in_atomic_block = True
+        wrapper._close()
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.checkout(self.make_wrapper()), connection)
+
+    def test_close_pools(self):
+        """idle connections are really closed, e.g. at exit"""
+        wrapper = self.make_wrapper()
+        connection = self.checkout(wrapper)
+        wrapper._close()
+
+        base.close_pools('pooled')
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(base.pool_stats(), {})
+
+    @patch('django.db.backends.postgresql.creation.DatabaseCreation.'
+           '_destroy_test_db')
+    def test_pools_closed_before_dropping_test_database(self, destroy):
+        """DROP DATABASE fails while pooled connections are open"""
+        wrapper = self.make_wrapper()
+        connection = self.checkout(wrapper)
+
+        wrapper.creation._destroy_test_db('test_app', 0)
+
+        self.assertTrue(connection.closed)
+        destroy.assert_called_once_with('test_app', 0)
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.testing import Budget, BudgetTestMixin
+
+CREATE_USER_URL = reverse('user:create')
+
+
+class BudgetTestMixinTests(BudgetTestMixin, TestCase):
+    """Test the enforcement of performance budgets"""
+    budgets = {
+        'POST user:create': Budget(queries=1),
+        'user:me': Budget(seconds=0),
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_request_over_budget(self):
+        """a request exceeding its endpoint's budget fails the test"""
+        self.client.post(CREATE_USER_URL, {
+            'email': 'test@test.com',
+            'password': 'testpass',
+            'name': 'test',
+        })
+
+        with self.assertRaisesRegex(AssertionError, 'POST user:create'):
+            self.assertWithinBudgets()
+
+    def test_request_within_budget(self):
+        """a failed validation stays within the budget"""
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'test@test.com', 'password': 'tp'
+        })
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_budget_by_url_name(self):
+        """budgets without a method apply to all methods"""
+        self.client.get(reverse('user:me'))
+
+        with self.assertRaisesRegex(AssertionError, 'GET user:me'):
+            self.assertWithinBudgets()
+
+    def test_other_receivers_run(self):
+        """a request over budget does not break request_finished"""
+        finished = []
+
+        def receiver(sender, **kwargs):
+            finished.append(sender)
+        request_finished.connect(receiver)
+        self.addCleanup(request_finished.disconnect, receiver)
+
+        self.client.get(reverse('user:me'))
+
+        self.assertEqual(len(finished), 1)
+        with self.assertRaises(AssertionError):
+            self.assertWithinBudgets()
+
+    def test_assert_budget_writes(self):
+        """assertBudget counts rows written"""
+        get_user_model().objects.create_user('a@test.com', 'testpass')
+        get_user_model().objects.create_user('b@test.com', 'testpass')
+
+        with self.assertBudget(queries=1, writes=2) as measurement:
+            get_user_model().objects.update(name='new name')
+        self.assertEqual(measurement.writes, 2)
+
+        with self.assertRaisesRegex(AssertionError, '2 rows written > 1'):
+            with self.assertBudget(writes=1):
+                get_user_model().objects.update(name='other name')
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core import views
+
+
+class HealthCheckTests(TestCase):
+    """Test the liveness and readiness endpoints"""
+
+    def setUp(self):
+        views._results.clear()
+        self.addCleanup(views._results.clear)
+
+    def test_healthz(self):
+        """liveness does not touch the database"""
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('healthz'))
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_readyz_ready(self):
+        """readiness checks the database and migrations"""
+        res = self.client.get(reverse('readyz'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res.json()['checks'], {'database': 'ok', 'migrations': 'ok'}
+        )
+
+    def test_readyz_cached(self):
+        """probe results are reused within the cache ttl"""
+        self.client.get(reverse('readyz'))
+
+        with self.assertNumQueries(0):
+            res = self.client.get(reverse('readyz'))
+        self.assertEqual(res.status_code, 200)
+
+    @patch('core.views.check_migrations', return_value='1 unapplied')
+    def test_readyz_not_ready(self, check):
+        """unapplied migrations make the app not ready"""
+        res = self.client.get(reverse('readyz'))
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['migrations'], '1 unapplied')
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import writebehind
+
+
+class LastLoginWriteBehindTests(TestCase):
+
+    def setUp(self):
+        self.users = [
+            get_user_model().objects.create_user(
+                'user%d@example.com' % i, 'testpass'
+            )
+            for i in range(3)
+        ]
+
+    def test_flush_single_update(self):
+        """pending logins of many users are written by one UPDATE"""
+        now = timezone.now()
+        buffer = writebehind.LastLoginBuffer(max_size=10)
+        for user in self.users:
+            buffer.record(user.pk, now - timedelta(minutes=1))
+            buffer.record(user.pk, now)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 3)
+
+        self.assertEqual(len(queries), 1)
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertEqual(user.last_login, now)
+
+    def test_full_buffer_flushes(self):
+        """recording into a full buffer flushes it right away"""
+        buffer = writebehind.LastLoginBuffer(max_size=2)
+        buffer.record(self.users[0].pk, timezone.now())
+        buffer.record(self.users[1].pk, timezone.now())
+
+        self.users[1].refresh_from_db()
+        self.assertIsNotNone(self.users[1].last_login)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_login_is_buffered(self):
+        """with write-behind installed a login does not write last_login
+        """
+        writebehind.install()
+        self.addCleanup(writebehind.uninstall)
+        # also stops the flush thread started by the login
+        self.addCleanup(writebehind.last_login_buffer.stop)
+
+        with CaptureQueriesContext(connection) as queries:
+            Client().force_login(self.users[0])
+        self.assertFalse(
+            [q for q in queries if 'last_login' in q['sql']]
+        )
+
+        writebehind.last_login_buffer.flush()
+        self.users[0].refresh_from_db()
+        self.assertIsNotNone(self.users[0].last_login)
+
+    @override_settings(LAST_LOGIN_WRITE_BEHIND={
+        'ENABLED': True, 'FLUSH_INTERVAL': 5, 'MAX_BUFFER': 10000,
+    })
+    def test_token_login_is_buffered(self):
+        """logins getting an API token go through the buffer too"""
+        self.addCleanup(writebehind.last_login_buffer.stop)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = APIClient().post(reverse('user:token'), {
+                'email': 'user0@example.com', 'password': 'testpass'
+            })
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(
+            [q for q in queries if q['sql'].startswith('UPDATE')]
+        )
+
+        writebehind.last_login_buffer.flush()
+        self.users[0].refresh_from_db()
+        self.assertIsNotNone(self.users[0].last_login)
+
+    def test_stop(self):
+        """stop() ends the flush thread, a new record starts another"""
+        buffer = writebehind.LastLoginBuffer(max_size=10)
+        buffer.record(self.users[0].pk, timezone.now())
+        thread = buffer._thread
+
+        buffer.stop()
+
+        self.assertFalse(thread.is_alive())
+        self.users[0].refresh_from_db()
+        self.assertIsNotNone(self.users[0].last_login)
+        buffer.record(self.users[1].pk, timezone.now())
+        self.addCleanup(buffer.stop)
+        self.assertTrue(buffer._thread.is_alive())
@@ -0,0 +1,91 @@
+import hmac
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404, HttpResponse, HttpResponseForbidden, \
+    JsonResponse
+
+from core import metrics as core_metrics
+from core.cache import LocalTTLCache
+
+# probe results are reused for a few seconds, so that orchestrators
+# polling every worker do not turn into database load
+_results = LocalTTLCache(max_size=8, ttl=settings.HEALTH_CHECK_CACHE_TTL)
+
+
+def check_database(alias):
+    """error message if the database cannot be queried, else None"""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError as exc:
+        return str(exc)
+
+
+def check_migrations(alias):
+    """error message if migrations are not applied, else None"""
+    try:
+        executor = MigrationExecutor(connections[alias])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError as exc:
+        return str(exc)
+    if plan:
+        return '%d unapplied migrations' % len(plan)
+
+
+def readiness():
+    """(ready, checks) of the database probes, cached"""
+    result = _results.get('readiness')
+    if result is None:
+        checks = {'database': check_database('default')}
+        if checks['database'] is None:
+            checks['migrations'] = check_migrations('default')
+        ready = not any(checks.values())
+        result = (ready, {
+            name: error or 'ok' for name, error in checks.items()
+        })
+        _results.set('readiness', result)
+    return result
+
+
+def healthz(request):
+    """liveness: the process is up and serving requests"""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """readiness: the database answers and is fully migrated"""
+    ready, checks = readiness()
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable', 'checks': checks},
+        status=200 if ready else 503
+    )
+
+
+def can_scrape(request):
+    """the client may read /metrics: its address is in ALLOWED_IPS, it
+        sends "Authorization: Bearer <METRICS['TOKEN']>" or it is staff
+    """
+    config = settings.METRICS
+    if request.META.get('REMOTE_ADDR') in config.get('ALLOWED_IPS', ()):
+        return True
+    token = config.get('TOKEN')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and hmac.compare_digest(
+            authorization.encode(), ('Bearer ' + token).encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def metrics(request):
+    """metrics of all worker processes for the Prometheus scraper"""
+    if not settings.METRICS['ENABLED']:
+        raise Http404
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        core_metrics.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
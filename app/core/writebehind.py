@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.db import connections
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def flush_last_logins(last_logins, using='default'):
+    """
+        write {user id: last login} with a single UPDATE statement
+        on PostgreSQL a timestamp never moves last_login backwards, so
+        concurrent flushes from several processes can land in any order
+    """
+    if not last_logins:
+        return 0
+    model = get_user_model()
+    connection = connections[using]
+    items = sorted(last_logins.items())
+
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(model._meta.db_table)
+        values = ', '.join(['(%s, %s::timestamptz)'] * len(items))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET last_login = v.last_login '
+                'FROM (VALUES {values}) AS v(id, last_login) '
+                'WHERE {table}.id = v.id AND ({table}.last_login IS NULL '
+                'OR {table}.last_login < v.last_login)'.format(
+                    table=table, values=values
+                ),
+                [param for item in items for param in item]
+            )
+            return cursor.rowcount
+
+    # portable variant: UPDATE ... SET last_login = CASE id WHEN ...
+    return model._default_manager.using(using).filter(
+        pk__in=[user_id for user_id, when in items]
+    ).update(last_login=Case(
+        *[When(pk=user_id, then=Value(when)) for user_id, when in items],
+        default='last_login'
+    ))
+
+
+class LastLoginBuffer:
+    """
+        Write-behind buffer for last_login
+        Logins only record (user id, timestamp) in memory; a background
+        thread writes them every flush_interval seconds with one
+        batched UPDATE, as does a record() finding the buffer full and
+        the interpreter shutting down. Instead of one hot-row UPDATE
+        per login, there is one statement per interval and process.
+        Up to flush_interval seconds of logins are lost if the process
+        is killed without a chance to flush.
+    """
+
+    def __init__(self, max_size=10000, flush_interval=5.0, using='default'):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.using = using
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def record(self, user_id, when):
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or previous < when:
+                self._pending[user_id] = when
+            full = len(self._pending) >= self.max_size
+        if full:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def flush(self):
+        """write and clear the pending logins, returns their number
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            flush_last_logins(pending, self.using)
+        except Exception:
+            # keep the logins for the next flush (newest wins)
+            with self._lock:
+                for user_id, when in pending.items():
+                    if len(self._pending) >= self.max_size:
+                        break
+                    if self._pending.get(user_id, when) <= when:
+                        self._pending[user_id] = when
+            raise
+        return len(pending)
+
+    def _ensure_thread(self):
+        # threads do not survive fork(), start one per worker process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='last-login-flush', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not flush last logins')
+            finally:
+                connections[self.using].close()
+
+    def stop(self):
+        """stop the background thread and write what is left"""
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and self._pid == os.getpid():
+            thread.join()
+        self.flush()
+
+
+last_login_buffer = LastLoginBuffer(
+    max_size=settings.LAST_LOGIN_WRITE_BEHIND['MAX_BUFFER'],
+    flush_interval=settings.LAST_LOGIN_WRITE_BEHIND['FLUSH_INTERVAL'],
+)
+
+
+def buffer_last_login(sender, user, **kwargs):
+    """user_logged_in receiver replacing django's update_last_login
+    """
+    user.last_login = timezone.now()
+    last_login_buffer.record(user.pk, user.last_login)
+
+
+def record_token_login(user):
+    """record the login of a user getting an API token through the
+        buffer when write-behind is enabled: token logins do not go
+        through django's login() and its user_logged_in signal
+    """
+    if settings.LAST_LOGIN_WRITE_BEHIND['ENABLED']:
+        buffer_last_login(sender=type(user), user=user)
+
+
+def install():
+    """route last_login updates through last_login_buffer"""
+    user_logged_in.disconnect(dispatch_uid='update_last_login')
+    user_logged_in.connect(
+        buffer_last_login, dispatch_uid='buffer_last_login'
+    )
+    atexit.register(last_login_buffer.stop)
+
+
+def uninstall():
+    """go back to django's synchronous update_last_login"""
+    user_logged_in.disconnect(dispatch_uid='buffer_last_login')
+    user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
+    atexit.unregister(last_login_buffer.stop)
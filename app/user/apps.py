@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    def ready(self):
+        """connect the signal handlers keeping the token cache fresh
+        """
+        from rest_framework.authtoken.models import Token
+        from core.signals import users_updated
+        from user import signals
+
+        post_save.connect(signals.invalidate_token, sender=Token)
+        post_delete.connect(signals.invalidate_token, sender=Token)
+        post_save.connect(
+            signals.invalidate_user_tokens, sender=get_user_model()
+        )
+        post_delete.connect(
+            signals.invalidate_user_tokens, sender=get_user_model()
+        )
+        users_updated.connect(signals.invalidate_updated_users_tokens)
@@ -0,0 +1,258 @@
+import pickle
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import authentication, exceptions
+
+from core.cache import LocalTTLCache
+from user import tokens
+
+
+class TwoTierCache:
+    """
+        Cache of pickled objects in two tiers
+        - a process-local LRU with a short TTL, which needs no network
+          round trip at all
+        - an optional shared django cache (e.g. memcached or redis),
+          so an entry computed by one worker is reused by the others
+        Entries are stored pickled, so every request gets its own copy
+        of the objects and cannot leak changes into other requests.
+        Shared entries are stored with the generation they were written
+        in; invalidate_all() replaces the generation, which drops every
+        shared entry at once (fetched in the same get_many() round trip).
+    """
+    key_prefix = ''
+
+    def __init__(self, ttl, max_size, shared_alias=None, shared_ttl=None):
+        self.local = LocalTTLCache(max_size=max_size, ttl=ttl)
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl if shared_ttl is not None else ttl
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.TOKEN_AUTH_CACHE
+        return cls(
+            ttl=config['TTL'],
+            max_size=config['MAX_SIZE'],
+            shared_alias=config.get('SHARED_CACHE'),
+            shared_ttl=config.get('SHARED_TTL'),
+        )
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    @property
+    def generation_key(self):
+        return self.key_prefix + 'generation'
+
+    def _get_shared(self, cache_key):
+        """the shared value of cache_key if of the current generation
+        """
+        entries = self.shared.get_many([self.generation_key, cache_key])
+        entry = entries.get(cache_key)
+        if entry is None or entry[0] != entries.get(self.generation_key):
+            return None
+        return entry[1]
+
+    def _get(self, cache_key):
+        value = self.local.get(cache_key)
+        if value is None and self.shared is not None:
+            value = self._get_shared(cache_key)
+            if value is not None:
+                self.local.set(cache_key, value)
+        return value
+
+    def _set_many(self, values):
+        for cache_key, value in values.items():
+            self.local.set(cache_key, value)
+        if self.shared is not None:
+            generation = self.shared.get(self.generation_key)
+            if generation is None:
+                generation = self.invalidate_all()
+            self.shared.set_many({
+                cache_key: (generation, value)
+                for cache_key, value in values.items()
+            }, self.shared_ttl)
+
+    def _delete_many(self, cache_keys):
+        for cache_key in cache_keys:
+            self.local.delete(cache_key)
+        if self.shared is not None:
+            self.shared.delete_many(cache_keys)
+
+    def invalidate_all(self):
+        """drop every entry: the local tier of this process and, by
+            replacing the generation, the shared tier
+            returns the new generation (None without a shared tier)
+        """
+        self.local.clear()
+        if self.shared is None:
+            return None
+        generation = uuid.uuid4().hex
+        self.shared.set(self.generation_key, generation, None)
+        return generation
+
+    def clear(self):
+        """clear the process-local tier (used by tests)
+        """
+        self.local.clear()
+
+
+class TokenCache(TwoTierCache):
+    """
+        Two tier cache of resolved (user, token) pairs keyed by token key
+        Besides the token entries, a user id -> token key entry is kept
+        so all entries of a user can be dropped when the user changes.
+    """
+    key_prefix = 'authtoken:'
+
+    def _token_key(self, key):
+        return '%stoken:%s' % (self.key_prefix, key)
+
+    def _user_key(self, user_id):
+        return '%suser:%s' % (self.key_prefix, user_id)
+
+    def get(self, key):
+        """return a fresh (user, token) pair for key or None on a miss
+        """
+        data = self._get(self._token_key(key))
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def set(self, key, user, token):
+        data = pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)
+        self._set_many({
+            self._token_key(key): data,
+            self._user_key(user.pk): key,
+        })
+
+    def invalidate_key(self, key):
+        """drop the entry of a single token (deleted or rotated)
+        """
+        self._delete_many([self._token_key(key)])
+
+    def invalidate_user(self, user_id):
+        """drop the entries of every token belonging to a user
+        """
+        user_key = self._user_key(user_id)
+        keys = {self.local.get(user_key)}
+        if self.shared is not None:
+            keys.add(self._get_shared(user_key))
+        cache_keys = [self._token_key(key) for key in keys if key]
+        cache_keys.append(user_key)
+        self._delete_many(cache_keys)
+
+
+class UserCache(TwoTierCache):
+    """
+        Two tier cache of users keyed by id, used to check signed tokens
+        against the user's current token_version and is_active
+    """
+    key_prefix = 'signedtoken:user:'
+
+    def get(self, user_id):
+        data = self._get(self.key_prefix + str(user_id))
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def set(self, user):
+        self._set_many({
+            self.key_prefix + str(user.pk):
+                pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+        })
+
+    def invalidate(self, user_id):
+        self._delete_many([self.key_prefix + str(user_id)])
+
+
+token_cache = TokenCache.from_settings()
+user_cache = UserCache.from_settings()
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """
+        Drop-in replacement for DRF's TokenAuthentication which resolves
+        tokens from token_cache, so only a cache miss runs the
+        Token + User join against the database.
+        A revoked token (deleted token, deactivated user) stops working
+        as soon as the signal handlers in user.signals invalidate it,
+        or at the latest when the local entry's TTL runs out in
+        processes which did not see the change.
+        Tokens expire TOKEN_EXPIRY['TTL'] seconds after their last
+        refresh (see user.tokens.refresh_token).
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token)
+        else:
+            user, token = cached
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed(
+                    _('User inactive or deleted.')
+                )
+
+        if tokens.is_expired(token):
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        if tokens.refresh_token(token):
+            token_cache.set(key, user, token)
+
+        return user, token
+
+
+class SignedTokenAuthentication(authentication.TokenAuthentication):
+    """
+        Stateless authentication with signed tokens (see user.tokens)
+        "Authorization: Bearer <token>"
+        The HMAC signature and the expiry are checked without any
+        database access. The token is revoked when the user's
+        token_version moves on (password change, revoke_tokens()), which
+        is checked against user_cache, so only a cache miss reads the
+        user row.
+    """
+    keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        try:
+            user_id, version = tokens.load_signed_token(key)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            model = get_user_model()
+            try:
+                user = model._default_manager.get(pk=user_id)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user_cache.set(user)
+
+        if user.token_version != version:
+            raise exceptions.AuthenticationFailed(
+                _('Token has been revoked.')
+            )
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        return user, key
+
+
+# authentication classes of the token protected views
+TOKEN_AUTHENTICATION_CLASSES = (
+    CachedTokenAuthentication, SignedTokenAuthentication
+)
@@ -0,0 +1,40 @@
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions, status
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from core import metrics
+from core.hashing import HashingBusy
+
+
+class ServiceBusy(exceptions.APIException):
+    """the server is saturated, the client should retry later"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Server is busy, please retry later.')
+    default_code = 'busy'
+    retry_after = 1
+
+
+class PreconditionFailed(exceptions.APIException):
+    """the resource changed since the client fetched it (If-Match)"""
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('The resource has been modified in the meantime.')
+    default_code = 'precondition_failed'
+
+
+def exception_handler(exc, context):
+    """
+        DRF exception handler which also turns HashingBusy, raised when
+        the password hashing pool is saturated, into a fast 503 response
+        and counts rejected tokens in the auth_failures metric
+    """
+    if isinstance(exc, (exceptions.AuthenticationFailed,
+                        exceptions.NotAuthenticated)):
+        metrics.auth_failures.labels(exc.default_code).inc()
+    if isinstance(exc, HashingBusy):
+        exc = ServiceBusy()
+
+    response = drf_exception_handler(exc, context)
+    if response is not None and isinstance(exc, ServiceBusy):
+        response['Retry-After'] = str(exc.retry_after)
+
+    return response
@@ -0,0 +1,28 @@
+from rest_framework.response import Response
+
+from core.instrumentation import timer
+
+
+class TimedValidationMixin:
+    """serializer mixin recording validation time for Server-Timing"""
+
+    def is_valid(self, raise_exception=False):
+        with timer('validate'):
+            return super().is_valid(raise_exception=raise_exception)
+
+
+class TimedRenderMixin:
+    """
+        view mixin recording rendering time for Server-Timing
+        the response is rendered here instead of later by django's
+        handler, so the time can be attributed
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if isinstance(response, Response):
+            with timer('render'):
+                response.render()
+        return response
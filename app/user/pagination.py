@@ -0,0 +1,143 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+        Cursor (keyset) pagination
+        The cursor holds the ordering values of the last row of a page,
+        the next page is fetched with a row comparison such as
+        WHERE (name, id) > ('last name', 42) ORDER BY name, id LIMIT n
+        which is an index range scan: page 1000 costs the same as page 1,
+        unlike OFFSET which reads and throws away every previous row.
+        The last ordering field has to be unique (the primary key).
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # ordering name -> fields used in ORDER BY and in the row comparison
+    orderings = {
+        'id': ('id',),
+        'name': ('name', 'id'),
+    }
+    default_ordering = 'id'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(request)
+        values, reverse = self.decode_cursor(request)
+
+        order_by = self.fields
+        if reverse:
+            order_by = ['-' + field for field in self.fields]
+        queryset = queryset.order_by(*order_by)
+        if values is not None:
+            queryset = self.after(queryset, values, reverse)
+
+        # fetch one extra row to know if there is another page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # walking forward, there is a next page when we got an extra row
+        # and a previous page when we came from a cursor; walking
+        # backwards it is the other way round
+        has_next, has_previous = has_more, values is not None
+        if reverse:
+            has_next, has_previous = has_previous, has_next
+
+        self.next_values = self.previous_values = None
+        if rows and has_next:
+            self.next_values = self.row_values(rows[-1])
+        if rows and has_previous:
+            self.previous_values = self.row_values(rows[0])
+
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.encode_cursor(self.next_values, False)),
+            ('previous', self.encode_cursor(self.previous_values, True)),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(
+            self.ordering_query_param, self.default_ordering
+        )
+        try:
+            return self.orderings[ordering]
+        except KeyError:
+            raise exceptions.ValidationError({
+                self.ordering_query_param: [
+                    _('Choose one of: %s.') % ', '.join(sorted(self.orderings))
+                ]
+            })
+
+    def after(self, queryset, values, reverse):
+        """rows strictly after (before when reverse) the cursor values
+        """
+        connection = connections[queryset.db]
+        model = queryset.model
+        columns = [
+            '%s.%s' % (
+                connection.ops.quote_name(model._meta.db_table),
+                connection.ops.quote_name(model._meta.get_field(f).column)
+            )
+            for f in self.fields
+        ]
+        placeholders = ', '.join(['%s'] * len(columns))
+        where = '(%s) %s (%s)' % (
+            ', '.join(columns), '<' if reverse else '>', placeholders
+        )
+        return queryset.extra(where=[where], params=values)
+
+    def row_values(self, row):
+        return [getattr(row, field) for field in self.fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii')).decode()
+            )
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, values, reverse):
+        if values is None:
+            return None
+        cursor = json.dumps({'v': values, 'r': int(reverse)})
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
@@ -0,0 +1,52 @@
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+        JSON renderer for machine clients
+        - encodes with orjson when it is installed
+        - otherwise reuses one preconfigured compact stdlib encoder
+        Indentation requested through the media type (indent=4) is
+        still honoured by falling back to the stock renderer.
+        Both give the output of JSONRenderer, less its spaces: orjson
+        leaves dates and times to the encoder of DRF and the data it
+        refuses (keys which are not strings) to the stdlib encoder. One
+        difference remains: orjson renders NaN and infinities as null
+        where JSONRenderer (strict) raises ValueError.
+    """
+    _encoder = renderers.JSONRenderer.encoder_class(
+        ensure_ascii=renderers.JSONRenderer.ensure_ascii,
+        allow_nan=not renderers.JSONRenderer.strict,
+        separators=(',', ':'),
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (accepted_media_type and 'indent' in accepted_media_type) or (
+                renderer_context and renderer_context.get('indent')):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # same escaping as JSONRenderer, keeps the output a strict
+        # javascript subset
+        if orjson is not None:
+            try:
+                rendered = orjson.dumps(
+                    data, default=self._encoder.default,
+                    option=orjson.OPT_PASSTHROUGH_DATETIME
+                )
+            except TypeError:
+                pass
+            else:
+                return rendered.replace(
+                    b'\xe2\x80\xa8', b'\\u2028'
+                ).replace(b'\xe2\x80\xa9', b'\\u2029')
+        return self._encoder.encode(data).replace(
+            '\u2028', '\\u2028'
+        ).replace('\u2029', '\\u2029').encode('utf-8')
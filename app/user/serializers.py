@@ -1,11 +1,108 @@
+import contextlib
+import copy
+import functools
+
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
+from django.db import IntegrityError, connections, router, transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from core import bloom, hashing, metrics
+from user import throttling
+from user.instrumentation import TimedValidationMixin
 
 # Wrap the texts with this if you want django to automatically translate
 from django.utils.translation import ugettext_lazy as _
 
 
-class UserSerializer(serializers.ModelSerializer):
+# SQLSTATE of unique violations
+UNIQUE_VIOLATION = '23505'
+
+
+@functools.lru_cache()
+def email_unique_constraints(alias):
+    """names of the unique constraints of the email column alone"""
+    model = get_user_model()
+    column = model._meta.get_field('email').column
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+    return frozenset(
+        name for name, constraint in constraints.items()
+        if constraint['unique'] and constraint['columns'] == [column]
+    )
+
+
+def is_email_taken(exc):
+    """whether an IntegrityError is the violation of the unique
+        constraint of email
+    """
+    model = get_user_model()
+    cause = exc.__cause__
+    if getattr(cause, 'pgcode', None) is not None:
+        return cause.pgcode == UNIQUE_VIOLATION and (
+            cause.diag.constraint_name in email_unique_constraints(
+                router.db_for_write(model)
+            )
+        )
+    # sqlite names the columns of the constraint instead
+    return str(exc) == 'UNIQUE constraint failed: %s.%s' % (
+        model._meta.db_table, model._meta.get_field('email').column
+    )
+
+
+def email_taken_error():
+    """errors of a taken email, as UniqueValidator reports them"""
+    return {'email': [serializers.ErrorDetail(
+        _('user with this email already exists.'), code='unique'
+    )]}
+
+
+class CachedFieldsMixin:
+    """
+        Builds the fields of a serializer class once per process
+        ModelSerializer introspects the model and builds its fields
+        from scratch for every instance, and DRF clones declared fields
+        by calling their constructor again; here they are built once
+        and every instance gets cheap copies. Only for serializers
+        whose fields do not depend on the instance, data or context.
+    """
+    cache_fields = True
+    _fields_cache = {}
+
+    def get_fields(self):
+        if not self.cache_fields:
+            return super().get_fields()
+        cls = type(self)
+        cache = CachedFieldsMixin._fields_cache
+        if cls not in cache:
+            cache[cls] = super().get_fields()
+        fields = cache[cls]
+        return {name: self.copy_field(field) for name, field in fields.items()}
+
+    @staticmethod
+    def copy_field(field):
+        """
+            a shallow copy of a leaf field skips Field.__init__, which
+            is where most of the construction cost goes (e.g. the lazy
+            error messages of CharField); nested fields keep their own
+            state, so they are deep copied as DRF does
+        """
+        if isinstance(field, serializers.BaseSerializer) or any(
+                hasattr(field, name) for name in ('child', 'child_relation')):
+            return copy.deepcopy(field)
+        copied = copy.copy(field)
+        # some validators keep per-call state (UniqueValidator keeps the
+        # instance from set_context), give every copy its own
+        copied.validators = [copy.copy(v) for v in field.validators]
+        return copied
+
+
+class UserSerializer(CachedFieldsMixin, TimedValidationMixin,
+                     serializers.ModelSerializer):
     """serializer for user object"""
 
     class Meta:
@@ -22,33 +119,221 @@ class UserSerializer(serializers.ModelSerializer):
             'password': {
                 'write_only': True,
                 'min_length': 5
-            }
+            },
+            # no UniqueValidator (a SELECT per signup), the unique index
+            # of email is the check, see unique_email()
+            'email': {'validators': []},
         }
 
+    @contextlib.contextmanager
+    def unique_email(self):
+        """turn the IntegrityError of the email unique index into the
+            validation error UniqueValidator would have raised
+        """
+        # only a transaction in progress needs a savepoint to survive
+        # the failed statement, otherwise it is a single statement
+        if transaction.get_connection().in_atomic_block:
+            atomic = transaction.atomic()
+        else:
+            atomic = contextlib.nullcontext()
+        try:
+            with atomic:
+                yield
+        except IntegrityError as exc:
+            if not is_email_taken(exc):
+                raise
+            raise serializers.ValidationError(email_taken_error())
+
     # create() is called when we use the CreateAPI view
     # which takes a POST request to create a user
     def create(self, validated_data):
         """Create a new user with encrypted password and return it
+            a single INSERT: a taken email is told by the unique index
+            (or, with the email filter, before the password is hashed)
         """
-        return get_user_model().objects.create_user(**validated_data)
+        manager = get_user_model().objects
+        email = manager.normalize_email(validated_data['email'])
+        if settings.USER_EMAIL_FILTER['ENABLED'] and (
+                bloom.email_filter.might_exist(email) and
+                manager.filter(email=email).exists()):
+            raise serializers.ValidationError(email_taken_error())
+        with self.unique_email():
+            return manager.create_user(**validated_data)
 
     def update(self, model_instance, validated_data):
         """update a user, setting the password correctly and return it
+            only the columns that actually changed are written, with a
+            single UPDATE, and nothing at all when nothing changed
         """
         # we have to upate password separately from other data
         # so remove the password if it is available or return none as default
         password = validated_data.pop('password', None)
 
-        # update all other fields in the model by calling the update method of ModelSerializer
-        user = super().update(model_instance, validated_data)
+        changed_fields = []
+        for attr, value in validated_data.items():
+            if getattr(model_instance, attr) != value:
+                setattr(model_instance, attr, value)
+                changed_fields.append(attr)
+
         if password:
-            user.set_password(password)
-            user.save()
+            model_instance.password = hashing.make_password(password)
+            # a new password revokes the signed tokens
+            model_instance.token_version += 1
+            changed_fields.extend(['password', 'token_version'])
+
+        if changed_fields:
+            # auto_now fields are only written when listed
+            changed_fields.append('updated_at')
+            if 'email' in changed_fields:
+                with self.unique_email():
+                    model_instance.save(update_fields=changed_fields)
+            else:
+                model_instance.save(update_fields=changed_fields)
+
+        return model_instance
+
+
+class UserListSerializer(serializers.ModelSerializer):
+    """read only serializer for the staff user list"""
+
+    class Meta:
+        model = get_user_model()
+        fields = ('id', 'email', 'name', 'is_active', 'is_staff',
+                  'last_login')
+        read_only_fields = fields
+
+
+class BulkUserListSerializer(TimedValidationMixin,
+                             serializers.ListSerializer):
+    """
+        List-mode serializer for creating many users in one request
+        - unlike ListSerializer, a bad row does not fail the whole batch,
+          its errors are kept in row_errors (keyed by row index)
+        - email uniqueness is checked with one query for all rows
+          instead of one query per row
+        - passwords are hashed in parallel and users are written with
+          bulk_create in batches of USER_BULK_CREATE['BATCH_SIZE']
+    """
+    default_error_messages = {
+        'too_many': _('Ensure this list has at most {max_rows} items.'),
+    }
+
+    def to_internal_value(self, data):
+        """validate every row, returns a list of (index, attrs) tuples
+        """
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(
+                input_type=type(data).__name__
+            )
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [message]
+            }, code='not_a_list')
 
-        return user
+        if not data:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['empty']
+                ]
+            }, code='empty')
 
+        max_rows = settings.USER_BULK_CREATE['MAX_ROWS']
+        if len(data) > max_rows:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['too_many'].format(max_rows=max_rows)
+                ]
+            }, code='too_many')
 
-class AuthTokenSerializer(serializers.Serializer):
+        self.row_errors = {}
+        rows = []
+        for index, item in enumerate(data):
+            try:
+                rows.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+
+        return self._exclude_existing_emails(rows)
+
+    def _exclude_existing_emails(self, rows):
+        """move rows whose email is taken (or repeated) to row_errors
+        """
+        manager = get_user_model().objects
+        for index, attrs in rows:
+            attrs['email'] = manager.normalize_email(attrs['email'])
+
+        existing = set(manager.filter(
+            email__in=[attrs['email'] for index, attrs in rows]
+        ).values_list('email', flat=True))
+
+        valid = []
+        for index, attrs in rows:
+            if attrs['email'] in existing:
+                self.row_errors[index] = email_taken_error()
+            else:
+                existing.add(attrs['email'])
+                valid.append((index, attrs))
+
+        return valid
+
+    def create(self, validated_data):
+        """insert the valid rows, returns a list of (index, user) tuples
+        """
+        model = get_user_model()
+        hashes = hashing.executor.make_passwords(
+            attrs.pop('password') for index, attrs in validated_data
+        )
+        rows = [
+            (index, model(password=encoded, **attrs))
+            for (index, attrs), encoded in zip(validated_data, hashes)
+        ]
+
+        created = []
+        batch_size = settings.USER_BULK_CREATE['BATCH_SIZE']
+        for start in range(0, len(rows), batch_size):
+            created.extend(self._insert_batch(rows[start:start + batch_size]))
+
+        return created
+
+    def _insert_batch(self, rows):
+        try:
+            with transaction.atomic():
+                get_user_model().objects.bulk_create(
+                    [user for index, user in rows]
+                )
+            return rows
+        except IntegrityError:
+            pass
+
+        # an email was taken by a concurrent signup after the uniqueness
+        # check, fall back to inserting this batch row by row
+        created = []
+        for index, user in rows:
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                created.append((index, user))
+            except IntegrityError as exc:
+                if not is_email_taken(exc):
+                    raise
+                self.row_errors[index] = email_taken_error()
+
+        return created
+
+    def save(self, **kwargs):
+        self.instance = self.create(self.validated_data)
+        return self.instance
+
+
+class BulkUserSerializer(UserSerializer):
+    """serializer for a single row of a bulk user creation"""
+
+    class Meta(UserSerializer.Meta):
+        # email uniqueness is checked by the list serializer for all rows
+        list_serializer_class = BulkUserListSerializer
+
+
+class AuthTokenSerializer(CachedFieldsMixin, TimedValidationMixin,
+                          serializers.Serializer):
     """
         Serializer for user authentication object:
         - Serializer can also be used without a model
@@ -61,6 +346,10 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    # opaque tokens live in the database, signed ones are stateless
+    token_type = serializers.ChoiceField(
+        choices=('opaque', 'signed'), default='opaque'
+    )
 
     def validate(self, attrs):
         """ override validate method and raise exception if invalid
@@ -79,6 +368,9 @@ class AuthTokenSerializer(serializers.Serializer):
         )
         # if authentication fails:
         if not user:
+            metrics.auth_failures.labels('invalid_credentials').inc()
+            # feeds LoginFailureThrottle, checked before the next attempt
+            throttling.record_failure(self.context.get('request'), email)
             # we use gettext to enable language tranlation for this text
             msg = _("Unable to authenticate with credentials provided")
             # raise the relavant http status code
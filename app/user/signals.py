@@ -0,0 +1,29 @@
+from user.authentication import token_cache, user_cache
+
+
+def invalidate_token(sender, instance, **kwargs):
+    """drop a token from the auth cache when it is deleted or rotated
+    """
+    token_cache.invalidate_key(instance.key)
+    token_cache.invalidate_user(instance.user_id)
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """drop all cached tokens of a user when the user row changes,
+        e.g. is_active is switched off or the password is changed
+    """
+    token_cache.invalidate_user(instance.pk)
+    user_cache.invalidate(instance.pk)
+
+
+def invalidate_updated_users_tokens(sender, user_ids, **kwargs):
+    """drop the cached tokens of users changed by a bulk update
+        user_ids None means any user may have changed
+    """
+    if user_ids is None:
+        token_cache.invalidate_all()
+        user_cache.invalidate_all()
+        return
+    for user_id in user_ids:
+        token_cache.invalidate_user(user_id)
+        user_cache.invalidate(user_id)
@@ -0,0 +1,259 @@
+import datetime
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+from django.utils import timezone
+
+from user import tokens
+from user.authentication import UserCache, token_cache, user_cache
+
+
+ME_URL = reverse("user:me")
+TOKEN_URL = reverse("user:token")
+ROTATE_URL = reverse("user:token-rotate")
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test that /me/ resolves tokens from the token cache"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='testpass',
+            name='name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_cached_token_skips_database(self):
+        """the second request with the same token runs no query"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_rejected(self):
+        """a deleted token stops working even when it was cached"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """deactivating a user invalidates the cached token"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_change_visible(self):
+        """changes to the user are not hidden by the cache"""
+        self.client.get(ME_URL)
+        self.user.name = 'new name'
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'new name')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'two-tier-tests',
+}})
+class TwoTierCacheTests(SimpleTestCase):
+    """Test the shared tier of the two tier caches"""
+
+    def setUp(self):
+        self.cache = UserCache(ttl=30, max_size=10, shared_alias='default')
+        self.user = get_user_model()(pk=1, email='test@test.com')
+
+    def test_shared_entry_reused(self):
+        """an entry written by another process is found"""
+        self.cache.set(self.user)
+        self.cache.clear()
+
+        self.assertEqual(self.cache.get(1).email, 'test@test.com')
+
+    def test_invalidate_all(self):
+        """a new generation drops every shared entry"""
+        self.cache.set(self.user)
+        other = UserCache(ttl=30, max_size=10, shared_alias='default')
+        self.assertIsNotNone(other.get(1))
+
+        self.cache.invalidate_all()
+        other.clear()
+
+        self.assertIsNone(other.get(1))
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    """Test stateless signed tokens and their revocation"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@test.com',
+            password='testpass',
+            name='name'
+        )
+        self.client = APIClient()
+
+    def login(self):
+        res = self.client.post(TOKEN_URL, {
+            'email': 'test@test.com',
+            'password': 'testpass',
+            'token_type': 'signed',
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['token_type'], 'signed')
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Bearer ' + res.data['token']
+        )
+        return res.data['token']
+
+    def test_signed_token_issued_without_write(self):
+        """logging in with token_type=signed stores no token"""
+        self.login()
+
+        self.assertFalse(Token.objects.exists())
+
+    def test_signed_token_skips_database(self):
+        """a signed token is verified from the user cache"""
+        self.login()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_tampered_token_rejected(self):
+        """a token with a broken signature is rejected"""
+        token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token + 'x')
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIGNED_TOKEN={'TTL': -1})
+    def test_expired_token_rejected(self):
+        """a token older than the TTL is rejected"""
+        self.login()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_token_rejected(self):
+        """bumping token_version revokes issued tokens"""
+        self.login()
+        self.client.get(ME_URL)
+
+        self.user.revoke_signed_tokens()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token has been revoked.')
+
+    def test_password_change_revokes(self):
+        """changing the password revokes signed tokens"""
+        self.login()
+
+        res = self.client.patch(ME_URL, {'password': 'newpass'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """deactivating a user invalidates the cached user"""
+        self.login()
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_payload(self):
+        """the token carries the user id and token version"""
+        self.user.token_version = 3
+
+        token = tokens.create_signed_token(self.user)
+
+        self.assertEqual(
+            tokens.load_signed_token(token), (self.user.pk, 3)
+        )
+
+
+@override_settings(TOKEN_EXPIRY={'TTL': 86400, 'REFRESH_INTERVAL': 3600})
+class TokenExpiryTests(TestCase):
+    """Test the expiry, sliding refresh and rotation of opaque tokens"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.payload = {'email': 'test@test.com', 'password': 'testpass'}
+        self.user = get_user_model().objects.create_user(**self.payload)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def age_token(self, **delta):
+        created = timezone.now() - datetime.timedelta(**delta)
+        Token.objects.filter(key=self.token.key).update(created=created)
+        return created
+
+    def test_expired_token_rejected(self):
+        """a token unused for longer than the TTL is rejected"""
+        self.age_token(days=2)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token has expired.')
+
+    def test_sliding_refresh(self):
+        """using a token moves its expiry, once per refresh interval"""
+        created = self.age_token(hours=2)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.created, created)
+
+        # refreshed token is cached, no further query nor write
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+    def test_login_replaces_expired_token(self):
+        """logging in with an expired token issues a new key"""
+        self.age_token(days=2)
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], self.token.key)
+        self.assertEqual(Token.objects.get().key, res.data['token'])
+
+    def test_rotate_token(self):
+        """rotation issues a new key and revokes the old one at once"""
+        self.client.get(ME_URL)
+
+        res = self.client.post(ROTATE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Token.objects.get().key, res.data['token'])
+        self.assertIn('expires_at', res.data)
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,95 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+
+BULK_CREATE_URL = reverse("user:bulk-create")
+
+
+class BulkCreateUserApiTests(TestCase):
+    """Test the bulk user creation API"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@test.com', 'adminpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_create_users(self):
+        """all valid rows are created and their passwords hashed"""
+        payload = [
+            {'email': 'user%d@test.com' % i, 'password': 'testpass',
+             'name': 'user %d' % i}
+            for i in range(5)
+        ]
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 5)
+        self.assertEqual(res.data['failed'], 0)
+        user = get_user_model().objects.get(email='user3@test.com')
+        self.assertTrue(user.check_password('testpass'))
+        self.assertNotIn('password', res.data['results'][0])
+
+    def test_bulk_create_per_row_errors(self):
+        """bad rows are reported without failing the good ones"""
+        payload = [
+            {'email': 'new@test.com', 'password': 'testpass', 'name': 'a'},
+            {'email': 'admin@test.com', 'password': 'testpass', 'name': 'b'},
+            {'email': 'new@test.com', 'password': 'testpass', 'name': 'c'},
+            {'email': 'short@test.com', 'password': 'tp', 'name': 'd'},
+        ]
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(
+            [result['status'] for result in res.data['results']],
+            ['created', 'error', 'error', 'error']
+        )
+        self.assertIn('email', res.data['results'][1]['errors'])
+        self.assertIn('email', res.data['results'][2]['errors'])
+        self.assertIn('password', res.data['results'][3]['errors'])
+        self.assertFalse(
+            get_user_model().objects.filter(email='short@test.com').exists()
+        )
+
+    @override_settings(USER_BULK_CREATE={'BATCH_SIZE': 2, 'MAX_ROWS': 10})
+    def test_bulk_create_batched_queries(self):
+        """one uniqueness query for all rows and one insert per batch"""
+        payload = [
+            {'email': 'user%d@test.com' % i, 'password': 'testpass',
+             'name': 'user'}
+            for i in range(4)
+        ]
+        # 1 uniqueness SELECT + 2 batches of (SAVEPOINT, INSERT, RELEASE)
+        with self.assertNumQueries(7):
+            res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.data['created'], 4)
+
+    @override_settings(USER_BULK_CREATE={'BATCH_SIZE': 2, 'MAX_ROWS': 3})
+    def test_bulk_create_too_many_rows(self):
+        """payloads above MAX_ROWS are rejected"""
+        payload = [
+            {'email': 'user%d@test.com' % i, 'password': 'testpass',
+             'name': 'user'}
+            for i in range(4)
+        ]
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+    def test_bulk_create_requires_staff(self):
+        """normal users cannot bulk create users"""
+        user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass'
+        )
+        self.client.force_authenticate(user=user)
+        res = self.client.post(BULK_CREATE_URL, [], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
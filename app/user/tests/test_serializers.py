@@ -0,0 +1,167 @@
+import datetime
+import decimal
+import uuid
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from user.renderers import FastJSONRenderer, orjson
+from user.serializers import AuthTokenSerializer, UserSerializer, \
+    email_unique_constraints, is_email_taken
+
+
+class CachedFieldsTests(TestCase):
+    """Test the per class cache of serializer fields"""
+
+    def test_fields_are_copies(self):
+        """every serializer gets its own field instances"""
+        first, second = UserSerializer(), UserSerializer()
+
+        for name in ('email', 'name', 'password'):
+            self.assertIsNot(first.fields[name], second.fields[name])
+            self.assertIsNot(
+                first.fields[name].validators, second.fields[name].validators
+            )
+        self.assertEqual(first.fields['email'].parent, first)
+        self.assertEqual(second.fields['email'].parent, second)
+
+    def test_validators_are_not_shared(self):
+        """stateful validators (UniqueValidator) are copied"""
+        first = UserSerializer().fields['email'].validators
+        second = UserSerializer().fields['email'].validators
+
+        for validator, other in zip(first, second):
+            self.assertIsNot(validator, other)
+
+    def test_unique_email_checked_on_save(self):
+        """a taken email is told by the unique index, not by a SELECT
+            during validation
+        """
+        get_user_model().objects.create_user(
+            email='test@londonappdev.com', password='testpass'
+        )
+        serializer = UserSerializer(data={
+            'email': 'test@londonappdev.com', 'password': 'testpass',
+            'name': 'Test',
+        })
+
+        with self.assertNumQueries(0):
+            self.assertTrue(serializer.is_valid())
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+
+        self.assertEqual(
+            raised.exception.detail['email'][0].code, 'unique'
+        )
+
+    def test_token_serializer_fields(self):
+        serializer = AuthTokenSerializer(data={
+            'email': 'test@londonappdev.com', 'password': 'x' * 4,
+            'token_type': 'nope',
+        })
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(set(serializer.errors), {'token_type'})
+
+
+class UniqueEmailErrorTests(TestCase):
+    """Test the IntegrityErrors told to be a taken email"""
+
+    def test_other_integrity_errors_raised(self):
+        """only the unique constraint of email means a taken email"""
+        serializer = UserSerializer()
+        error = IntegrityError('NOT NULL constraint failed: core_user.name')
+
+        with self.assertRaises(IntegrityError):
+            with serializer.unique_email():
+                raise error
+
+    @patch('user.serializers.email_unique_constraints')
+    def test_postgresql_unique_violation(self, constraints):
+        """on PostgreSQL the violated constraint is checked by name"""
+        constraints.return_value = frozenset({'core_user_email_key'})
+
+        def integrity_error(pgcode, constraint_name):
+            cause = Exception()
+            cause.pgcode = pgcode
+            cause.diag = Mock(constraint_name=constraint_name)
+            exc = IntegrityError()
+            exc.__cause__ = cause
+            return exc
+
+        self.assertTrue(is_email_taken(
+            integrity_error('23505', 'core_user_email_key')
+        ))
+        self.assertFalse(is_email_taken(
+            integrity_error('23505', 'core_user_other_key')
+        ))
+        self.assertFalse(is_email_taken(
+            integrity_error('23502', 'core_user_email_key')
+        ))
+
+    def test_email_unique_constraints(self):
+        self.assertEqual(len(email_unique_constraints('default')), 1)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test FastJSONRenderer renders like JSONRenderer, without orjson"""
+    orjson = None
+
+    def setUp(self):
+        patcher = patch('user.renderers.orjson', self.orjson)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertSameOutput(self, data):
+        fast = FastJSONRenderer().render(data)
+
+        self.assertEqual(
+            fast.replace(b' ', b''),
+            JSONRenderer().render(data).replace(b' ', b'')
+        )
+        return fast
+
+    def test_same_output(self):
+        fast = self.assertSameOutput(
+            {'name': 'Test\u2028\u2029\u00e9', 'id': 1, 'list': [None, True]}
+        )
+
+        self.assertIn(b'\\u2028', fast)
+        self.assertIn(b'\\u2029', fast)
+
+    def test_same_types(self):
+        """dates, times, decimals and uuids are rendered by DRF's rules"""
+        self.assertSameOutput({
+            'datetime': datetime.datetime(
+                2020, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+            ),
+            'naive': datetime.datetime(2020, 1, 2, 3, 4, 5),
+            'date': datetime.date(2020, 1, 2),
+            'time': datetime.time(3, 4, 5, 678901),
+            'decimal': decimal.Decimal('1.50'),
+            'uuid': uuid.UUID('12345678123456781234567812345678'),
+        })
+
+    def test_non_str_keys(self):
+        self.assertSameOutput({1: 'one', None: 'none', 2.5: 'half'})
+
+    def test_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent(self):
+        rendered = FastJSONRenderer().render(
+            {'id': 1}, 'application/json; indent=4'
+        )
+
+        self.assertEqual(rendered, b'{\n    "id": 1\n}')
+
+
+@skipUnless(orjson, 'orjson is not installed')
+class OrjsonRendererTests(FastJSONRendererTests):
+    """Test FastJSONRenderer renders like JSONRenderer, with orjson"""
+    orjson = orjson
@@ -0,0 +1,157 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.testing import BudgetTestMixin
+from user.throttling import SlidingWindowCounter, login_failures
+
+TOKEN_URL = reverse('user:token')
+LIMITS = {
+    'WINDOW': 300, 'IP_LIMIT': 10, 'EMAIL_LIMIT': 3, 'SHARED_CACHE': None,
+    'MAX_SIZE': 1000, 'NUM_PROXIES': 0,
+}
+
+
+class SlidingWindowCounterTests(SimpleTestCase):
+    """Test the sliding window failure counters"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.counter = SlidingWindowCounter(
+            window=100, timer=lambda: self.now
+        )
+
+    def test_previous_window_weighted(self):
+        """the previous window counts for the share still in the window"""
+        for i in range(4):
+            self.counter.incr('key')
+        self.assertEqual(self.counter.count('key'), 4)
+
+        self.now = 1125.0
+        self.counter.incr('key')
+
+        self.assertEqual(self.counter.count('key'), 1 + 4 * 0.75)
+        self.assertEqual(self.counter.count('other'), 0)
+
+    def test_expired(self):
+        self.counter.incr('key')
+        self.now = 1200.0
+
+        self.assertEqual(self.counter.count('key'), 0)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttling-tests',
+    }})
+    def test_shared_cache(self):
+        """counters are kept in the shared cache when configured"""
+        counter = SlidingWindowCounter(
+            window=100, shared_alias='default', timer=lambda: self.now
+        )
+        counter.incr('key')
+        counter.incr('key')
+
+        self.assertEqual(counter.count('key'), 2)
+        self.assertEqual(len(counter.local), 0)
+
+
+@override_settings(LOGIN_THROTTLE=LIMITS)
+class LoginThrottleApiTests(BudgetTestMixin, TestCase):
+    """Test the throttling of failed logins"""
+
+    def setUp(self):
+        self.client = APIClient()
+        login_failures.clear()
+        self.addCleanup(login_failures.clear)
+        get_user_model().objects.create_user(
+            email='test@test.com', password='testpass'
+        )
+
+    def login(self, email='test@test.com', password='wrong'):
+        return self.client.post(
+            TOKEN_URL, {'email': email, 'password': password}
+        )
+
+    def test_email_limit(self):
+        """too many failures for an email block it, before any hashing"""
+        for i in range(3):
+            self.assertEqual(
+                self.login().status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+        with patch('user.serializers.authenticate') as authenticate:
+            res = self.login(password='testpass')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        authenticate.assert_not_called()
+        # other accounts are not blocked
+        self.assertEqual(
+            self.login(email='other@test.com').status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_email_normalized(self):
+        for i in range(3):
+            self.login()
+
+        self.assertEqual(
+            self.login(email=' TEST@test.com').status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    def test_ip_limit(self):
+        """one client failing with many emails is blocked"""
+        for i in range(10):
+            self.login(email='user%d@test.com' % i)
+
+        res = self.login(password='testpass')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forged_forwarded_for(self):
+        """a client cannot escape the IP limit with X-Forwarded-For"""
+        for i in range(10):
+            self.client.post(TOKEN_URL, {
+                'email': 'user%d@test.com' % i, 'password': 'wrong'
+            }, HTTP_X_FORWARDED_FOR='10.0.0.%d' % i)
+
+        res = self.client.post(
+            TOKEN_URL, {'email': 'test@test.com', 'password': 'testpass'},
+            HTTP_X_FORWARDED_FOR='10.0.1.1'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(LOGIN_THROTTLE=dict(LIMITS, NUM_PROXIES=1))
+    def test_trusted_proxy(self):
+        """behind a proxy, the address it appended identifies clients"""
+        for i in range(10):
+            self.client.post(TOKEN_URL, {
+                'email': 'user%d@test.com' % i, 'password': 'wrong'
+            }, HTTP_X_FORWARDED_FOR='10.0.0.%d, 192.0.2.1' % i)
+
+        blocked = self.client.post(
+            TOKEN_URL, {'email': 'test@test.com', 'password': 'testpass'},
+            HTTP_X_FORWARDED_FOR='192.0.2.1'
+        )
+        other = self.client.post(
+            TOKEN_URL, {'email': 'test@test.com', 'password': 'testpass'},
+            HTTP_X_FORWARDED_FOR='192.0.2.2'
+        )
+
+        self.assertEqual(
+            blocked.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertEqual(other.status_code, status.HTTP_200_OK)
+
+    def test_success_not_counted(self):
+        for i in range(5):
+            res = self.login(password='testpass')
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -1,14 +1,39 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.bloom import email_filter
+from core.hashing import HashingBusy
+from core.testing import Budget, BudgetTestMixin
+from user.throttling import login_failures
+from user.tokens import create_token
+
 
 CREATE_USER_URL = reverse("user:create")
 TOKEN_URL = reverse("user:token")
 ME_URL = reverse("user:me")
 
+# max queries, rows written and seconds per endpoint
+# (issuing a new token takes 2 queries on PostgreSQL, 5 elsewhere;
+# creating a user is a single INSERT, wrapped in a savepoint here as
+# tests run inside a transaction)
+BUDGETS = {
+    'POST user:create': Budget(queries=3, writes=1, seconds=0.5),
+    'POST user:token': Budget(queries=5, writes=1, seconds=0.5),
+    'GET user:me': Budget(queries=0, writes=0, seconds=0.5),
+    'PATCH user:me': Budget(queries=1, writes=1, seconds=0.5),
+    'user:me': Budget(queries=0, writes=0),
+}
+
 
 def create_user(**params):
     """
@@ -17,14 +42,16 @@ def create_user(**params):
     return get_user_model().objects.create_user(**params)
 
 
-class PublicUserApiTests(TestCase):
+class PublicUserApiTests(BudgetTestMixin, TestCase):
     """
         Test the users API (public)
        'Public' because we dont check for authentication
     """
+    budgets = BUDGETS
 
     def setUp(self):
         self.client = APIClient()
+        login_failures.clear()
 
     def test_create_valid_user_success(self):
         """
@@ -161,8 +188,9 @@ class PublicUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateUsersApiTests(TestCase):
+class PrivateUsersApiTests(BudgetTestMixin, TestCase):
     """Test API requests that require authentication"""
+    budgets = BUDGETS
 
     def setUp(self):
         self.user = create_user(
@@ -204,3 +232,325 @@ class PrivateUsersApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class HashingBusyApiTests(BudgetTestMixin, TestCase):
+    """Test the API when the password hashing pool is saturated"""
+    budgets = BUDGETS
+
+    def setUp(self):
+        self.client = APIClient()
+
+    @patch('core.hashing.executor.make_password', side_effect=HashingBusy)
+    def test_create_user_busy(self, mp):
+        """signing up returns 503 instead of queueing up"""
+        payload = {
+            'email': 'test@test.com',
+            'password': 'testpass',
+            'name': 'tester'
+        }
+        res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', res)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_create_token_busy(self):
+        """logging in returns 503 instead of queueing up"""
+        payload = {'email': 'test@test.com', 'password': 'testpass'}
+        create_user(**payload)
+
+        with patch('core.hashing.executor.check_password',
+                   side_effect=HashingBusy):
+            res = self.client.post(TOKEN_URL, payload)
+
+        self.assertNotIn('token', res.data)
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class TokenIssuanceQueryTests(BudgetTestMixin, TestCase):
+    """Test the number of queries needed to issue a token"""
+    budgets = BUDGETS
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {'email': 'test@test.com', 'password': 'testpass'}
+        self.user = create_user(**self.payload)
+
+    def test_existing_token_single_query(self):
+        """the user and its token are fetched by one query"""
+        token = Token.objects.create(user=self.user)
+
+        with self.assertNumQueries(1):
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.data['token'], token.key)
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs ON CONFLICT')
+    def test_new_token_upsert(self):
+        """a new token takes a single INSERT ... ON CONFLICT"""
+        with self.assertNumQueries(2):
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(
+            res.data['token'], Token.objects.get(user=self.user).key
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'needs ON CONFLICT')
+    def test_concurrent_token_upsert(self):
+        """a login racing another one gets the token that won"""
+        # the concurrent login created the token after our SELECT
+        token = Token.objects.create(user=self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(create_token(self.user).key, token.key)
+
+
+class PatchWritesMixin:
+    """helpers to check the UPDATE statements of PATCH /me/"""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@test.com',
+            password='testpass',
+            name='name'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def assertPatchWrites(self, payload, columns):
+        """PATCH payload and check the columns of the UPDATE statements
+            (savepoints around an email change are not counted)
+        """
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        statements = [
+            q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']
+        ]
+        updates = [sql for sql in statements if sql.startswith('UPDATE')]
+        self.assertEqual(len(statements), len(updates))
+        if not columns:
+            self.assertEqual(updates, [])
+            return
+        self.assertEqual(len(updates), 1)
+        set_clause = updates[0].split(' WHERE ')[0]
+        for column in ('name', 'password', 'email', 'token_version'):
+            self.assertEqual(
+                '"%s"' % column in set_clause, column in columns, column
+            )
+
+
+class ManageUserWriteTests(PatchWritesMixin, BudgetTestMixin, TestCase):
+    """Test that PATCH /me/ writes only what changed, in one UPDATE"""
+    budgets = BUDGETS
+
+    def test_patch_name(self):
+        """changing the name writes only the name"""
+        self.assertPatchWrites({'name': 'new name'}, ['name'])
+
+    def test_patch_password(self):
+        """changing the password writes the hash and token_version"""
+        self.assertPatchWrites(
+            {'password': 'newpass'}, ['password', 'token_version']
+        )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('newpass'))
+
+    def test_patch_name_and_password(self):
+        """both changed columns are written by the same UPDATE"""
+        self.assertPatchWrites(
+            {'name': 'new name', 'password': 'newpass'},
+            ['name', 'password', 'token_version']
+        )
+
+    def test_patch_unchanged(self):
+        """a PATCH changing nothing writes nothing"""
+        self.assertPatchWrites({'name': 'name'}, [])
+
+
+class ManageUserEmailWriteTests(PatchWritesMixin, BudgetTestMixin,
+                                TestCase):
+    """Test that an email change on PATCH /me/ is a single UPDATE"""
+    # the UPDATE of an email runs in a savepoint inside the transaction
+    # of the test (a taken email must not break it), see unique_email()
+    budgets = dict(BUDGETS, **{
+        'PATCH user:me': Budget(queries=3, writes=1, seconds=0.5),
+    })
+
+    def test_patch_email(self):
+        """changing the email writes only the email"""
+        self.assertPatchWrites({'email': 'new@test.com'}, ['email'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'new@test.com')
+
+    def test_patch_email_and_password(self):
+        """email and password are written by the same UPDATE"""
+        self.assertPatchWrites(
+            {'email': 'new@test.com', 'password': 'newpass'},
+            ['email', 'password', 'token_version']
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'new@test.com')
+        self.assertTrue(self.user.check_password('newpass'))
+
+
+class ConditionalRequestTests(BudgetTestMixin, TestCase):
+    """Test ETags, If-None-Match on GET and If-Match on PATCH of /me/"""
+    # a conditional PATCH locks the row first, in a transaction (a
+    # savepoint inside the test case's one); a conditional GET reads
+    # updated_at, and the user again when the cached one is outdated
+    budgets = dict(BUDGETS, **{
+        'GET user:me': Budget(queries=2, writes=0, seconds=0.5),
+        'PATCH user:me': Budget(queries=4, writes=1, seconds=0.5),
+    })
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@test.com',
+            password='testpass',
+            name='name'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_etag(self):
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res['ETag']
+
+    def test_etag_strong_and_stable(self):
+        etag = self.get_etag()
+
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(self.get_etag(), etag)
+
+    @patch('user.serializers.UserSerializer.to_representation')
+    def test_not_modified(self, to_representation):
+        """a matching If-None-Match is answered without serializing"""
+        to_representation.return_value = {}
+        etag = self.get_etag()
+        to_representation.reset_mock()
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+        to_representation.assert_not_called()
+
+    def test_modified_after_update(self):
+        """the ETag changes with the user"""
+        etag = self.get_etag()
+        self.client.patch(ME_URL, {'name': 'new name'})
+        self.user.refresh_from_db()
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_outdated_user_not_confirmed(self):
+        """a conditional GET compares with the database, not with an
+            outdated cached user
+        """
+        etag = self.get_etag()
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            name='changed elsewhere', updated_at=timezone.now()
+        )
+
+        with self.assertNumQueries(2):
+            res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['name'], 'changed elsewhere')
+        self.assertNotEqual(res['ETag'], etag)
+        # the new ETag is confirmed even to the outdated cached user
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_patch_if_match(self):
+        """PATCH with the current ETag updates and returns the new one"""
+        etag = self.get_etag()
+
+        res = self.client.patch(
+            ME_URL, {'name': 'new name'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'new name')
+
+    def test_patch_stale_if_match(self):
+        """PATCH with an outdated ETag fails with 412"""
+        etag = self.get_etag()
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            name='changed elsewhere', updated_at=timezone.now()
+        )
+
+        res = self.client.patch(
+            ME_URL, {'name': 'new name'}, HTTP_IF_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'changed elsewhere')
+
+
+class UniqueEmailTests(TestCase):
+    """Test email uniqueness enforced by the unique index"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='test@test.com', password='testpass')
+        email_filter.reset()
+        self.addCleanup(email_filter.reset)
+
+    def signup(self, email):
+        return self.client.post(CREATE_USER_URL, {
+            'email': email, 'password': 'testpass', 'name': 'test',
+        })
+
+    def test_create_taken_email(self):
+        """a taken email gets the usual unique error, in one INSERT"""
+        # INSERT, and the savepoint it is rolled back to
+        with self.assertNumQueries(4):
+            res = self.signup('test@test.com')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data, {'email': ['user with this email already exists.']}
+        )
+        self.assertEqual(res.data['email'][0].code, 'unique')
+
+    def test_update_taken_email(self):
+        other = create_user(email='other@test.com', password='testpass')
+        self.client.force_authenticate(user=other)
+
+        res = self.client.patch(ME_URL, {'email': 'test@test.com'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data)
+        other.refresh_from_db()
+        self.assertEqual(other.email, 'other@test.com')
+
+    @override_settings(USER_EMAIL_FILTER={
+        'ENABLED': True, 'CAPACITY': 1000, 'ERROR_RATE': 0.01,
+    })
+    def test_email_filter(self):
+        """with the email filter, a taken email is told before the
+            password is hashed
+        """
+        email_filter.load()
+        with patch('core.hashing.make_password') as make_password:
+            res = self.signup('test@test.com')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['email'][0].code, 'unique')
+        make_password.assert_not_called()
+
+        self.assertEqual(
+            self.signup('new@test.com').status_code, status.HTTP_201_CREATED
+        )
@@ -0,0 +1,61 @@
+import gzip
+import json
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+
+EXPORT_URL = reverse("user:export")
+
+
+class ExportUserApiTests(TestCase):
+    """Test the streaming user export API"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@test.com', 'adminpass'
+        )
+        self.user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass', name='test user'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_export_csv(self):
+        """users are streamed as csv with a header row"""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0], 'id,email,name,is_active,is_staff,last_login'
+        )
+        self.assertEqual(len(lines), 3)
+        self.assertIn('user@test.com,test user,True,False,', lines[2])
+
+    def test_export_jsonl_gzip(self):
+        """users are streamed as gzipped json lines"""
+        res = self.client.get(EXPORT_URL, {'output': 'jsonl', 'gzip': '1'})
+
+        self.assertEqual(res['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(res.streaming_content))
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(rows[1]['email'], self.user.email)
+        self.assertNotIn('password', rows[1])
+
+    def test_export_unknown_format(self):
+        """unknown formats are rejected"""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_staff(self):
+        """normal users cannot export users"""
+        self.client.force_authenticate(user=self.user)
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,98 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+
+
+LIST_URL = reverse("user:list")
+
+
+class ListUserApiTests(TestCase):
+    """Test the keyset paginated user list API"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@test.com', 'adminpass'
+        )
+        for i, name in enumerate(['b', 'a', 'c', 'a', 'b']):
+            get_user_model().objects.create_user(
+                'user%d@test.com' % i, 'testpass', name=name,
+                is_active=i != 4
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def walk(self, params, key):
+        """follow the next links, return (values, last page data)"""
+        values = []
+        res = self.client.get(LIST_URL, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            values.extend(row[key] for row in res.data['results'])
+            if not res.data['next']:
+                return values, res.data
+            res = self.client.get(res.data['next'])
+
+    def test_list_by_id(self):
+        """pages follow each other by id without gaps or repeats"""
+        emails, last = self.walk({'page_size': 2}, 'email')
+
+        self.assertEqual(emails, ['admin@test.com'] + [
+            'user%d@test.com' % i for i in range(5)
+        ])
+        self.assertIsNotNone(last['previous'])
+
+    def test_list_by_name(self):
+        """ordering by name breaks ties on id"""
+        users = get_user_model().objects.order_by('name', 'id')
+        ids, last = self.walk({'page_size': 2, 'ordering': 'name'}, 'id')
+
+        self.assertEqual(ids, [user.id for user in users])
+
+    def test_previous_page(self):
+        """the previous link returns the page before"""
+        first = self.client.get(LIST_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        res = self.client.get(second.data['previous'])
+
+        self.assertEqual(res.data['results'], first.data['results'])
+        self.assertIsNone(res.data['previous'])
+
+    def test_list_page_query_count(self):
+        """deeper pages cost a single query like the first one"""
+        first = self.client.get(LIST_URL, {'page_size': 2})
+
+        with self.assertNumQueries(1):
+            res = self.client.get(first.data['next'])
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_list_filters(self):
+        """users are filtered by flags and email prefix"""
+        res = self.client.get(LIST_URL, {'is_active': 'false'})
+        self.assertEqual(
+            [row['email'] for row in res.data['results']],
+            ['user4@test.com']
+        )
+
+        res = self.client.get(LIST_URL, {'email': 'user1', 'is_staff': '0'})
+        self.assertEqual(
+            [row['email'] for row in res.data['results']],
+            ['user1@test.com']
+        )
+
+    def test_list_invalid_params(self):
+        """bad filters and cursors are rejected"""
+        res = self.client.get(LIST_URL, {'is_active': 'maybe'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(LIST_URL, {'cursor': 'garbage'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_requires_staff(self):
+        """normal users cannot list users"""
+        user = get_user_model().objects.get(email='user0@test.com')
+        self.client.force_authenticate(user=user)
+        res = self.client.get(LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,151 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+from core.cache import LocalTTLCache
+
+
+class SlidingWindowCounter:
+    """
+        Number of events per key over the last `window` seconds
+        Events are counted in fixed windows, the count of the previous
+        window being weighted by how much of it still overlaps the
+        sliding window: two cache entries per key, no list of
+        timestamps. Counters live in a shared django cache (shared_alias)
+        so every worker sees the same counts, or in a process-local
+        cache when none is configured.
+    """
+
+    def __init__(self, window, shared_alias=None, max_size=100000,
+                 timer=time.time):
+        self.window = window
+        self.shared_alias = shared_alias
+        self._timer = timer
+        self.local = LocalTTLCache(max_size=max_size, ttl=2 * window)
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def _windows(self, key):
+        """keys of the current and previous windows and the share of
+            the current window which has elapsed
+        """
+        index, elapsed = divmod(self._timer(), self.window)
+        index = int(index)
+        return (
+            '%s:%d' % (key, index), '%s:%d' % (key, index - 1),
+            elapsed / self.window
+        )
+
+    def count(self, key):
+        current_key, previous_key, elapsed = self._windows(key)
+        if self.shared is not None:
+            values = self.shared.get_many([current_key, previous_key])
+        else:
+            values = {
+                cache_key: self.local.get(cache_key)
+                for cache_key in (current_key, previous_key)
+            }
+        return (values.get(current_key) or 0) + (
+            values.get(previous_key) or 0) * (1 - elapsed)
+
+    def incr(self, key):
+        current_key = self._windows(key)[0]
+        shared = self.shared
+        if shared is not None:
+            # add() is a no-op when the key exists, incr() is atomic
+            shared.add(current_key, 0, 2 * self.window)
+            shared.incr(current_key)
+            return
+        with self._lock:
+            self.local.set(current_key, (self.local.get(current_key) or 0) + 1)
+
+    def retry_after(self):
+        """seconds until the current window ends"""
+        return self.window - self._timer() % self.window
+
+    def clear(self):
+        """clear the process-local counters (used by tests)"""
+        self.local.clear()
+
+
+class LoginFailureThrottle(BaseThrottle):
+    """
+        Throttle of the login endpoint by failed attempts
+        Failures are counted per client IP and per email (see
+        record_failure) in sliding windows; a client over either limit
+        gets 429 Too Many Requests before its credentials are even
+        validated, so a blocked attempt costs two cache reads instead of
+        a password hash.
+        The client IP is REMOTE_ADDR, unless NUM_PROXIES trusted proxies
+        are in front of the app: X-Forwarded-For is set by the client,
+        only the address appended by the outermost trusted proxy can be
+        relied on.
+    """
+    scope = 'login'
+
+    def __init__(self):
+        config = settings.LOGIN_THROTTLE
+        self.ip_limit = config['IP_LIMIT']
+        self.email_limit = config['EMAIL_LIMIT']
+        self.num_proxies = config['NUM_PROXIES']
+
+    @staticmethod
+    def email_key(email):
+        # the email is hashed to get short keys safe for memcached
+        digest = hashlib.sha1(str(email).strip().lower().encode())
+        return 'loginfail:email:' + digest.hexdigest()
+
+    def client_ip(self, request):
+        xff = request.META.get('HTTP_X_FORWARDED_FOR')
+        if self.num_proxies and xff:
+            addrs = [addr.strip() for addr in xff.split(',')]
+            return addrs[-min(self.num_proxies, len(addrs))]
+        return request.META.get('REMOTE_ADDR', '')
+
+    def ip_key(self, request):
+        # hashed as well, X-Forwarded-For may hold anything
+        digest = hashlib.sha1(self.client_ip(request).encode())
+        return 'loginfail:ip:' + digest.hexdigest()
+
+    def allow_request(self, request, view):
+        if self.ip_limit and login_failures.count(
+                self.ip_key(request)) >= self.ip_limit:
+            return self.throttled()
+        email = request.data.get('email') if hasattr(
+            request.data, 'get') else None
+        if self.email_limit and email and login_failures.count(
+                self.email_key(email)) >= self.email_limit:
+            return self.throttled()
+        return True
+
+    def throttled(self):
+        metrics.auth_failures.labels('throttled').inc()
+        return False
+
+    def wait(self):
+        return login_failures.retry_after()
+
+
+login_failures = SlidingWindowCounter(
+    window=settings.LOGIN_THROTTLE['WINDOW'],
+    shared_alias=settings.LOGIN_THROTTLE.get('SHARED_CACHE'),
+    max_size=settings.LOGIN_THROTTLE['MAX_SIZE'],
+)
+
+
+def record_failure(request, email):
+    """count a failed login of email from the request's client"""
+    if request is not None:
+        login_failures.incr(LoginFailureThrottle().ip_key(request))
+    if email:
+        login_failures.incr(LoginFailureThrottle.email_key(email))
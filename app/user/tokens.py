@@ -0,0 +1,120 @@
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections, router
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+
+def get_or_create_token(user, using=None):
+    """
+        return the auth token of a user, creating it if needed
+        - users authenticated by core.backends.HashingModelBackend come
+          with their token already joined in (select_related), so the
+          common case of an existing token costs no query at all
+        - a missing token is created with a single upsert, which also
+          settles concurrent logins of the same user without errors
+    """
+    try:
+        return user.auth_token
+    except Token.DoesNotExist:
+        return create_token(user, using)
+
+
+def create_token(user, using=None):
+    """
+        create the auth token of a user with one statement on PostgreSQL
+        returns the existing token if another request created it first
+    """
+    using = using or router.db_for_write(Token, instance=user)
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        token, created = Token.objects.using(using).get_or_create(user=user)
+        return token
+
+    # on conflict the no-op update makes RETURNING give us the token
+    # a concurrent login inserted in the meantime
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO authtoken_token (key, user_id, created) '
+            'VALUES (%s, %s, %s) '
+            'ON CONFLICT (user_id) DO UPDATE SET user_id = EXCLUDED.user_id '
+            'RETURNING key, created',
+            [Token().generate_key(), user.pk, timezone.now()]
+        )
+        key, created = cursor.fetchone()
+
+    token = Token(key=key, user=user, created=created)
+    token._state.adding = False
+    token._state.db = using
+    return token
+
+
+def expires_at(token):
+    """when an opaque token expires, None if tokens never expire
+        created is moved forward as the token is used (sliding expiry)
+    """
+    ttl = settings.TOKEN_EXPIRY['TTL']
+    if not ttl:
+        return None
+    return token.created + datetime.timedelta(seconds=ttl)
+
+
+def is_expired(token, now=None):
+    expiry = expires_at(token)
+    return expiry is not None and expiry <= (now or timezone.now())
+
+
+def refresh_token(token, now=None):
+    """
+        slide the expiry of a token which is in use
+        written at most once per REFRESH_INTERVAL, so an active token
+        costs one small UPDATE an hour rather than one per request
+        returns whether the token was written
+    """
+    now = now or timezone.now()
+    interval = settings.TOKEN_EXPIRY['REFRESH_INTERVAL']
+    if (now - token.created).total_seconds() < interval:
+        return False
+    Token.objects.filter(key=token.key).update(created=now)
+    token.created = now
+    return True
+
+
+def rotate_token(token):
+    """
+        replace the key of a token with one UPDATE and return the new
+        token; the caller drops the old key from the auth cache
+    """
+    key, created = Token().generate_key(), timezone.now()
+    Token.objects.filter(key=token.key).update(key=key, created=created)
+    rotated = Token(key=key, user_id=token.user_id, created=created)
+    rotated._state.adding = False
+    return rotated
+
+
+SIGNED_TOKEN_SALT = 'user.tokens.signed'
+
+
+def create_signed_token(user):
+    """
+        issue a stateless token: the user id and token_version, with a
+        timestamp and an HMAC signature made from SECRET_KEY
+        it expires after SIGNED_TOKEN['TTL'] seconds and is revoked by
+        bumping the user's token_version
+    """
+    return signing.dumps(
+        [user.pk, user.token_version], salt=SIGNED_TOKEN_SALT
+    )
+
+
+def load_signed_token(token):
+    """
+        return the (user id, token_version) of a signed token
+        raises signing.SignatureExpired or signing.BadSignature
+    """
+    user_id, version = signing.loads(
+        token, salt=SIGNED_TOKEN_SALT, max_age=settings.SIGNED_TOKEN['TTL']
+    )
+    return user_id, version
@@ -4,7 +4,13 @@ from user import views
 app_name = 'user'
 
 urlpatterns = [
+    path('', views.ListUserView.as_view(), name='list'),
     path('create/', views.CreateUserView.as_view(), name='create'),
+    path('bulk-create/', views.BulkCreateUserView.as_view(),
+         name='bulk-create'),
+    path('export/', views.ExportUserView.as_view(), name='export'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/rotate/', views.RotateTokenView.as_view(),
+         name='token-rotate'),
     path('me/', views.ManageUserView.as_view(), name='me'),
 ]
@@ -1,16 +1,137 @@
-from rest_framework import generics, authentication, permissions
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
+from rest_framework import exceptions, generics, permissions, status, views
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core import export, writebehind
+from core.db_routers import pin_credentials
+
+from user import tokens
+from user.authentication import TOKEN_AUTHENTICATION_CLASSES, \
+    CachedTokenAuthentication, SignedTokenAuthentication, token_cache
+from user.exceptions import PreconditionFailed
+from user.instrumentation import TimedRenderMixin
+from user.pagination import KeysetPagination
+from user.serializers import UserSerializer, AuthTokenSerializer, \
+    BulkUserSerializer, UserListSerializer
+from user.throttling import LoginFailureThrottle
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(TimedRenderMixin, generics.CreateAPIView):
     """Create a new user"""
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class ListUserView(TimedRenderMixin, generics.ListAPIView):
+    """List users with keyset pagination (staff only)
+        filters: ?is_active=, ?is_staff= (true/false), ?email= (prefix)
+        ordering: ?ordering=id (default) or ?ordering=name
+    """
+    serializer_class = UserListSerializer
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAdminUser,)
+    pagination_class = KeysetPagination
+    boolean_filters = ('is_active', 'is_staff')
+    boolean_values = {'true': True, '1': True, 'false': False, '0': False}
+
+    def get_queryset(self):
+        queryset = get_user_model().objects.all()
+        params = self.request.query_params
+
+        for field in self.boolean_filters:
+            if field in params:
+                try:
+                    value = self.boolean_values[params[field].lower()]
+                except KeyError:
+                    raise exceptions.ValidationError(
+                        {field: ['Must be true or false.']}
+                    )
+                queryset = queryset.filter(**{field: value})
+
+        # prefix match, served by the email varchar_pattern_ops index
+        if params.get('email'):
+            queryset = queryset.filter(email__startswith=params['email'])
+
+        return queryset
+
+
+class BulkCreateUserView(TimedRenderMixin, generics.GenericAPIView):
+    """Create many users in one request (staff only)
+        answers with one result per row of the payload, rows with
+        errors do not prevent the others from being created
+    """
+    serializer_class = BulkUserSerializer
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAdminUser,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save()
+
+        results = [
+            {'index': index, 'status': 'created', 'email': user.email}
+            for index, user in created
+        ]
+        results.extend(
+            {'index': index, 'status': 'error', 'errors': errors}
+            for index, errors in serializer.row_errors.items()
+        )
+        results.sort(key=lambda result: result['index'])
+
+        failed = len(serializer.row_errors)
+        return Response(
+            {'created': len(created), 'failed': failed, 'results': results},
+            status=status.HTTP_207_MULTI_STATUS if failed
+            else status.HTTP_201_CREATED
+        )
+
+
+class ExportUserView(views.APIView):
+    """Stream all users as csv or json lines (staff only)
+        ?output=csv|jsonl selects the format, ?gzip=1 compresses it
+    """
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
+    permission_classes = (permissions.IsAdminUser,)
+    content_types = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson',
+    }
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.query_params.get('output', 'csv')
+        if fmt not in export.FORMATS:
+            return Response(
+                {'output': ['Choose one of: %s.' % ', '.join(
+                    sorted(export.FORMATS))]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        filename = 'users.%s' % fmt
+        content_type = self.content_types[fmt]
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+
+        response = StreamingHttpResponse(
+            export.export_users(fmt=fmt, compress=compress),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="%s"' % filename
+        )
+        return response
+
+
+class CreateTokenView(TimedRenderMixin, ObtainAuthToken):
     """view for API validating user credentials and providing token
     """
     serializer_class = AuthTokenSerializer
@@ -18,12 +139,78 @@ class CreateTokenView(ObtainAuthToken):
     # works without this but does not create nice view in the browser
     # as it did when extended from generic views
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken hard codes form parsers, follow the settings too
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    # rejects clients with too many failed attempts before validation
+    throttle_classes = (LoginFailureThrottle,)
+
+    def post(self, request, *args, **kwargs):
+        """issue the token in as few queries as possible:
+            one SELECT of the user joined with its token, plus one
+            INSERT ... ON CONFLICT when the user has no token yet
+            a signed token (token_type=signed) needs no write at all
+        """
+        serializer = self.serializer_class(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        writebehind.record_token_login(user)
+        if serializer.validated_data['token_type'] == 'signed':
+            signed = tokens.create_signed_token(user)
+            pin_credentials('%s %s' % (
+                SignedTokenAuthentication.keyword, signed
+            ))
+            return Response({
+                'token': signed,
+                'token_type': 'signed',
+                'expires_in': settings.SIGNED_TOKEN['TTL'],
+            })
+        token = tokens.get_or_create_token(user)
+        if tokens.is_expired(token):
+            # never revive a key which may have leaked meanwhile
+            token = self.rotate(token)
+        else:
+            self.pin(token)
+        return Response({'token': token.key})
+
+    @staticmethod
+    def pin(token):
+        """read the client's next requests with this (maybe just
+            created) token from the primary
+        """
+        pin_credentials('%s %s' % (
+            CachedTokenAuthentication.keyword, token.key
+        ))
+
+    @classmethod
+    def rotate(cls, token):
+        rotated = tokens.rotate_token(token)
+        token_cache.invalidate_key(token.key)
+        cls.pin(rotated)
+        return rotated
+
+
+class RotateTokenView(TimedRenderMixin, views.APIView):
+    """view replacing the caller's opaque token by a new one
+        the old key stops working right away
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
 
+    def post(self, request, *args, **kwargs):
+        token = CreateTokenView.rotate(request.auth)
+        return Response({
+            'token': token.key,
+            'expires_at': tokens.expires_at(token),
+        })
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class ManageUserView(TimedRenderMixin,
+                     generics.RetrieveUpdateAPIView):
     """view for API retrieving and updating user info"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
@@ -31,4 +218,69 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
             this method is also required for update (patch)
             authentication class assigns user to request
         """
-        return self.request.user
+        return getattr(self, 'locked_user', None) or self.request.user
+
+    def get_etag(self, user):
+        """strong ETag of the user's representation: it changes with
+            updated_at and with the negotiated format (json, html)
+        """
+        value = '%s:%s:%s' % (
+            user.pk, user.updated_at.isoformat(),
+            self.request.accepted_renderer.media_type
+        )
+        return '"%s"' % hashlib.sha1(value.encode()).hexdigest()
+
+    def get_fresh_object(self):
+        """the user, reloaded when the one resolved by authentication
+            (cached for up to its TTL) is outdated: checking costs a
+            single read of updated_at by primary key
+        """
+        user = self.get_object()
+        updated_at = get_user_model()._default_manager.filter(
+            pk=user.pk).values_list('updated_at', flat=True).first()
+        if updated_at is None or updated_at == user.updated_at:
+            return user
+        return get_user_model()._default_manager.get(pk=user.pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        """answer If-None-Match with 304 Not Modified before any
+            serialization or rendering happens
+            The ETag of a conditional GET is computed from updated_at
+            read from the database, never from a cached user which
+            another worker may have changed; an unconditional GET is
+            answered from the cached user, its ETag matching the body.
+        """
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            user = self.get_fresh_object()
+        else:
+            user = self.get_object()
+        etag = self.get_etag(user)
+        if if_none_match and (
+                etag in parse_etags(if_none_match) or if_none_match == '*'):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag}
+            )
+        response = Response(self.get_serializer(user).data)
+        response['ETag'] = etag
+        return response
+
+    def update(self, request, *args, **kwargs):
+        """with If-Match, update only if the user did not change since
+            the client got that ETag (optimistic concurrency): the row
+            is locked and compared, 412 Precondition Failed otherwise
+        """
+        if_match = request.META.get('HTTP_IF_MATCH')
+        if not if_match:
+            response = super().update(request, *args, **kwargs)
+        else:
+            with transaction.atomic():
+                self.locked_user = get_user_model()._default_manager \
+                    .select_for_update().get(pk=request.user.pk)
+                if if_match != '*' and (
+                        self.get_etag(self.locked_user)
+                        not in parse_etags(if_match)):
+                    raise PreconditionFailed()
+                response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.get_etag(self.get_object())
+        return response